@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# Measures how long rendering blocks an asyncio event loop. A ticker task
+# records the longest gap between its ticks while the flags are written to a
+# socket, once with draw_wrapped_flag_list and once with render_flags.
+#
+#     python -m benchmarks.async_render [-s 4,16,32] [-w 200] [--chunk-size 16384] [flag ...]
+
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import Awaitable, Callable
+
+import socket
+import asyncio
+
+import term_flags
+
+from .common import parse_int_list
+
+async def measure(render: Callable[[asyncio.StreamWriter], Awaitable[None]]) -> tuple[bytes, float, float]:
+    local, remote = socket.socketpair()
+    _, writer = await asyncio.open_connection(sock=local)
+    reader, remote_writer = await asyncio.open_connection(sock=remote)
+
+    running = True
+    max_gap = 0.0
+
+    async def tick() -> None:
+        nonlocal max_gap
+        last = perf_counter()
+        while running:
+            await asyncio.sleep(0.001)
+            now = perf_counter()
+            max_gap = max(max_gap, now - last)
+            last = now
+
+    async def receive() -> bytes:
+        chunks: list[bytes] = []
+        while chunk := await reader.read(64 * 1024):
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    ticker = asyncio.create_task(tick())
+    received = asyncio.create_task(receive())
+    await asyncio.sleep(0.01)
+
+    start = perf_counter()
+    await render(writer)
+    elapsed = perf_counter() - start
+
+    writer.close()
+    await writer.wait_closed()
+    data = await received
+    running = False
+    await ticker
+    remote_writer.close()
+
+    return data, elapsed, max_gap
+
+async def run() -> None:
+    ap = ArgumentParser()
+    ap.add_argument('-s', '--scales', type=parse_int_list, default=[4, 16, 32])
+    ap.add_argument('-w', '--width', type=int, default=200)
+    ap.add_argument('--chunk-size', type=int, default=term_flags.ASYNC_CHUNK_SIZE)
+    ap.add_argument('flags', nargs='*', default=['all'])
+
+    args = ap.parse_args()
+    flags = term_flags.resolve_flags(args.flags)
+    width: int = args.width
+
+    print(f'{"scale":>5} {"bytes":>10} | {"sync ms":>8} {"max stall":>9} | {"async ms":>8} {"max stall":>9}')
+    for scale in args.scales:
+        async def render_sync(writer: asyncio.StreamWriter) -> None:
+            buf: list[str] = []
+            term_flags.draw_wrapped_flag_list(buf, flags, scale, width=width)
+            writer.write(''.join(buf).encode())
+            await writer.drain()
+
+        async def render_async(writer: asyncio.StreamWriter) -> None:
+            await term_flags.render_flags(writer, flags, scale, width=width, chunk_size=args.chunk_size)
+
+        sync_data, sync_time, sync_gap = await measure(render_sync)
+        async_data, async_time, async_gap = await measure(render_async)
+
+        if sync_data != async_data:
+            raise SystemExit(f'scale {scale}: output differs')
+
+        print(
+            f'{scale:5} {len(sync_data):10} | '
+            f'{sync_time * 1000:8.1f} {sync_gap * 1000:7.1f}ms | '
+            f'{async_time * 1000:8.1f} {async_gap * 1000:7.1f}ms')
+
+def main() -> None:
+    asyncio.run(run())
+
+if __name__ == '__main__':
+    main()
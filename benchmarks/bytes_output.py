@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# Compares producing the UTF-8 output of draw_wrapped_flag_list by joining
+# all fragments into one str and encoding it (what printing the output used
+# to do) with collecting it in a BytesSink, which encodes the fragments a few
+# hundred at a time into a bytearray that is reused for every render. Reports
+# the throughput in MB of output per second and the peak memory of one render.
+#
+#     python -m benchmarks.bytes_output [-s 1,4,16] [-w 200] [--compiled] [flag ...]
+
+from argparse import ArgumentParser
+from typing import Union
+
+import term_flags
+
+from .common import parse_int_list, time_ops, peak_memory
+
+def main() -> None:
+    ap = ArgumentParser()
+    ap.add_argument('-s', '--scales', type=parse_int_list, default=[1, 4, 16])
+    ap.add_argument('-w', '--width', type=int, default=200)
+    ap.add_argument('--compiled', action='store_true', default=False, help="Compile the flags up front, so only emitting the output is measured.")
+    ap.add_argument('flags', nargs='*', default=['all'])
+
+    args = ap.parse_args()
+    source_flags = term_flags.resolve_flags(args.flags)
+    width: int = args.width
+
+    print(f'{"scale":>5} {"bytes":>10} | {"str MB/s":>8} {"peak KiB":>9} | {"bytes MB/s":>10} {"peak KiB":>9} | {"memory":>7}')
+    for scale in args.scales:
+        flags: list[Union[term_flags.FlagView, term_flags.CompiledFlag]]
+        if args.compiled:
+            flags = [term_flags.compile_flag(term_flags.ScaledFlag(flag, scale) if scale != 1 else flag) for flag in source_flags]
+            draw_scale = 1
+        else:
+            flags = list(source_flags)
+            draw_scale = scale
+
+        def render_str() -> bytes:
+            buf: list[str] = []
+            term_flags.draw_wrapped_flag_list(buf, flags, draw_scale, width=width)
+            return ''.join(buf).encode()
+
+        sink = term_flags.BytesSink()
+
+        def render_bytes() -> bytearray:
+            sink.clear()
+            term_flags.draw_wrapped_flag_list(sink, flags, draw_scale, width=width)
+            return sink.data
+
+        expected = render_str()
+        if render_bytes() != expected:
+            raise SystemExit(f'scale {scale}: output differs')
+
+        size = len(expected)
+        str_rate = time_ops(render_str) * size / 1e6
+        bytes_rate = time_ops(render_bytes) * size / 1e6
+        str_peak = peak_memory(render_str)
+        sink.clear()
+        bytes_peak = peak_memory(render_bytes)
+
+        print(
+            f'{scale:5} {size:10} | '
+            f'{str_rate:8.1f} {str_peak / 1024:9.0f} | '
+            f'{bytes_rate:10.1f} {bytes_peak / 1024:9.0f} | '
+            f'{bytes_peak / str_peak * 100:6.1f}%')
+
+if __name__ == '__main__':
+    main()
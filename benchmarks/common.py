@@ -0,0 +1,33 @@
+from time import perf_counter
+from typing import Callable, Any
+
+import tracemalloc
+
+def parse_int_list(value: str) -> list[int]:
+    return [int(item, 10) for item in value.split(',') if item]
+
+# Best operations per second of `repeat` rounds that each call func for at
+# least min_time seconds.
+def time_ops(func: Callable[[], Any], min_time: float = 0.05, repeat: int = 3) -> float:
+    best = 0.0
+    for _ in range(repeat):
+        loops = 0
+        start = perf_counter()
+        elapsed = 0.0
+        while True:
+            func()
+            loops += 1
+            elapsed = perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = max(best, loops / elapsed)
+    return best
+
+# Peak of the memory traced while calling func once.
+def peak_memory(func: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# Compares two JSON reports written by benchmarks.render.
+#
+#     python -m benchmarks.compare base.json new.json [--threshold 5]
+
+from argparse import ArgumentParser
+from typing import Any
+
+import json
+import math
+
+Key = tuple[str, str, int, Any]
+
+def load_results(path: str) -> dict[Key, dict[str, Any]]:
+    with open(path) as fp:
+        report = json.load(fp)
+
+    return {
+        (result['benchmark'], result['flag'], result['scale'], result['width']): result
+        for result in report['results']
+    }
+
+def percent(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+def main() -> None:
+    ap = ArgumentParser()
+    ap.add_argument('-t', '--threshold', type=float, default=5.0, help="Only list changes of the speed of at least this many percent. Default: 5")
+    ap.add_argument('base')
+    ap.add_argument('new')
+
+    args = ap.parse_args()
+
+    base = load_results(args.base)
+    new = load_results(args.new)
+    threshold: float = args.threshold
+
+    ratios: list[float] = []
+    print(f'{"benchmark":<22} {"flag":<16} {"scale":>5} {"width":>5} | {"speed":>8} {"bytes":>8} {"memory":>8}')
+    for key in sorted(base.keys() & new.keys(), key=lambda key: (key[0], key[1], key[2], key[3] or 0)):
+        old_result = base[key]
+        new_result = new[key]
+        ratio = new_result['ops_per_sec'] / old_result['ops_per_sec']
+        ratios.append(ratio)
+
+        speed = (ratio - 1) * 100
+        output = percent(old_result['bytes'], new_result['bytes'])
+        memory = percent(old_result['peak_memory'], new_result['peak_memory'])
+
+        if abs(speed) >= threshold or output or abs(memory) >= threshold:
+            benchmark, flag, scale, width = key
+            print(f'{benchmark:<22} {flag:<16} {scale:5} {width or "":>5} | {speed:+7.1f}% {output:+7.1f}% {memory:+7.1f}%')
+
+    for key in sorted(base.keys() - new.keys(), key=str):
+        print(f'missing in {args.new}: {key}')
+
+    for key in sorted(new.keys() - base.keys(), key=str):
+        print(f'missing in {args.base}: {key}')
+
+    if ratios:
+        mean = math.exp(sum(math.log(ratio) for ratio in ratios) / len(ratios))
+        print(f'geometric mean speed change over {len(ratios)} benchmarks: {(mean - 1) * 100:+.1f}%')
+
+if __name__ == '__main__':
+    main()
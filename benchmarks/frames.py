@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+# Compares the bytes per frame of a rotating display, where every frame swaps
+# one of the shown flags for the next one, when every frame is drawn in full
+# and when only the cells that changed are written with a ScreenBuffer. Both
+# outputs are played back on a small terminal model to check that they lead
+# to the same screen.
+#
+#     python -m benchmarks.frames [-s 1,2] [-w 80,160] [-n 40] [--slots 8] [flag ...]
+
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import Any, Optional
+
+import re
+
+import term_flags
+from term_flags import Color
+
+from .common import parse_int_list
+
+CONTROL = re.compile(r'\x1B\[([0-9;]*)([A-Za-z])|(\n)|(\r)|(.)', re.S)
+SWAPPED_GLYPHS = str.maketrans('▄▐▟▜▙▛', '▀▌▘▖▝▗')
+
+# Just enough of a terminal to play back what term_flags writes. Cells are
+# stored in the same normalized form as in a ScreenBuffer, with swappable
+# glyphs turned the same way.
+class Terminal:
+    def __init__(self, width: int, height: int) -> None:
+        self.width  = width
+        self.height = height
+        self.cells: dict[tuple[int, int], tuple[str, Any, Any]] = {}
+        self.row = 0
+        self.column = 0
+        self.fg: Optional[Color] = None
+        self.bg: Optional[Color] = None
+
+    def write(self, data: str) -> None:
+        for match in CONTROL.finditer(data):
+            params, command, newline, carriage_return, glyph = match.groups()
+            if command:
+                self.control(command, [int(param) if param else 0 for param in params.split(';')] if params else [])
+            elif newline:
+                self.row += 1
+                self.column = 0
+            elif carriage_return:
+                self.column = 0
+            else:
+                if self.column < self.width:
+                    self.put(glyph)
+                self.column += 1
+
+    def put(self, glyph: str) -> None:
+        fg, bg = self.fg, self.bg
+        if glyph == '█':
+            glyph, fg, bg = ' ', None, fg
+        elif glyph in '▄▐▟▜▙▛':
+            glyph, fg, bg = glyph.translate(SWAPPED_GLYPHS), bg, fg
+        if glyph == ' ':
+            fg = None
+
+        key = (self.row, self.column)
+        if glyph == ' ' and bg is None:
+            self.cells.pop(key, None)
+        else:
+            self.cells[key] = (glyph, fg, bg)
+
+    def control(self, command: str, params: list[int]) -> None:
+        count = (params[0] if params else 0) or 1
+        if command == 'A':
+            self.row = max(self.row - count, 0)
+        elif command == 'B':
+            self.row += count
+        elif command == 'C':
+            self.column += count
+        elif command == 'D':
+            self.column = max(min(self.column, self.width - 1) - count, 0)
+        elif command == 'G':
+            self.column = count - 1
+        elif command == 'H':
+            self.row = count - 1
+            self.column = ((params[1] if len(params) > 1 else 0) or 1) - 1
+        elif command == 'J':
+            self.cells.clear()
+        elif command == 'm':
+            self.sgr(params or [0])
+        else:
+            raise ValueError(f'unexpected control sequence: {command}')
+
+    def sgr(self, params: list[int]) -> None:
+        index = 0
+        while index < len(params):
+            param = params[index]
+            if param == 0:
+                self.fg = self.bg = None
+            elif param == 38:
+                self.fg = tuple(params[index + 2:index + 5]) # type: ignore
+                index += 4
+            elif param == 48:
+                self.bg = tuple(params[index + 2:index + 5]) # type: ignore
+                index += 4
+            elif param == 39:
+                self.fg = None
+            elif param == 49:
+                self.bg = None
+            else:
+                raise ValueError(f'unexpected SGR parameter: {param}')
+            index += 1
+
+def frames(flags: list[term_flags.Flag], slots: int, count: int) -> list[list[term_flags.Flag]]:
+    shown = flags[:slots]
+    result = [list(shown)]
+    for index in range(1, count):
+        shown[index % len(shown)] = flags[(len(shown) + index) % len(flags)]
+        result.append(list(shown))
+    return result
+
+def main() -> None:
+    ap = ArgumentParser()
+    ap.add_argument('-s', '--scales', type=parse_int_list, default=[1, 2])
+    ap.add_argument('-w', '--widths', type=parse_int_list, default=[80, 160])
+    ap.add_argument('-n', '--frames', type=int, default=40)
+    ap.add_argument('--slots', type=int, default=8, help="Number of flags shown at once. Default: 8")
+    ap.add_argument('--height', type=int, default=200, help="Height of the screen. Default: 200")
+    ap.add_argument('flags', nargs='*', default=['all'])
+
+    args = ap.parse_args()
+    flags = term_flags.resolve_flags(args.flags)
+    height: int = args.height
+
+    print(f'{"scale":>5} {"width":>5} | {"full B/frame":>12} {"ms":>7} | {"diff B/frame":>12} {"ms":>7} | {"saved":>7}')
+    for scale in args.scales:
+        for width in args.widths:
+            layouts = term_flags.LayoutCache()
+            screen = term_flags.ScreenBuffer(width, height, layouts=layouts)
+            full_terminal = Terminal(width, height)
+            diff_terminal = Terminal(width, height)
+            full_bytes = diff_bytes = 0
+            full_time = diff_time = 0.0
+
+            for index, shown in enumerate(frames(flags, args.slots, args.frames)):
+                compiled = [layouts.compile(flag, scale, scale) for flag in shown]
+
+                start = perf_counter()
+                buf: list[str] = ['\x1B[H\x1B[2J']
+                term_flags.draw_wrapped_flag_list(buf, compiled, width=width, emitter=term_flags.Emitter(optimize=True))
+                full = ''.join(buf)
+                full_time += perf_counter() - start
+
+                start = perf_counter()
+                buf = []
+                screen.clear()
+                screen.put_wrapped_flag_list(compiled)
+                screen.present(buf)
+                diff = ''.join(buf)
+                diff_time += perf_counter() - start
+
+                full_bytes += len(full.encode())
+                diff_bytes += len(diff.encode())
+
+                full_terminal.write(full)
+                diff_terminal.write(diff)
+                if full_terminal.cells != diff_terminal.cells:
+                    raise SystemExit(f'scale {scale}, width {width}, frame {index}: screens differ')
+
+            frame_count = args.frames
+            saved = (full_bytes - diff_bytes) / full_bytes * 100 if full_bytes else 0.0
+            print(
+                f'{scale:5} {width:5} | '
+                f'{full_bytes // frame_count:12} {full_time / frame_count * 1000:7.2f} | '
+                f'{diff_bytes // frame_count:12} {diff_time / frame_count * 1000:7.2f} | '
+                f'{saved:6.1f}%')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# Compares the wrap modes of draw_wrapped_flag_list: the terminal lines, rows
+# and bytes the flags take up and the time it takes to lay them out, and how
+# long finding the flag sizes takes when they are measured again on every call
+# (like before the metrics cache) and when they come from FLAG_METRICS.
+#
+#     python -m benchmarks.layout [-s 1,2,3] [-w 80,120,160,200,240] [flag ...]
+
+from argparse import ArgumentParser
+from time import perf_counter
+
+import term_flags
+from term_flags import WrapMode
+
+from .common import parse_int_list, time_ops
+
+def render(flags: list[term_flags.Flag], scale: int, width: int, wrap: WrapMode) -> str:
+    buf: list[str] = []
+    term_flags.draw_wrapped_flag_list(buf, flags, scale, width=width, wrap=wrap)
+    return ''.join(buf)
+
+def main() -> None:
+    ap = ArgumentParser()
+    ap.add_argument('-s', '--scales', type=parse_int_list, default=[1, 2, 3])
+    ap.add_argument('-w', '--widths', type=parse_int_list, default=[80, 120, 160, 200, 240])
+    ap.add_argument('flags', nargs='*', default=['all'])
+
+    args = ap.parse_args()
+    flags = term_flags.resolve_flags(args.flags)
+    modes = list(WrapMode)
+
+    print(f'{"scale":>5} | {"measure ms":>10} {"cached ms":>9}')
+    for scale in args.scales:
+        def measure() -> None:
+            for flag in flags:
+                term_flags.get_flag_width(term_flags.ScaledFlag(flag, scale))
+
+        def cached() -> None:
+            for flag in flags:
+                term_flags.FLAG_METRICS.get(flag, scale)
+
+        print(f'{scale:5} | {1000 / time_ops(measure):10.3f} {1000 / time_ops(cached):9.4f}')
+    print()
+
+    print(f'{"scale":>5} {"width":>5} | ' + ' | '.join(f'{mode.value + " lines":>14} {"rows":>4} {"bytes":>7} {"ms":>6}' for mode in modes))
+    for scale in args.scales:
+        metrics = [term_flags.FLAG_METRICS.get(flag, scale) for flag in flags]
+        widths  = [item.width for item in metrics]
+        heights = [item.height for item in metrics]
+
+        for width in args.widths:
+            columns = [f'{scale:5} {width:5}']
+            for mode in modes:
+                start = perf_counter()
+                layout = term_flags.layout_flags(widths, heights, width, mode)
+                elapsed = perf_counter() - start
+
+                text = render(flags, scale, width, mode)
+                lines = text.count('\n') + 1
+                if lines != layout.height:
+                    raise SystemExit(f'scale {scale}, width {width}, {mode.value}: drew {lines} lines, expected {layout.height}')
+
+                columns.append(f'{layout.height:14} {len(layout.rows):4} {len(text.encode()):7} {elapsed * 1000:6.3f}')
+            print(' | '.join(columns))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+# Times load_flag_from_json on generated multi-megabyte flag documents against
+# the previous implementation, which validated every value with a chain of
+# isinstance checks (with its missing line.append fixed, so the results match).
+# With --cache it also times load_flag_from_path with a warm binary cache.
+#
+#     python -m benchmarks.loader [-m 1,4,16] [--colors 64] [--seed 0] [--cache]
+
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import Any, Callable
+
+import os
+import json
+import random
+import tempfile
+
+import term_flags
+from term_flags import Flag, LineCap, LineCapMap, LineSegment
+
+from .common import parse_int_list
+
+CAP_NAMES = list(LineCapMap)
+
+def generate_flag(size: int, colors: int, width: int, rng: random.Random) -> str:
+    palette = [[rng.randrange(256) for _ in range(3)] for _ in range(colors)]
+    caps: list[Any] = CAP_NAMES + [cap.value for cap in LineCap]
+    lines: list[str] = []
+    total = 0
+    while total < size:
+        segments = [
+            [rng.choice(palette), rng.randrange(1, 32), rng.choice(caps)]
+            for _ in range(width)
+        ]
+        line = json.dumps(segments)
+        lines.append(line)
+        total += len(line) + 1
+    return '{"flag": [' + ','.join(lines) + ']}'
+
+def reference_load_flag_from_json(data: Any) -> Flag:
+    if not isinstance(data, dict):
+        raise TypeError(f'expected mapping at root: {type(data).__name__}')
+
+    flag_data = data.get('flag')
+    if not isinstance(flag_data, list):
+        raise TypeError(f'expected sequence at .flag: {type(flag_data).__name__}')
+
+    flag: Flag = []
+    for line_index, line_data in enumerate(flag_data):
+        if not isinstance(line_data, list):
+            raise TypeError(f'expected sequence at .flag[{line_index}]: {type(line_data).__name__}')
+
+        line: list[LineSegment] = []
+        for segment_index, segment_data in enumerate(line_data):
+            if isinstance(segment_data, (tuple, list)):
+                if len(segment_data) != 3:
+                    raise ValueError(f'expected sequence of length 3 at .flag[{line_index}][{segment_index}]: {len(segment_data)}')
+
+                color_data, length, cap_data = segment_data
+
+                if not isinstance(color_data, (tuple, list)):
+                    raise TypeError(f'expected sequence at .flag[{line_index}][{segment_index}]: {type(color_data).__name__}')
+
+                if len(color_data) != 3:
+                    raise ValueError(f'expected sequence of length 3 at .flag[{line_index}][{segment_index}][0]: {len(color_data)}')
+
+                for color_index, val in enumerate(color_data):
+                    if isinstance(val, float):
+                        if float(int(val)) != val:
+                            raise TypeError(f'expected integer at .flag[{line_index}][{segment_index}][0][{color_index}]: {val}')
+                    elif not isinstance(val, int):
+                        raise TypeError(f'expected integer at .flag[{line_index}][{segment_index}][0][{color_index}]: {val}')
+
+                    if val < 0 or val > 255:
+                        raise TypeError(f'value out of range at .flag[{line_index}][{segment_index}][0][{color_index}]: {val}')
+
+                red, green, blue = map(int, color_data)
+                color = (red, green, blue)
+
+                if isinstance(length, float):
+                    ilength = int(length)
+                    if float(ilength) != length:
+                        raise TypeError(f'expected integer at .flag[{line_index}][{segment_index}][1]: {length}')
+                    length = ilength
+                elif not isinstance(length, int):
+                    raise TypeError(f'expected integer at .flag[{line_index}][{segment_index}][1]: {length}')
+
+                if length < 0:
+                    raise TypeError(f'value out of range at .flag[{line_index}][{segment_index}][1]: {length}')
+
+                if isinstance(cap_data, float):
+                    icap = int(cap_data)
+                    if float(icap) != cap_data:
+                        raise TypeError(f'expected integer at .flag[{line_index}][{segment_index}][2]: {cap_data}')
+                    try:
+                        cap = LineCap(icap)
+                    except ValueError as exc:
+                        raise ValueError(f'value out of range at .flag[{line_index}][{segment_index}][2]: {cap_data}') from exc
+                elif isinstance(cap_data, int):
+                    try:
+                        cap = LineCap(cap_data)
+                    except ValueError as exc:
+                        raise ValueError(f'value out of range at .flag[{line_index}][{segment_index}][2]: {cap_data}') from exc
+                elif isinstance(cap_data, str):
+                    lower_cap = cap_data.lower()
+                    try:
+                        cap = LineCapMap[lower_cap]
+                    except KeyError as exc:
+                        raise ValueError(f'illegal value of range at .flag[{line_index}][{segment_index}][2]: {cap_data}') from exc
+                else:
+                    raise TypeError(f'expected integer or string at .flag[{line_index}][{segment_index}][2]: {cap_data}')
+
+                line.append(LineSegment(color, length, cap))
+            elif isinstance(segment_data, LineSegment):
+                line.append(segment_data)
+            else:
+                raise TypeError(f'expected sequence or LineSegment at .flag[{line_index}][{segment_index}]: {type(segment_data).__name__}')
+
+        flag.append(line)
+
+    return flag
+
+def best_time(func: Callable[[], Any], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        best = min(best, perf_counter() - start)
+    return best
+
+def main() -> None:
+    ap = ArgumentParser()
+    ap.add_argument('-m', '--megabytes', type=parse_int_list, default=[1, 4, 16], help="Sizes of the generated documents. Default: 1,4,16")
+    ap.add_argument('--colors', type=int, default=64, help="Number of distinct colors in a document. Default: 64")
+    ap.add_argument('--width', type=int, default=64, help="Segments per line. Default: 64")
+    ap.add_argument('-r', '--repeat', type=int, default=3)
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--cache', action='store_true', default=False, help="Also compare loading from the path with and without a warm cache.")
+
+    args = ap.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f'{"MB":>4} {"lines":>7} {"segments":>9} | {"json.loads":>10} | {"reference":>10} {"MB/s":>7} | {"loader":>10} {"MB/s":>7} | {"speedup":>7}')
+    for megabytes in args.megabytes:
+        text = generate_flag(megabytes * 1024 * 1024, args.colors, args.width, rng)
+        data = json.loads(text)
+
+        flag = term_flags.load_flag_from_json(data)
+        if flag != reference_load_flag_from_json(data):
+            raise SystemExit(f'{megabytes} MB: loaders disagree')
+
+        parse_time = best_time(lambda: json.loads(text), args.repeat)
+        reference_time = best_time(lambda: reference_load_flag_from_json(data), args.repeat)
+        loader_time = best_time(lambda: term_flags.load_flag_from_json(data), args.repeat)
+
+        size = len(text) / (1024 * 1024)
+        print(
+            f'{megabytes:4} {len(flag):7} {sum(len(line) for line in flag):9} | '
+            f'{parse_time * 1000:8.1f}ms | '
+            f'{reference_time * 1000:8.1f}ms {size / reference_time:7.1f} | '
+            f'{loader_time * 1000:8.1f}ms {size / loader_time:7.1f} | '
+            f'{reference_time / loader_time:6.2f}x')
+
+        if args.cache:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, 'flag.json')
+                cache_dir = os.path.join(tmp_dir, 'cache')
+                with open(path, 'w') as fp:
+                    fp.write(text)
+
+                if term_flags.load_flag_from_path(path, cache_dir) != flag or term_flags.load_flag_from_path(path, cache_dir) != flag:
+                    raise SystemExit(f'{megabytes} MB: cached flag differs')
+
+                uncached_time = best_time(lambda: term_flags.load_flag_from_path(path), args.repeat)
+                cached_time = best_time(lambda: term_flags.load_flag_from_path(path, cache_dir), args.repeat)
+
+            print(f'{"":>4} load_flag_from_path: {uncached_time * 1000:8.1f}ms uncached, {cached_time * 1000:8.1f}ms warm cache, {uncached_time / cached_time:6.2f}x')
+
+if __name__ == '__main__':
+    main()
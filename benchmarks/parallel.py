@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+# Times draw_wrapped_flag_list with scaling and rendering spread over a
+# process pool against doing it all in this process. The pool is used no
+# matter the size of the output here, compare the number of characters with
+# term_flags.PARALLEL_THRESHOLD to see where it starts to pay off.
+#
+#     python -m benchmarks.parallel [-s 1,4,16,32] [-j 2,4] [-O] [--row-major] [flag ...]
+
+from argparse import ArgumentParser
+from time import perf_counter
+
+import os
+
+import term_flags
+
+from .common import parse_int_list
+
+def render(flags: list[term_flags.Flag], scale: int, width: int, row_major: bool, optimize: bool, jobs: int, repeat: int) -> tuple[str, float]:
+    best = float('inf')
+    text = ''
+    for _ in range(repeat):
+        buf: list[str] = []
+        start = perf_counter()
+        term_flags.draw_wrapped_flag_list(buf, flags, scale, row_major=row_major, width=width,
+                                          emitter=term_flags.Emitter(optimize=optimize), jobs=jobs)
+        text = ''.join(buf)
+        best = min(best, perf_counter() - start)
+    return text, best
+
+def main() -> None:
+    cpus = os.cpu_count() or 1
+
+    ap = ArgumentParser()
+    ap.add_argument('-s', '--scales', type=parse_int_list, default=[1, 4, 16, 32])
+    ap.add_argument('-j', '--jobs', type=parse_int_list, default=sorted({2, cpus} - {1}) or [2])
+    ap.add_argument('-w', '--width', type=int, default=200)
+    ap.add_argument('-r', '--repeat', type=int, default=3)
+    ap.add_argument('-O', '--optimize', action='store_true', default=False)
+    ap.add_argument('--row-major', action='store_true', default=False)
+    ap.add_argument('flags', nargs='*', default=['all'])
+
+    args = ap.parse_args()
+    flags = term_flags.resolve_flags(args.flags)
+
+    print(f'{cpus} CPUs, threshold {term_flags.PARALLEL_THRESHOLD:,} characters')
+    term_flags.PARALLEL_THRESHOLD = 0
+
+    print(f'{"scale":>5} {"chars":>10} | {"serial ms":>9} | ' + ' | '.join(f'{f"{jobs} jobs ms":>10} {"speedup":>7}' for jobs in args.jobs))
+    for scale in args.scales:
+        serial_text, serial_time = render(flags, scale, args.width, args.row_major, args.optimize, 1, args.repeat)
+        columns = [f'{scale:5} {term_flags.count_cells(flags, scale):10} | {serial_time * 1000:9.1f}']
+
+        for jobs in args.jobs:
+            text, time = render(flags, scale, args.width, args.row_major, args.optimize, jobs, args.repeat)
+            if text != serial_text:
+                raise SystemExit(f'scale {scale}, {jobs} jobs: output differs')
+            columns.append(f'{time * 1000:10.1f} {serial_time / time:6.2f}x')
+
+        print(' | '.join(columns))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+# Times the rendering pipeline (scale_flag, draw_flag, draw_flag_list and
+# draw_wrapped_flag_list) over all built-in flags and writes a JSON report
+# that can be compared between commits with benchmarks.compare.
+#
+#     python -m benchmarks.render [-s 1,2,4,8,16,32] [-w 80,120,200] [-o report.json]
+
+from argparse import ArgumentParser
+from typing import Any, Callable, Optional
+
+import sys
+import json
+import platform
+import subprocess
+
+import term_flags
+
+from .common import parse_int_list, time_ops, peak_memory
+
+def builtin_flags() -> list[tuple[str, term_flags.Flag]]:
+    flags: list[tuple[str, term_flags.Flag]] = []
+    seen: set[int] = set()
+    for flags_dict in (term_flags.FLAGS, term_flags.FLAG_ALIASES):
+        for name, flag in flags_dict.items():
+            # aliases of the same flag are only measured once
+            if id(flag) not in seen:
+                seen.add(id(flag))
+                flags.append((name, flag))
+    return flags
+
+def git_revision() -> Optional[str]:
+    try:
+        proc = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return proc.stdout.strip()
+
+def measure(results: list[dict[str, Any]], benchmark: str, flag: str, scale: int, width: Optional[int],
+            func: Callable[[], Any], output: Callable[[], int], min_time: float, repeat: int) -> None:
+    result = {
+        'benchmark':   benchmark,
+        'flag':        flag,
+        'scale':       scale,
+        'width':       width,
+        'ops_per_sec': time_ops(func, min_time, repeat),
+        'bytes':       output(),
+        'peak_memory': peak_memory(func),
+    }
+    results.append(result)
+    print(f'{benchmark:<22} {flag:<16} {scale:3} {width or "":>4} {result["ops_per_sec"]:12.1f} ops/s {result["bytes"]:10} B {result["peak_memory"]:10} B peak', file=sys.stderr)
+
+def rendered_bytes(draw: Callable[[list[str]], None]) -> int:
+    buf: list[str] = []
+    draw(buf)
+    return len(''.join(buf).encode())
+
+def main() -> None:
+    ap = ArgumentParser()
+    ap.add_argument('-s', '--scales', type=parse_int_list, default=[1, 2, 4, 8, 16, 32])
+    ap.add_argument('-w', '--widths', type=parse_int_list, default=[80, 120, 200])
+    ap.add_argument('-t', '--min-time', type=float, default=0.05, help="Minimum time per timing round in seconds. Default: 0.05")
+    ap.add_argument('-r', '--repeat', type=int, default=3, help="Number of timing rounds, the best one is reported. Default: 3")
+    ap.add_argument('-q', '--quick', action='store_true', default=False, help="Only scales 1 and 4, width 80 and shorter rounds.")
+    ap.add_argument('-o', '--output', default='-', help="Path of the JSON report. Default: stdout")
+    ap.add_argument('flags', nargs='*', help="Limit the per-flag benchmarks to these flags. Default: all built-in flags and aliases")
+
+    args = ap.parse_args()
+
+    scales: list[int] = args.scales
+    widths: list[int] = args.widths
+    min_time: float = args.min_time
+    repeat: int = args.repeat
+    if args.quick:
+        scales = [1, 4]
+        widths = [80]
+        min_time = 0.01
+
+    flags = builtin_flags()
+    if args.flags:
+        flags = [(name, term_flags.get_flag(name)) for name in args.flags]
+
+    all_flags = [flag for _, flag in flags]
+    results: list[dict[str, Any]] = []
+
+    for scale in scales:
+        for name, flag in flags:
+            scaled = term_flags.scale_flag(flag, scale)
+
+            measure(results, 'scale_flag', name, scale, None,
+                lambda: term_flags.scale_flag(flag, scale),
+                lambda: sum(len(line) for line in scaled),
+                min_time, repeat)
+
+            measure(results, 'draw_flag', name, scale, None,
+                lambda: term_flags.draw_flag([], scaled),
+                lambda: rendered_bytes(lambda buf: term_flags.draw_flag(buf, scaled)),
+                min_time, repeat)
+
+        measure(results, 'draw_flag_list', '*', scale, None,
+            lambda: term_flags.draw_flag_list([], all_flags, 0, scale),
+            lambda: rendered_bytes(lambda buf: term_flags.draw_flag_list(buf, all_flags, 0, scale)),
+            min_time, repeat)
+
+        for width in widths:
+            measure(results, 'draw_wrapped_flag_list', '*', scale, width,
+                lambda: term_flags.draw_wrapped_flag_list([], all_flags, scale, width=width),
+                lambda: rendered_bytes(lambda buf: term_flags.draw_wrapped_flag_list(buf, all_flags, scale, width=width)),
+                min_time, repeat)
+
+    report = {
+        'meta': {
+            'revision':       git_revision(),
+            'python':         platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform':       platform.platform(),
+            'min_time':       min_time,
+            'repeat':         repeat,
+        },
+        'results': results,
+    }
+
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+            fp.write('\n')
+
+if __name__ == '__main__':
+    main()
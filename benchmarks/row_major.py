@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# Compares the bytes written (and time taken) by the default column-wise flag
+# list renderer against the row-major one.
+#
+#     python -m benchmarks.row_major [-s 1,2,4] [-w 80,160] [flag ...]
+
+from argparse import ArgumentParser
+from time import perf_counter
+
+import re
+
+import term_flags
+
+from .common import parse_int_list
+
+CURSOR_MOVE = re.compile(r'\x1B\[[0-9]*[ABCDG]')
+SGR = re.compile(r'\x1B\[[0-9;]*m')
+
+def render(flags: list[term_flags.Flag], scale: int, width: int, row_major: bool, repeat: int) -> tuple[str, float]:
+    best = float('inf')
+    text = ''
+    for _ in range(repeat):
+        buf: list[str] = []
+        start = perf_counter()
+        term_flags.draw_wrapped_flag_list(buf, flags, scale, row_major=row_major, width=width)
+        text = ''.join(buf)
+        best = min(best, perf_counter() - start)
+    return text, best
+
+def main() -> None:
+    ap = ArgumentParser()
+    ap.add_argument('-s', '--scales', type=parse_int_list, default=[1, 2, 4])
+    ap.add_argument('-w', '--widths', type=parse_int_list, default=[80, 160, 240])
+    ap.add_argument('-r', '--repeat', type=int, default=5)
+    ap.add_argument('flags', nargs='*', default=['all'])
+
+    args = ap.parse_args()
+    flags = term_flags.resolve_flags(args.flags)
+
+    print(f'{"scale":>5} {"width":>5} | {"column bytes":>12} {"moves":>6} {"sgr":>6} {"ms":>7} | {"row bytes":>12} {"moves":>6} {"sgr":>6} {"ms":>7} | {"saved":>7}')
+    for scale in args.scales:
+        for width in args.widths:
+            col_text, col_time = render(flags, scale, width, False, args.repeat)
+            row_text, row_time = render(flags, scale, width, True, args.repeat)
+
+            col_bytes = len(col_text.encode())
+            row_bytes = len(row_text.encode())
+            saved = (col_bytes - row_bytes) / col_bytes * 100 if col_bytes else 0.0
+
+            print(
+                f'{scale:5} {width:5} | '
+                f'{col_bytes:12} {len(CURSOR_MOVE.findall(col_text)):6} {len(SGR.findall(col_text)):6} {col_time * 1000:7.2f} | '
+                f'{row_bytes:12} {len(CURSOR_MOVE.findall(row_text)):6} {len(SGR.findall(row_text)):6} {row_time * 1000:7.2f} | '
+                f'{saved:6.1f}%')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+# Checks that the NumPy scaling backend produces exactly the same flags as the
+# pure Python one for every built-in flag and scales 1 to 64, then compares
+# their speed. The crossover point is what NUMPY_SCALE_THRESHOLD is based on.
+# The equivalence is also covered by tests/test_scale.py.
+#
+#     python -m benchmarks.scale [-s 2,4,8,16,32,64] [--max-scale 64]
+
+from argparse import ArgumentParser
+
+import sys
+
+import term_flags
+from term_flags import ScaleBackend, PackedFlag
+
+from .common import parse_int_list, time_ops
+from .render import builtin_flags
+
+def check(flags: list[tuple[str, term_flags.Flag]], max_scale: int) -> int:
+    failures = 0
+    for name, flag in flags:
+        packed = PackedFlag.from_flag(flag)
+        for scale in range(1, max_scale + 1):
+            expected = term_flags.scale_flag(flag, scale, ScaleBackend.Python)
+            if term_flags.scale_flag(flag, scale, ScaleBackend.NumPy) != expected:
+                print(f'MISMATCH: {name} at scale {scale}', file=sys.stderr)
+                failures += 1
+            elif term_flags.scale_flag(packed, scale, ScaleBackend.NumPy).to_flag() != expected:
+                print(f'MISMATCH: {name} (packed) at scale {scale}', file=sys.stderr)
+                failures += 1
+    return failures
+
+def main() -> None:
+    ap = ArgumentParser()
+    ap.add_argument('-s', '--scales', type=parse_int_list, default=[2, 4, 8, 16, 32, 64])
+    ap.add_argument('--max-scale', type=int, default=64, help="Check equivalence up to this scale. Default: 64")
+    ap.add_argument('-t', '--min-time', type=float, default=0.05)
+
+    args = ap.parse_args()
+
+    if term_flags.import_numpy() is None:
+        raise SystemExit('numpy is not installed')
+
+    flags = builtin_flags()
+    failures = check(flags, args.max_scale)
+    print(f'checked {len(flags)} flags at scales 1 to {args.max_scale}: {failures} mismatches')
+
+    # packed flags are scaled without unpacking the result into LineSegments
+    print(f'{"flag":<16} {"segments":>8} {"scale":>5} | {"python":>10} {"numpy":>10} {"speedup":>8} | {"packed py":>10} {"numpy":>10} {"speedup":>8}')
+    for name, flag in flags:
+        packed = PackedFlag.from_flag(flag)
+        for scale in args.scales:
+            python_ops = time_ops(lambda: term_flags.scale_flag(flag, scale, ScaleBackend.Python), args.min_time)
+            numpy_ops = time_ops(lambda: term_flags.scale_flag(flag, scale, ScaleBackend.NumPy), args.min_time)
+            packed_python_ops = time_ops(lambda: term_flags.scale_flag(packed, scale, ScaleBackend.Python), args.min_time)
+            packed_numpy_ops = time_ops(lambda: term_flags.scale_flag(packed, scale, ScaleBackend.NumPy), args.min_time)
+            print(
+                f'{name:<16} {len(packed.lengths):8} {scale:5} | '
+                f'{python_ops:8.0f}/s {numpy_ops:8.0f}/s {numpy_ops / python_ops:7.2f}x | '
+                f'{packed_python_ops:8.0f}/s {packed_numpy_ops:8.0f}/s {packed_numpy_ops / packed_python_ops:7.2f}x')
+
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+# Reports how many bytes the optimizing emitter saves compared to the plain one.
+#
+#     python -m benchmarks.sgr [-s 1,2,4] [-w 80,160] [--per-flag] [flag ...]
+
+from argparse import ArgumentParser
+
+import re
+
+import term_flags
+
+from .common import parse_int_list
+
+SGR = re.compile(r'\x1B\[[0-9;]*m')
+
+def render(flags: list[term_flags.Flag], scale: int, width: int, row_major: bool, optimize: bool) -> str:
+    buf: list[str] = []
+    emitter = term_flags.Emitter(optimize=optimize)
+    term_flags.draw_wrapped_flag_list(buf, flags, scale, row_major=row_major, width=width, emitter=emitter)
+    return ''.join(buf)
+
+def report(label: str, flags: list[term_flags.Flag], scale: int, width: int, row_major: bool) -> None:
+    plain = render(flags, scale, width, row_major, False)
+    optimized = render(flags, scale, width, row_major, True)
+
+    plain_bytes = len(plain.encode())
+    optimized_bytes = len(optimized.encode())
+    saved = plain_bytes - optimized_bytes
+    percent = saved / plain_bytes * 100 if plain_bytes else 0.0
+
+    print(
+        f'{label:<20} {"rows" if row_major else "columns":<7} {scale:5} {width:5} | '
+        f'{plain_bytes:10} {len(SGR.findall(plain)):6} | '
+        f'{optimized_bytes:10} {len(SGR.findall(optimized)):6} | '
+        f'{saved:9} {percent:6.1f}%')
+
+def main() -> None:
+    ap = ArgumentParser()
+    ap.add_argument('-s', '--scales', type=parse_int_list, default=[1, 2, 4])
+    ap.add_argument('-w', '--widths', type=parse_int_list, default=[80, 160])
+    ap.add_argument('--per-flag', action='store_true', default=False, help="Also report every flag on its own.")
+    ap.add_argument('flags', nargs='*', default=['all'])
+
+    args = ap.parse_args()
+    flags = term_flags.resolve_flags(args.flags)
+
+    print(f'{"flags":<20} {"layout":<7} {"scale":>5} {"width":>5} | {"plain":>10} {"sgr":>6} | {"optimized":>10} {"sgr":>6} | {"saved":>9} {"":>7}')
+    for row_major in (False, True):
+        for scale in args.scales:
+            for width in args.widths:
+                report(','.join(args.flags), flags, scale, width, row_major)
+
+                if args.per_flag:
+                    for flag_name in args.flags:
+                        if flag_name == 'all':
+                            for name in term_flags.FLAGS:
+                                report(name, [term_flags.FLAGS[name]], scale, width, row_major)
+                        else:
+                            report(flag_name, term_flags.resolve_flags([flag_name]), scale, width, row_major)
+
+if __name__ == '__main__':
+    main()
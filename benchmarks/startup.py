@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+# Measures the startup cost of short-lived invocations in fresh interpreters:
+# the import time of term_flags as reported by `python -X importtime` and the
+# wall clock time of a few typical command lines. Byte code is cached in a
+# temporary directory, like it would be for an installed module. With
+# --baseline the same is measured for term_flags.py of a git revision, with the
+# runs of both interleaved so load changes of the machine affect both alike.
+#
+#     python -m benchmarks.startup [-n 20] [--python python3] [--baseline 9f40a49]
+
+from argparse import ArgumentParser
+from statistics import median
+from time import perf_counter
+from typing import Optional
+
+import os
+import re
+import sys
+import tempfile
+import subprocess
+
+IMPORTTIME = re.compile(r'^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|\s*term_flags$', re.M)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS: list[tuple[str, list[str]]] = [
+    ('import',      ['-c', 'import term_flags']),
+    ('--list',      ['-c', 'import sys, term_flags; sys.argv[1:] = ["--list"]; term_flags.main()']),
+    ('one flag',    ['-c', 'import sys, term_flags; sys.argv[1:] = ["ally"]; term_flags.main()']),
+    ('all flags',   ['-c', 'import sys, term_flags; sys.argv[1:] = ["all"]; term_flags.main()']),
+]
+
+def import_time(python: str, root: str, env: dict[str, str]) -> tuple[int, int]:
+    proc = subprocess.run([python, '-X', 'importtime', '-c', 'import term_flags'],
+        cwd=root, env=env, capture_output=True, text=True, check=True)
+    match = IMPORTTIME.search(proc.stderr)
+    if match is None:
+        raise SystemExit(f'term_flags not found in -X importtime output:\n{proc.stderr}')
+    return int(match.group(1)), int(match.group(2))
+
+def wall_time(python: str, root: str, args: list[str], env: dict[str, str]) -> float:
+    start = perf_counter()
+    subprocess.run([python, *args], cwd=root, env=env, stdout=subprocess.DEVNULL, check=True)
+    return perf_counter() - start
+
+# Returns the medians of every measurement for every root, taking turns
+# between the roots for each single run.
+def measure(python: str, roots: list[str], runs: int, env: dict[str, str]) -> list[dict[str, float]]:
+    samples: list[dict[str, list[float]]] = [{} for _ in roots]
+    for _ in range(runs):
+        for root, values in zip(roots, samples):
+            own, cumulative = import_time(python, root, env)
+            values.setdefault('import term_flags (self)', []).append(own / 1_000_000)
+            values.setdefault('import term_flags (total)', []).append(cumulative / 1_000_000)
+            values.setdefault('python -c pass', []).append(wall_time(python, root, ['-c', 'pass'], env))
+            for label, command in COMMANDS:
+                values.setdefault(label, []).append(wall_time(python, root, command, env))
+    return [{label: median(times) for label, times in values.items()} for values in samples]
+
+def report(python: str, runs: int, env: dict[str, str], baseline_root: Optional[str], baseline_name: str) -> None:
+    roots = [ROOT] if baseline_root is None else [ROOT, baseline_root]
+    results = measure(python, roots, runs, env)
+    current = results[0]
+    empty = current['python -c pass']
+
+    header = f'{"":<26} {"current":>11}'
+    if baseline_root is not None:
+        header += f' {baseline_name:>11} {"change":>8}'
+    print(header)
+
+    for label, elapsed in current.items():
+        line = f'{label:<26} {elapsed * 1000:8.2f} ms'
+        if baseline_root is not None:
+            before = results[1][label]
+            line += f' {before * 1000:8.2f} ms {(elapsed - before) * 1000:+6.2f}ms'
+        elif label in dict(COMMANDS):
+            line += f'  (+{(elapsed - empty) * 1000:.2f} ms)'
+        print(line)
+
+def main() -> None:
+    ap = ArgumentParser()
+    ap.add_argument('-n', '--runs', type=int, default=20, help="Number of interpreters started per measurement, the median is reported. Default: 20")
+    ap.add_argument('--python', default=sys.executable, help="Interpreter to use. Default: the current one")
+    ap.add_argument('--baseline', metavar='REV', default=None, help="Also measure term_flags.py of this git revision for comparison.")
+
+    args = ap.parse_args()
+    runs: int = args.runs
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_dir = os.path.join(tmp_dir, 'cache')
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=cache_dir)
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+
+        baseline_root: Optional[str] = None
+        if args.baseline is not None:
+            baseline_root = os.path.join(tmp_dir, 'baseline')
+            os.mkdir(baseline_root)
+            source = subprocess.run(['git', 'show', f'{args.baseline}:term_flags.py'],
+                cwd=ROOT, capture_output=True, check=True).stdout
+            with open(os.path.join(baseline_root, 'term_flags.py'), 'wb') as fp:
+                fp.write(source)
+
+        # populate the byte code cache
+        for root in (ROOT, baseline_root):
+            if root is not None:
+                wall_time(args.python, root, ['-c', 'import term_flags'], env)
+
+        report(args.python, runs, env, baseline_root, args.baseline or '')
+
+if __name__ == '__main__':
+    main()
@@ -52,12 +52,25 @@
 # 🭪
 # 🭨
 
-from typing import NamedTuple, Optional, Any
+from __future__ import annotations
+
+from typing import NamedTuple, Optional, Any, Union, Callable, Iterable, Iterator, AsyncIterator, Protocol, IO, TYPE_CHECKING, overload
 from enum import Enum
 from os import get_terminal_size
-from argparse import ArgumentParser, ArgumentTypeError
+from collections import OrderedDict
+from collections.abc import Sequence, MutableMapping
+from functools import lru_cache, partial
+from io import TextIOBase
+
+import os
+import sys
 
-import json
+# Everything that is only needed by some subcommands or for flags loaded from
+# files (argparse, json, hashlib, array, mmap, struct, ...) is imported on
+# demand to keep the startup of the command line tool short.
+if TYPE_CHECKING:
+    from array import array
+    import mmap
 
 class LineCap(Enum):
     Square      = 1
@@ -102,6 +115,7 @@ class LineSegment(NamedTuple):
     cap: LineCap
 
 Flag = list[list[LineSegment]]
+FlagView = Sequence[list[LineSegment]]
 
 SQ = LineCap.Square
 HS = LineCap.HalfSquare
@@ -123,6 +137,10 @@ LineCapMap = {
     'u1': U1, 'triup1':     U1,
 }
 
+# accepts both the numeric values and the names of the line caps
+LineCapValues: dict[Any, LineCap] = {cap.value: cap for cap in LineCap}
+LineCapValues.update(LineCapMap)
+
 LS = LineSegment
 
 # See: https://www.hrc.org/resources/lgbtq-pride-flags
@@ -150,8 +168,47 @@ ScotBlue = (  0,   94, 184)
 
 AntArcticBlue = ( 27,  47,  76)
 
-FLAGS: dict[str, Flag] = {
-    'progress-pride': [
+# Name to flag mapping that only builds a flag the first time it is looked up.
+# Iterating it (e.g. for --list) never builds any flags.
+class FlagRegistry(MutableMapping[str, Flag]):
+    __slots__ = '_builders', '_flags'
+
+    _builders: dict[str, Callable[[], Flag]]
+    _flags: dict[str, Flag]
+
+    def __init__(self, builders: Optional[dict[str, Callable[[], Flag]]] = None) -> None:
+        self._builders = dict(builders) if builders is not None else {}
+        self._flags = {}
+
+    def register(self, name: str, builder: Callable[[], Flag]) -> None:
+        self._builders[name] = builder
+        self._flags.pop(name, None)
+
+    def __getitem__(self, name: str) -> Flag:
+        flag = self._flags.get(name)
+        if flag is None:
+            flag = self._flags[name] = self._builders[name]()
+        return flag
+
+    def __setitem__(self, name: str, flag: Flag) -> None:
+        self._builders[name] = lambda: flag
+        self._flags[name] = flag
+
+    def __delitem__(self, name: str) -> None:
+        del self._builders[name]
+        self._flags.pop(name, None)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._builders
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._builders)
+
+    def __len__(self) -> int:
+        return len(self._builders)
+
+FLAGS = FlagRegistry({
+    'progress-pride': lambda: [
         [LS(TransPink, 3, D3), LS(TransBlue, 4, D3), LS(PBrown, 4, D3), LS(Black, 4, D3), LS(PRed, 21, SQ)],
         [LS(White, 2, D3), LS(TransPink, 4, D3), LS(TransBlue, 4, D3), LS(PBrown, 4, D3), LS(Black, 4, D3), LS(POrange, 18, SQ)],
         [LS(White, 5, D3), LS(TransPink, 4, D3), LS(TransBlue, 4, D3), LS(PBrown, 4, D3), LS(Black, 4, D3), LS(PYellow, 15, SQ)],
@@ -159,7 +216,7 @@ FLAGS: dict[str, Flag] = {
         [LS(White, 2, U3), LS(TransPink, 4, U3), LS(TransBlue, 4, U3), LS(PBrown, 4, U3), LS(Black, 4, U3), LS(PBlue, 18, SQ)],
         [LS(TransPink, 3, U3), LS(TransBlue, 4, U3), LS(PBrown, 4, U3), LS(Black, 4, U3), LS(PPurple, 21, SQ)],
     ],
-    'ally': [
+    'ally': lambda: [
         [LS(Black, 18, U3), LS(PRed,     3, D3), LS(Black, 15, SQ)],
         [LS(White, 15, U3), LS(POrange,  9, D3), LS(White, 12, SQ)],
         [LS(Black, 12, U3), LS(PYellow, 15, D3), LS(Black,  9, SQ)],
@@ -167,33 +224,33 @@ FLAGS: dict[str, Flag] = {
         [LS(Black,  6, U3), LS(PBlue,   12, U3), LS(Black,  3, D3), LS(PBlue,   12, D3), LS(Black, 3, SQ)],
         [LS(White,  3, U3), LS(PPurple, 12, U3), LS(White,  9, D3), LS(PPurple, 12, D3), LS(White, 0, SQ)],
     ],
-    'transgender': [
+    'transgender': lambda: [
         [LS(TransBlue, 30, SQ)],
         [LS(TransPink, 30, SQ)],
         [LS(White,     30, SQ)],
         [LS(TransPink, 30, SQ)],
         [LS(TransBlue, 30, SQ)],
     ],
-    'nonbinary': [
+    'nonbinary': lambda: [
         [LS((252, 245,  54), 26, SQ)],
         [LS(White,           26, SQ)],
         [LS((157,  89, 208), 26, SQ)],
         [LS(( 44,  44,  44), 26, SQ)],
     ],
-    'asexual': [
+    'asexual': lambda: [
         [LS(Black,           26, SQ)],
         [LS((163, 163, 163), 26, SQ)],
         [LS(White,           26, SQ)],
         [LS((129,   0, 127), 26, SQ)],
     ],
-    'bisexual': [
+    'bisexual': lambda: [
         [LS((214,   2, 112), 30, SQ)],
         [LS((214,   2, 112), 30, SQ)],
         [LS((155,  79, 149), 30, SQ)],
         [LS((  0,  56, 167), 30, SQ)],
         [LS((  0,  56, 167), 30, SQ)],
     ],
-    'pansexual': [
+    'pansexual': lambda: [
         [LS((255,  33, 140), 30, SQ)],
         [LS((255,  33, 140), 30, SQ)],
         [LS((255, 216,   0), 30, SQ)],
@@ -201,7 +258,7 @@ FLAGS: dict[str, Flag] = {
         [LS(( 33, 177, 254), 30, SQ)],
         [LS(( 33, 177, 254), 30, SQ)],
     ],
-    'lesbian': [
+    'lesbian': lambda: [
         [LS((214,  44,   0), 34, SQ)],
         [LS((239, 117,  39), 34, SQ)],
         [LS((255, 153,  86), 34, SQ)],
@@ -210,7 +267,7 @@ FLAGS: dict[str, Flag] = {
         [LS((181,  86, 144), 34, SQ)],
         [LS((164,   1,  98), 34, SQ)],
     ],
-    'gay-men': [
+    'gay-men': lambda: [
         [LS((  7, 140, 111), 34, SQ)],
         [LS(( 37, 206, 169), 34, SQ)],
         [LS((152, 233, 193), 34, SQ)],
@@ -219,14 +276,14 @@ FLAGS: dict[str, Flag] = {
         [LS(( 80,  73, 203), 34, SQ)],
         [LS(( 61,  26, 119), 34, SQ)],
     ],
-    'arbosexual': [
+    'arbosexual': lambda: [
         [LS((117, 202, 145), 30, SQ)],
         [LS((180, 229, 202), 30, SQ)],
         [LS(White,           30, SQ)],
         [LS((233, 149, 183), 30, SQ)],
         [LS((218,  68, 111), 30, SQ)],
     ],
-    'austria': [
+    'austria': lambda: [
         [LS(ATRed, 30, SQ)],
         [LS(ATRed, 30, SQ)],
         [LS(White, 30, SQ)],
@@ -234,7 +291,7 @@ FLAGS: dict[str, Flag] = {
         [LS(ATRed, 30, SQ)],
         [LS(ATRed, 30, SQ)],
     ],
-    'south-africa': [
+    'south-africa': lambda: [
         [LS(ZAYellow, 2, D6), LS(ZAGreen,  8, D6), LS(White,    6, D6), LS(ZARed,   30, SQ)],
         [LS(Black,    2, D6), LS(ZAYellow, 6, D6), LS(ZAGreen,  8, D6), LS(White,    6, D6), LS(ZARed,   24, SQ)],
         [LS(Black,    8, D6), LS(ZAYellow, 6, D6), LS(ZAGreen,  8, D6), LS(White,   24, SQ)],
@@ -244,14 +301,14 @@ FLAGS: dict[str, Flag] = {
         [LS(Black,    2, U6), LS(ZAYellow, 6, U6), LS(ZAGreen,  8, U6), LS(White,    6, U6), LS(ZABlue,  24, SQ)],
         [LS(ZAYellow, 2, U6), LS(ZAGreen,  8, U6), LS(White,    6, U6), LS(ZABlue,  30, SQ)],
     ],
-    'swizerland': [
+    'swizerland': lambda: [
         [LS(CHRed, 20, SQ)],
         [LS(CHRed,  8, SQ), LS(White,  4, SQ), LS(CHRed,  8, SQ)],
         [LS(CHRed,  4, SQ), LS(White, 12, SQ), LS(CHRed,  4, SQ)],
         [LS(CHRed,  8, SQ), LS(White,  4, SQ), LS(CHRed,  8, SQ)],
         [LS(CHRed, 20, SQ)],
     ],
-    'iceland': [
+    'iceland': lambda: [
         [LS(ISBlue,  8, SQ), LS(White,  2, SQ), LS(ISRed, 2, SQ), LS(White,   2, SQ), LS(ISBlue, 16, SQ)],
         [LS(ISBlue,  8, SQ), LS(White,  2, SQ), LS(ISRed, 2, SQ), LS(White,   2, SQ), LS(ISBlue, 16, SQ)],
         [LS(ISRed,  10, HS), LS(White,  0, SQ), LS(ISRed, 2, SQ), LS(ISRed,  18, HS), LS(White,   0, SQ)],
@@ -265,7 +322,7 @@ FLAGS: dict[str, Flag] = {
             LS(None, 16, HS), LS(ISBlue, 0, HS),
         ],
     ],
-    'scotland': [
+    'scotland': lambda: [
         [LS(White, 12, D6), LS(ScotBlue, 18, U6), LS(White, 6, SQ)],
         [LS(ScotBlue, 6, D6), LS(White, 12, D6), LS(ScotBlue, 6, U6), LS(White, 12, U6), LS(ScotBlue, 0, SQ)],
         [LS(ScotBlue, 12, D6), LS(White, 18, U6), LS(ScotBlue, 6, SQ)],
@@ -273,7 +330,7 @@ FLAGS: dict[str, Flag] = {
         [LS(ScotBlue, 6, U6), LS(White, 12, U6), LS(ScotBlue, 6, D6), LS(White, 12, D6), LS(ScotBlue, 0, SQ)],
         [LS(White, 12, U6), LS(ScotBlue, 18, D6), LS(White, 6, SQ)],
     ],
-    'ukraine': [
+    'ukraine': lambda: [
         [LS(UABlue,   30, SQ)],
         [LS(UABlue,   30, SQ)],
         [LS(UABlue,   30, SQ)],
@@ -281,7 +338,7 @@ FLAGS: dict[str, Flag] = {
         [LS(UAYellow, 30, SQ)],
         [LS(UAYellow, 30, SQ)],
     ],
-    'palestine': [
+    'palestine': lambda: [
         [LS(PSRed,  6, D6), LS(Black,   32, SQ)],
         [LS(PSRed, 12, D6), LS(Black,   26, SQ)],
         [LS(PSRed, 18, D6), LS(White,   20, SQ)],
@@ -289,7 +346,7 @@ FLAGS: dict[str, Flag] = {
         [LS(PSRed, 12, U6), LS(PSGreen, 26, SQ)],
         [LS(PSRed,  6, U6), LS(PSGreen, 32, SQ)],
     ],
-    'bahrain': [
+    'bahrain': lambda: [
         [LS(White, 18, D6), LS(BHRed, 36, SQ)],
         [LS(White, 18, U6), LS(BHRed, 36, SQ)],
         [LS(White, 18, D6), LS(BHRed, 36, SQ)],
@@ -301,13 +358,13 @@ FLAGS: dict[str, Flag] = {
         [LS(White, 18, D6), LS(BHRed, 36, SQ)],
         [LS(White, 18, U6), LS(BHRed, 36, SQ)],
     ],
-    'antarctic': [
+    'antarctic': lambda: [
         [LS(AntArcticBlue, 20, SQ)],
         [LS(AntArcticBlue, 10, U3), LS(White,         3, D3), LS(AntArcticBlue, 7, SQ)],
         [LS(White,         10, D3), LS(AntArcticBlue, 3, U3), LS(White,         7, SQ)],
         [LS(White,         20, SQ)],
     ],
-    'antarctic-alt': [
+    'antarctic-alt': lambda: [
         [LS(AntArcticBlue, 32, SQ)],
         [LS(AntArcticBlue, 16, U1), LS(White,         1, D1), LS(AntArcticBlue, 15, SQ)],
         [LS(AntArcticBlue, 15, U1), LS(White,         3, D1), LS(AntArcticBlue, 14, SQ)],
@@ -315,29 +372,29 @@ FLAGS: dict[str, Flag] = {
         [LS(White,         16, D1), LS(AntArcticBlue, 1, U1), LS(White,         15, SQ)],
         [LS(White,         32, SQ)],
     ],
-    'monaco': [
+    'monaco': lambda: [
         [LS(White, 4, HS), LS((207,   8,  33), 0, HS)],
     ]
-}
-
-FLAG_ALIASES = {
-    'at': FLAGS['austria'],
-    'za': FLAGS['south-africa'],
-    'ch': FLAGS['swizerland'],
-    'is': FLAGS['iceland'],
-    'ua': FLAGS['ukraine'],
-    'ps': FLAGS['palestine'],
-    'bh': FLAGS['bahrain'],
-    'mc': FLAGS['monaco'],
-
-    'scot':  FLAGS['scotland'],
-
-    'trans': FLAGS['transgender'],
-    'pan':   FLAGS['pansexual'],
-    'gay':   FLAGS['gay-men'],
-    'arbo':  FLAGS['arbosexual'],
-
-    'iceland-highres': [
+})
+
+FLAG_ALIASES = FlagRegistry({
+    'at': lambda: FLAGS['austria'],
+    'za': lambda: FLAGS['south-africa'],
+    'ch': lambda: FLAGS['swizerland'],
+    'is': lambda: FLAGS['iceland'],
+    'ua': lambda: FLAGS['ukraine'],
+    'ps': lambda: FLAGS['palestine'],
+    'bh': lambda: FLAGS['bahrain'],
+    'mc': lambda: FLAGS['monaco'],
+
+    'scot':  lambda: FLAGS['scotland'],
+
+    'trans': lambda: FLAGS['transgender'],
+    'pan':   lambda: FLAGS['pansexual'],
+    'gay':   lambda: FLAGS['gay-men'],
+    'arbo':  lambda: FLAGS['arbosexual'],
+
+    'iceland-highres': lambda: [
         [LS(ISBlue, 32, SQ), LS(White, 4, SQ), LS(ISRed,  8, SQ), LS(White, 4, SQ), LS(ISBlue, 64, SQ)],
         [LS(ISBlue, 32, SQ), LS(White, 4, SQ), LS(ISRed,  8, SQ), LS(White, 4, SQ), LS(ISBlue, 64, SQ)],
         [LS(ISBlue, 32, SQ), LS(White, 4, SQ), LS(ISRed,  8, SQ), LS(White, 4, SQ), LS(ISBlue, 64, SQ)],
@@ -361,472 +418,3955 @@ FLAG_ALIASES = {
         [LS(ISBlue, 32, SQ), LS(White, 4, SQ), LS(ISRed,  8, SQ), LS(White, 4, SQ), LS(ISBlue, 64, SQ)],
         [LS(ISBlue, 32, SQ), LS(White, 4, SQ), LS(ISRed,  8, SQ), LS(White, 4, SQ), LS(ISBlue, 64, SQ)],
     ],
+})
+
+FLAG_ALIASES.register('is-highres', lambda: FLAG_ALIASES['iceland-highres'])
+
+def scale_line(flag_line: list[LineSegment], scale: int, scale_index: int) -> list[LineSegment]:
+    half_point = scale // 2
+    mid_index = half_point if scale & 1 else -1
+    offset = scale - scale_index - 1
+
+    new_line: list[LineSegment] = []
+
+    length_diff = 0
+    for segment_index, segment in enumerate(flag_line):
+        length = segment.length * scale + length_diff
+        cap = segment.cap
+        col = segment.color
+
+        if cap == LineCap.Square:
+            length_diff = 0
+        elif cap == LineCap.TriDown3:
+            length_diff = offset * 3
+        elif cap == LineCap.TriUp3:
+            length_diff = scale_index * 3
+        elif cap == LineCap.TriDown6:
+            length_diff = offset * 6
+        elif cap == LineCap.TriUp6:
+            length_diff = scale_index * 6
+        elif cap == LineCap.TriDown1:
+            length_diff = offset
+        elif cap == LineCap.TriUp1:
+            length_diff = scale_index
+        elif cap == LineCap.HalfSquare:
+            length_diff = 0
+            if scale_index != mid_index:
+                if scale_index < half_point:
+                    next_index = segment_index + 1
+                    if next_index < len(flag_line):
+                        col = flag_line[next_index].color
+                    else:
+                        col = None
+                cap = LineCap.Square
+        else:
+            raise ValueError(f'unhandled LineCap value: {cap}')
+
+        length -= length_diff
+
+        if length < 0:
+            length_diff += length
+            if segment_index > 0 and flag_line[segment_index - 1].cap == LineCap.HalfSquare:
+                new_line.append(LineSegment(col, 0, cap))
+        else:
+            new_line.append(LineSegment(col, length, cap))
+
+    return new_line
+
+# Lines of the scaled flag are computed from the source flag on access, so
+# big scales don't allocate the whole scaled flag at once.
+class ScaledFlag(Sequence[list[LineSegment]]):
+    __slots__ = ('flag', 'scale', '_width')
+
+    flag: FlagView
+    scale: int
+    _width: Optional[int]
+
+    def __init__(self, flag: FlagView, scale: int) -> None:
+        if scale < 1:
+            raise ValueError(f'illegal scale: {scale}')
+
+        self.flag   = flag
+        self.scale  = scale
+        self._width = None
+
+    def __len__(self) -> int:
+        return len(self.flag) * self.scale
+
+    @overload
+    def __getitem__(self, index: int) -> list[LineSegment]: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[list[LineSegment]]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[list[LineSegment], list[list[LineSegment]]]:
+        if isinstance(index, slice):
+            return [self[line_index] for line_index in range(*index.indices(len(self)))]
+
+        size = len(self)
+        if index < 0:
+            index += size
+
+        if index < 0 or index >= size:
+            raise IndexError('scaled flag index out of range')
+
+        scale = self.scale
+        return scale_line(self.flag[index // scale], scale, index % scale)
+
+    def __iter__(self) -> Iterator[list[LineSegment]]:
+        scale = self.scale
+        for flag_line in self.flag:
+            for scale_index in range(scale):
+                yield scale_line(flag_line, scale, scale_index)
+
+    @property
+    def width(self) -> int:
+        width = self._width
+        if width is None:
+            width = self._width = max(
+                (sum(segment.length for segment in flag_line)
+                 for flag_line in self),
+                default=0)
+        return width
+
+# A flag in a few flat buffers instead of lists of LineSegment tuples. The
+# segments of line n are line_offsets[n] <= i < line_offsets[n + 1], each one
+# being lengths[i] half characters long, with the cap LineCap(caps[i]) and the
+# color palette[colors[i]]. The buffers may be arrays or memoryviews.
+class PackedFlag(Sequence[list[LineSegment]]):
+    __slots__ = ('line_offsets', 'lengths', 'caps', 'colors', 'palette', '_width')
+
+    line_offsets: Union[array, memoryview]
+    lengths: Union[array, memoryview]
+    caps: Union[array, memoryview]
+    colors: Union[array, memoryview]
+    palette: list[Optional[Color]]
+    _width: Optional[int]
+
+    def __init__(self, line_offsets: Union[array, memoryview], lengths: Union[array, memoryview], caps: Union[array, memoryview], colors: Union[array, memoryview], palette: list[Optional[Color]]) -> None:
+        if len(line_offsets) < 1:
+            raise ValueError('line_offsets needs at least one entry')
+
+        segment_count = len(lengths)
+        if len(caps) != segment_count or len(colors) != segment_count or line_offsets[-1] != segment_count:
+            raise ValueError(f'inconsistent segment count: {segment_count}')
+
+        self.line_offsets = line_offsets
+        self.lengths      = lengths
+        self.caps         = caps
+        self.colors       = colors
+        self.palette      = palette
+        self._width       = None
+
+    @staticmethod
+    def from_flag(flag: FlagView) -> 'PackedFlag':
+        if isinstance(flag, PackedFlag):
+            return flag
+
+        from array import array
+
+        palette: dict[Optional[Color], int] = {}
+        line_offsets = array('I', [0])
+        lengths = array('I')
+        caps    = array('B')
+        colors  = array('I')
+
+        for flag_line in flag:
+            for color, length, cap in flag_line:
+                index = palette.get(color)
+                if index is None:
+                    index = palette[color] = len(palette)
+                colors.append(index)
+                lengths.append(length)
+                caps.append(cap.value)
+            line_offsets.append(len(lengths))
+
+        if len(palette) <= 0x10000:
+            colors = array('H', colors)
+
+        return PackedFlag(line_offsets, lengths, caps, colors, list(palette))
+
+    def to_flag(self) -> Flag:
+        palette = self.palette
+        segments = list(map(LineSegment,
+            map(palette.__getitem__, self.colors),
+            self.lengths,
+            map(LineCapValues.__getitem__, self.caps)))
+
+        line_offsets = self.line_offsets
+        return [segments[line_offsets[index]:line_offsets[index + 1]] for index in range(len(line_offsets) - 1)]
+
+    def __len__(self) -> int:
+        return len(self.line_offsets) - 1
+
+    @overload
+    def __getitem__(self, index: int) -> list[LineSegment]: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[list[LineSegment]]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[list[LineSegment], list[list[LineSegment]]]:
+        if isinstance(index, slice):
+            return [self[line_index] for line_index in range(*index.indices(len(self)))]
+
+        size = len(self)
+        if index < 0:
+            index += size
+
+        if index < 0 or index >= size:
+            raise IndexError('packed flag index out of range')
+
+        return self._line(self.line_offsets[index], self.line_offsets[index + 1])
+
+    def __iter__(self) -> Iterator[list[LineSegment]]:
+        line_offsets = self.line_offsets
+        for index in range(len(line_offsets) - 1):
+            yield self._line(line_offsets[index], line_offsets[index + 1])
+
+    def _line(self, start: int, end: int) -> list[LineSegment]:
+        palette = self.palette
+        return [
+            LineSegment(palette[color], length, LineCapValues[cap])
+            for color, length, cap in zip(self.colors[start:end], self.lengths[start:end], self.caps[start:end])
+        ]
+
+    @property
+    def width(self) -> int:
+        width = self._width
+        if width is None:
+            line_offsets = self.line_offsets
+            lengths = self.lengths
+            width = self._width = max(
+                (sum(lengths[line_offsets[index]:line_offsets[index + 1]])
+                 for index in range(len(line_offsets) - 1)),
+                default=0)
+        return width
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(buf) * buf.itemsize for buf in (self.line_offsets, self.lengths, self.caps, self.colors))
+
+class ScaleBackend(Enum):
+    Auto   = 'auto'
+    Python = 'python'
+    NumPy  = 'numpy'
+
+# NumPy is optional and only imported the first time it is needed, because it
+# takes longer to import than everything else together.
+_numpy: Any = None
+
+def import_numpy() -> Any:
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            _numpy = False
+        else:
+            _numpy = numpy
+    return _numpy or None
+
+# Below this many segments times scale the pure Python backend is faster,
+# see benchmarks/scale.py. Packed flags don't need to be unpacked afterwards,
+# so NumPy pays off much earlier for them.
+NUMPY_SCALE_THRESHOLD        = 512
+NUMPY_PACKED_SCALE_THRESHOLD = 64
+
+# triangle caps: (length change per scaled row, whether they widen downwards)
+CAP_SLOPES: dict[LineCap, tuple[int, bool]] = {
+    LineCap.TriDown3: (3, False),
+    LineCap.TriUp3:   (3, True),
+    LineCap.TriDown6: (6, False),
+    LineCap.TriUp6:   (6, True),
+    LineCap.TriDown1: (1, False),
+    LineCap.TriUp1:   (1, True),
 }
 
-FLAG_ALIASES['is-highres'] = FLAG_ALIASES['iceland-highres']
+# Does the same as ScaledFlag/scale_line() for all lines and scaled rows at
+# once on (line, scaled row, segment) shaped arrays. The length carried over
+# from one segment to the next is carry[j] = min(diff[j], grown[j] + carry[j - 1])
+# (it shrinks when a segment would get a negative length), which is computed
+# with a running minimum: carry[j] = total[j] + min(0, min(diff[i] - total[i] for i <= j))
+# where total is the running sum of grown.
+def scale_flag_numpy(flag: FlagView, scale: int) -> PackedFlag:
+    from array import array
+
+    np = import_numpy()
+    if np is None:
+        raise ImportError('the NumPy scaling backend requires numpy')
 
-def scale_flag(flag: Flag, scale: int) -> Flag:
     if scale < 1:
         raise ValueError(f'illegal scale: {scale}')
 
-    mid_index: Optional[int]
+    packed = PackedFlag.from_flag(flag)
+    line_count = len(packed)
+    palette = packed.palette + [None]
+    none_index = len(palette) - 1
+    color_typecode = 'H' if len(palette) <= 0x10000 else 'I'
+
+    src_offsets = np.asarray(memoryview(packed.line_offsets), dtype=np.int64)
+    counts = np.diff(src_offsets)
+    width = int(counts.max()) if line_count else 0
+    if width == 0:
+        return PackedFlag(array('I', [0] * (line_count * scale + 1)), array('I'), array('B'), array(color_typecode), palette)
+
+    valid = np.arange(width) < counts[:, None]
+
+    lengths = np.zeros((line_count, width), dtype=np.int64)
+    lengths[valid] = np.asarray(memoryview(packed.lengths))
+
+    caps = np.zeros((line_count, width), dtype=np.int64)
+    caps[valid] = np.asarray(memoryview(packed.caps))
+
+    colors = np.full((line_count, width), none_index, dtype=np.int64)
+    colors[valid] = np.asarray(memoryview(packed.colors))
+
+    # HalfSquare takes the color of the following segment, None for the last one
+    next_colors = np.full((line_count, width), none_index, dtype=np.int64)
+    next_colors[:, :-1] = colors[:, 1:]
+
+    after_half = np.zeros((line_count, width), dtype=bool)
+    after_half[:, 1:] = caps[:, :-1] == LineCap.HalfSquare.value
+
+    cap_steps = np.zeros(max(cap.value for cap in LineCap) + 1, dtype=np.int64)
+    cap_widens = np.zeros(cap_steps.shape, dtype=bool)
+    for cap, (step, widens) in CAP_SLOPES.items():
+        cap_steps[cap.value] = step
+        cap_widens[cap.value] = widens
+
+    # axes: line, scaled row, segment
+    rows = np.arange(scale).reshape(1, scale, 1)
+    diff = cap_steps[caps][:, None, :] * np.where(cap_widens[caps][:, None, :], rows, scale - 1 - rows)
+    grown = np.broadcast_to((lengths * scale)[:, None, :], diff.shape)
+    total = np.cumsum(grown, axis=2)
+    carry = total + np.minimum(np.minimum.accumulate(diff - total, axis=2), 0)
+
+    prev_carry = np.zeros_like(carry)
+    prev_carry[:, :, 1:] = carry[:, :, :-1]
+    new_lengths = grown + prev_carry - diff
+
+    keep = valid[:, None, :] & ((new_lengths >= 0) | after_half[:, None, :])
+
     half_point = scale // 2
-    if scale & 1:
-        mid_index = half_point
+    mid_index = half_point if scale & 1 else -1
+    squared = (caps == LineCap.HalfSquare.value)[:, None, :] & (rows != mid_index)
+    new_caps = np.where(squared, LineCap.Square.value, caps[:, None, :])
+    new_colors = np.where(squared & (rows < half_point), next_colors[:, None, :], colors[:, None, :])
+
+    line_offsets = np.zeros(line_count * scale + 1, dtype=np.uint32)
+    np.cumsum(keep.sum(axis=2).ravel(), out=line_offsets[1:])
+
+    return PackedFlag(
+        array('I', line_offsets.tobytes()),
+        array('I', np.maximum(new_lengths[keep], 0).astype(np.uint32).tobytes()),
+        array('B', new_caps[keep].astype(np.uint8).tobytes()),
+        array(color_typecode, new_colors[keep].astype(np.uint16 if color_typecode == 'H' else np.uint32).tobytes()),
+        palette)
+
+def use_numpy_scaling(flag: FlagView, scale: int) -> bool:
+    if scale == 1:
+        return False
+
+    if isinstance(flag, PackedFlag):
+        threshold = NUMPY_PACKED_SCALE_THRESHOLD
+        segment_count = len(flag.lengths)
+    elif isinstance(flag, list):
+        threshold = NUMPY_SCALE_THRESHOLD
+        segment_count = sum(map(len, flag))
     else:
-        mid_index = None
+        return False
+
+    return segment_count * scale >= threshold and import_numpy() is not None
+
+@overload
+def scale_flag(flag: PackedFlag, scale: int, backend: ScaleBackend = ScaleBackend.Auto) -> PackedFlag: ... # type: ignore
+
+@overload
+def scale_flag(flag: FlagView, scale: int, backend: ScaleBackend = ScaleBackend.Auto) -> Flag: ...
+
+# Packed flags stay packed. They are scaled line by line, so the unpacked
+# scaled flag never exists as a whole. ScaleBackend.Auto uses NumPy for big
+# enough flags and scales if it is installed.
+def scale_flag(flag: FlagView, scale: int, backend: ScaleBackend = ScaleBackend.Auto) -> Union[Flag, PackedFlag]:
+    if backend == ScaleBackend.NumPy or (backend == ScaleBackend.Auto and use_numpy_scaling(flag, scale)):
+        scaled = scale_flag_numpy(flag, scale)
+        return scaled if isinstance(flag, PackedFlag) else scaled.to_flag()
+
+    if isinstance(flag, PackedFlag):
+        return PackedFlag.from_flag(ScaledFlag(flag, scale))
+    return list(ScaledFlag(flag, scale))
+
+# Declared in the functional form (like Run and CompiledLine), which is
+# cheaper to create at import time than the class syntax.
+FlagScale = NamedTuple('FlagScale', [('x', float), ('y', float)])
+
+def round_to(value: float, quantum: int) -> int:
+    return int(value / quantum + 0.5) * quantum
+
+# Generalization of scale_line() to any horizontal scale and a source line that
+# is stretched over rows terminal lines. Segment ends are rounded to whole half
+# characters (whole characters in lines with 6-length caps, which don't support
+# anything finer) and the triangle caps keep their slope per row.
+def stretch_line(flag_line: list[LineSegment], scale_x: float, rows: int, row_index: int) -> list[LineSegment]:
+    half_point = rows // 2
+    mid_index = half_point if rows & 1 else -1
+    down_index = rows - row_index - 1
+    quantum = 2 if any(segment.cap in (LineCap.TriDown6, LineCap.TriUp6) for segment in flag_line) else 1
+
+    new_line: list[LineSegment] = []
+
+    length_diff = 0
+    end = 0
+    scaled_end = 0
+    for segment_index, segment in enumerate(flag_line):
+        end += segment.length
+        prev_scaled_end = scaled_end
+        scaled_end = round_to(end * scale_x, quantum)
+
+        length = scaled_end - prev_scaled_end + length_diff
+        cap = segment.cap
+        col = segment.color
+
+        if cap == LineCap.Square:
+            length_diff = 0
+        elif cap == LineCap.HalfSquare:
+            length_diff = 0
+            if row_index != mid_index:
+                if row_index < half_point:
+                    next_index = segment_index + 1
+                    if next_index < len(flag_line):
+                        col = flag_line[next_index].color
+                    else:
+                        col = None
+                cap = LineCap.Square
+        else:
+            step, widens = CAP_SLOPES[cap]
+            length_diff = round_to(step * scale_x * (row_index if widens else down_index) / rows, quantum)
 
-    new_flag: Flag = []
-    for flag_line in flag:
+        length -= length_diff
+
+        if length < 0:
+            length_diff += length
+            if segment_index > 0 and flag_line[segment_index - 1].cap == LineCap.HalfSquare:
+                new_line.append(LineSegment(col, 0, cap))
+        else:
+            new_line.append(LineSegment(col, length, cap))
 
-        for scale_index in range(scale):
-            offset = scale - scale_index - 1
+    return new_line
 
-            new_line: list[LineSegment] = []
-            new_flag.append(new_line)
+# Like ScaledFlag, but for fractional and different horizontal and vertical
+# scales. Source line n covers the rows round(n * scale_y) up to (excluding)
+# round((n + 1) * scale_y).
+class StretchedFlag(Sequence[list[LineSegment]]):
+    __slots__ = ('flag', 'scale_x', 'scale_y', '_row_starts', '_width')
+
+    flag: FlagView
+    scale_x: float
+    scale_y: float
+    _row_starts: list[int]
+    _width: Optional[int]
+
+    def __init__(self, flag: FlagView, scale_x: float, scale_y: float) -> None:
+        if scale_x <= 0 or scale_y <= 0:
+            raise ValueError(f'illegal scale: {scale_x}x{scale_y}')
+
+        self.flag    = flag
+        self.scale_x = scale_x
+        self.scale_y = scale_y
+        self._row_starts = [round_to(line_index * scale_y, 1) for line_index in range(len(flag) + 1)]
+        self._width  = None
+
+    def __len__(self) -> int:
+        return self._row_starts[-1]
+
+    @overload
+    def __getitem__(self, index: int) -> list[LineSegment]: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[list[LineSegment]]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[list[LineSegment], list[list[LineSegment]]]:
+        if isinstance(index, slice):
+            return [self[line_index] for line_index in range(*index.indices(len(self)))]
+
+        size = len(self)
+        if index < 0:
+            index += size
+
+        if index < 0 or index >= size:
+            raise IndexError('stretched flag index out of range')
+
+        from bisect import bisect_right
+
+        row_starts = self._row_starts
+        line_index = bisect_right(row_starts, index) - 1
+        start = row_starts[line_index]
+        return stretch_line(self.flag[line_index], self.scale_x, row_starts[line_index + 1] - start, index - start)
+
+    def __iter__(self) -> Iterator[list[LineSegment]]:
+        row_starts = self._row_starts
+        scale_x = self.scale_x
+        for line_index, flag_line in enumerate(self.flag):
+            rows = row_starts[line_index + 1] - row_starts[line_index]
+            for row_index in range(rows):
+                yield stretch_line(flag_line, scale_x, rows, row_index)
+
+    @property
+    def width(self) -> int:
+        width = self._width
+        if width is None:
+            width = self._width = max(
+                (sum(segment.length for segment in flag_line)
+                 for flag_line in self),
+                default=0)
+        return width
+
+# Integer uniform scales use ScaledFlag, which is exact and faster.
+def resize_flag(flag: FlagView, scale_x: float, scale_y: float) -> FlagView:
+    if scale_x == scale_y and scale_x == int(scale_x):
+        scale = int(scale_x)
+        return ScaledFlag(flag, scale) if scale != 1 else flag
+    return StretchedFlag(flag, scale_x, scale_y)
+
+def fit_scale(flag: FlagView, width: int, scale: Union[int, FlagScale] = 1) -> FlagScale:
+    flag_width = FLAG_METRICS.get(flag).width
+    if flag_width <= 0:
+        return FlagScale(1, 1)
+
+    # width is in characters, flag widths in half characters
+    scale_x = 2 * width / flag_width
+    if isinstance(scale, FlagScale):
+        return FlagScale(scale_x, scale_x * scale.y / scale.x)
+    return FlagScale(scale_x, scale_x)
+
+# Marks a run that doesn't care about the background or foreground color, so
+# whatever is currently set is kept. Runs with any background only consist of
+# '█', runs with any foreground only consist of spaces. It is tested for by
+# identity, so it unpickles as the very same object, e.g. in flags compiled in
+# another process.
+class _AnyColor(tuple[int, int, int]):
+    __slots__ = ()
+
+    def __reduce__(self) -> str:
+        return 'AnyColor'
+
+AnyColor: Color = _AnyColor((-1, -1, -1))
+
+Run = NamedTuple('Run', [('bg', Optional[Color]), ('fg', Optional[Color]), ('text', str)])
+# x is the cursor position after the line in half characters and width the sum
+# of the segment lengths.
+CompiledLine = NamedTuple('CompiledLine', [('runs', tuple[Run, ...]), ('x', int), ('width', int)])
+
+class CompiledFlag:
+    __slots__ = ('lines', 'width')
+
+    lines: tuple[CompiledLine, ...]
+    width: int
+
+    def __init__(self, lines: tuple[CompiledLine, ...]) -> None:
+        self.lines = lines
+        self.width = max((line.width for line in lines), default=0)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+def compile_line(flag_line: list[LineSegment]) -> CompiledLine:
+    if _profiler is not None:
+        _profiler.count_segments(len(flag_line))
+
+    runs: list[Run] = []
+    add = runs.append
+
+    x = 0
+    width = 0
+    prev_carry_x = 0
+    line_len = len(flag_line)
+    for segment_index, segment in enumerate(flag_line):
+        col = segment.color
+        cap = segment.cap
+        length = segment.length
+        width += length
+
+        if prev_carry_x:
+            length -= 1
+
+        x += length
+        carry_x = x & 1
+        x += carry_x
+
+        next_index = segment_index + 1
+        next_col: Optional[Color]
+        if next_index < line_len:
+            next_col = flag_line[next_index].color
+        else:
+            next_col = None
+
+        if cap == LineCap.Square:
+            if length > 0:
+                if col is None:
+                    add(Run(None, AnyColor, ' ' * (length >> 1)))
+
+                    if carry_x:
+                        add(Run(next_col, col, ' '))
+
+                else:
+                    add(Run(AnyColor, col, '█' * (length >> 1)))
+
+                    if carry_x:
+                        add(Run(next_col, col, '▌'))
+
+        elif cap == LineCap.HalfSquare:
+            if length > 0:
+                if col is None:
+                    add(Run(col, next_col, '▀' * (length >> 1) + ('▘' if carry_x else '')))
+                else:
+                    add(Run(next_col, col, '▄' * (length >> 1) + ('▖' if carry_x else '')))
+
+        else:
+            block_length = max(length - cap.length, 0)
+
+            if block_length > 0:
+                add(Run(AnyColor, col, '█' * (block_length >> 1)))
+
+            cap_length = length - block_length
+            if cap_length > 0:
+                if cap == LineCap.TriDown3:
+                    if carry_x:
+                        add(Run(next_col, col, '🭏🬼' if cap_length > 1 else '🬼'))
+                    else:
+                        add(Run(col, next_col, '🭢🭕' if cap_length > 2 else '🭕'))
 
-            length_diff = 0
-            for segment_index, segment in enumerate(flag_line):
-                length = segment.length * scale + length_diff
-                cap = segment.cap
-                col = segment.color
-
-                if cap == LineCap.Square:
-                    length_diff = 0
-                elif cap == LineCap.TriDown3:
-                    length_diff = offset * 3
                 elif cap == LineCap.TriUp3:
-                    length_diff = scale_index * 3
+                    if carry_x:
+                        add(Run(next_col, col, '🭠🭗' if cap_length > 1 else '🭗'))
+                    else:
+                        add(Run(col, next_col, '🭇🭄' if cap_length > 2 else '🭄'))
+
                 elif cap == LineCap.TriDown6:
-                    length_diff = offset * 6
+                    if carry_x or cap_length & 1:
+                        raise ValueError("LineCap.TriDown6 doesn't support sub-character precision")
+
+                    if cap_length > 4:
+                        add(Run(next_col, col, '🭍'))
+
+                    if cap_length > 2:
+                        add(Run(col, next_col, '🭧'))
+
+                    add(Run(next_col, col, '🬽'))
+
                 elif cap == LineCap.TriUp6:
-                    length_diff = scale_index * 6
+                    if carry_x or cap_length & 1:
+                        raise ValueError("LineCap.TriUp6 doesn't support sub-character precision")
+
+                    if cap_length > 4:
+                        add(Run(next_col, col, '🭞'))
+
+                    if cap_length > 2:
+                        add(Run(col, next_col, '🭆'))
+
+                    add(Run(next_col, col, '🭘'))
+
                 elif cap == LineCap.TriDown1:
-                    length_diff = offset
+                    add(Run(next_col, col, '🭀' if carry_x else '🭐'))
+
                 elif cap == LineCap.TriUp1:
-                    length_diff = scale_index
-                elif cap == LineCap.HalfSquare:
-                    length_diff = 0
-                    if scale_index != mid_index:
-                        if scale_index < half_point:
-                            next_index = segment_index + 1
-                            if next_index < len(flag_line):
-                                col = flag_line[next_index].color
-                            else:
-                                col = None
-                        cap = LineCap.Square
-                else:
-                    raise ValueError(f'unhandled LineCap value: {cap}')
+                    add(Run(next_col, col, '🭛' if carry_x else '🭡'))
 
-                length -= length_diff
+                else:
+                    raise ValueError(f'unhadled LineCap value: {cap}')
+
+        prev_carry_x = carry_x
+
+    return CompiledLine(tuple(runs), x, width)
+
+def compile_flag(flag: FlagView) -> CompiledFlag:
+    return CompiledFlag(tuple(compile_line(flag_line) for flag_line in flag))
+
+class ColorMode(Enum):
+    TrueColor  = 'truecolor'
+    Palette256 = '256'
+    Palette16  = '16'
+
+# xterm's default colors for the 16 system colors
+PALETTE16: tuple[Color, ...] = (
+    (  0,   0,   0), (205,   0,   0), (  0, 205,   0), (205, 205,   0),
+    (  0,   0, 238), (205,   0, 205), (  0, 205, 205), (229, 229, 229),
+    (127, 127, 127), (255,   0,   0), (  0, 255,   0), (255, 255,   0),
+    ( 92,  92, 255), (255,   0, 255), (  0, 255, 255), (255, 255, 255),
+)
+
+CUBE_LEVELS = (0, 95, 135, 175, 215, 255)
+
+def color_distance(a: Color, b: Color) -> float:
+    # "redmean" approximation of the perceived difference
+    rmean = (a[0] + b[0]) / 2
+    dr = a[0] - b[0]
+    dg = a[1] - b[1]
+    db = a[2] - b[2]
+    return (2 + rmean / 256) * dr * dr + 4 * dg * dg + (2 + (255 - rmean) / 256) * db * db
+
+def palette256_color(index: int) -> Color:
+    if index < 16:
+        return PALETTE16[index]
+    elif index < 232:
+        index -= 16
+        return (CUBE_LEVELS[index // 36], CUBE_LEVELS[index // 6 % 6], CUBE_LEVELS[index % 6])
+    else:
+        level = 8 + (index - 232) * 10
+        return (level, level, level)
+
+def _cube_index(value: int) -> int:
+    if value < 48:
+        return 0
+    elif value < 115:
+        return 1
+    return (value - 35) // 40
+
+# Distinct colors whose quantizations and SGR sequences are remembered. Flags
+# sent to a render server can have any number of colors, so these are bounded.
+COLOR_CACHE_SIZE = 4096
+
+# The system colors (0-15) aren't used for the 256 color mode because
+# terminals commonly re-define them.
+@lru_cache(maxsize=COLOR_CACHE_SIZE)
+def quantize256(color: Color) -> int:
+    r, g, b = color
+    cube_index = 16 + 36 * _cube_index(r) + 6 * _cube_index(g) + _cube_index(b)
+
+    gray = (r + g + b) // 3
+    gray_index = 232 + min(max((gray - 3) // 10, 0), 23)
+
+    if color_distance(color, palette256_color(gray_index)) < color_distance(color, palette256_color(cube_index)):
+        return gray_index
+    return cube_index
+
+@lru_cache(maxsize=COLOR_CACHE_SIZE)
+def quantize16(color: Color) -> int:
+    return min(range(16), key=lambda index: color_distance(color, PALETTE16[index]))
+
+def quantize(color: Optional[Color], color_mode: ColorMode) -> Optional[Color]:
+    if color is None or color is AnyColor or color_mode == ColorMode.TrueColor:
+        return color
+    elif color_mode == ColorMode.Palette256:
+        return palette256_color(quantize256(color))
+    elif color_mode == ColorMode.Palette16:
+        return PALETTE16[quantize16(color)]
+    else:
+        raise ValueError(f'unhandled ColorMode value: {color_mode}')
+
+def sgr_bg_params(color: Optional[Color], color_mode: ColorMode = ColorMode.TrueColor) -> str:
+    if color is None:
+        return '49'
+    elif color_mode == ColorMode.TrueColor:
+        return f'48;2;{color[0]};{color[1]};{color[2]}'
+    elif color_mode == ColorMode.Palette256:
+        return f'48;5;{quantize256(color)}'
+    elif color_mode == ColorMode.Palette16:
+        index = quantize16(color)
+        return str(40 + index if index < 8 else 92 + index)
+    else:
+        raise ValueError(f'unhandled ColorMode value: {color_mode}')
+
+def sgr_fg_params(color: Optional[Color], color_mode: ColorMode = ColorMode.TrueColor) -> str:
+    if color is None:
+        color = Black
+
+    if color_mode == ColorMode.TrueColor:
+        return f'38;2;{color[0]};{color[1]};{color[2]}'
+    elif color_mode == ColorMode.Palette256:
+        return f'38;5;{quantize256(color)}'
+    elif color_mode == ColorMode.Palette16:
+        index = quantize16(color)
+        return str(30 + index if index < 8 else 82 + index)
+    else:
+        raise ValueError(f'unhandled ColorMode value: {color_mode}')
+
+# Computes missing values with make. Once it holds maxsize values it starts
+# over empty, which keeps lookups of present keys plain dict lookups.
+class _Memo(dict[Any, Any]):
+    __slots__ = ('make', 'maxsize')
+
+    make: Callable[[Any], Any]
+    maxsize: int
+
+    def __init__(self, make: Callable[[Any], Any], maxsize: int = COLOR_CACHE_SIZE) -> None:
+        super().__init__()
+        self.make = make
+        self.maxsize = maxsize
+
+    def __missing__(self, key: Any) -> Any:
+        if len(self) >= self.maxsize:
+            self.clear()
+        value = self[key] = self.make(key)
+        return value
+
+# Pre-formatted SGR sequences of one color mode, computed once per distinct
+# color (or color pair).
+class SGRTable:
+    __slots__ = ('color_mode', 'bg', 'fg', 'bg_fg', 'quantized')
+
+    color_mode: ColorMode
+    bg: dict[Optional[Color], str]
+    fg: dict[Optional[Color], str]
+    bg_fg: dict[tuple[Optional[Color], Optional[Color]], str]
+    quantized: dict[Optional[Color], Optional[Color]]
+
+    def __init__(self, color_mode: ColorMode) -> None:
+        self.color_mode = color_mode
+        self.quantized = _Memo(lambda color: quantize(color, color_mode))
+        self.bg    = _Memo(lambda color: f'\x1B[{sgr_bg_params(color, color_mode)}m')
+        self.fg    = _Memo(lambda color: f'\x1B[{sgr_fg_params(color, color_mode)}m')
+        self.bg_fg = _Memo(lambda cols: f'\x1B[{sgr_bg_params(cols[0], color_mode)};{sgr_fg_params(cols[1], color_mode)}m')
+
+SGR_TABLES = {color_mode: SGRTable(color_mode) for color_mode in ColorMode}
+TRUECOLOR_SGR = SGR_TABLES[ColorMode.TrueColor]
+
+def sgr_bg(color: Optional[Color], color_mode: ColorMode = ColorMode.TrueColor) -> str:
+    return SGR_TABLES[color_mode].bg[color]
+
+def sgr_fg(color: Optional[Color], color_mode: ColorMode = ColorMode.TrueColor) -> str:
+    return SGR_TABLES[color_mode].fg[color]
+
+def sgr_bg_fg(bg: Optional[Color], fg: Optional[Color], color_mode: ColorMode = ColorMode.TrueColor) -> str:
+    return SGR_TABLES[color_mode].bg_fg[bg, fg]
+
+if TYPE_CHECKING:
+    class Sink(Protocol):
+        def append(self, data: str) -> None: ...
+
+    Output = Union[Sink, IO[str], IO[bytes], bytearray]
+
+DEFAULT_FLUSH_THRESHOLD = 64 * 1024
+
+class StreamSink:
+    __slots__ = ('fp', 'flush_threshold', '_write', '_binary', '_chunks', '_size')
+
+    fp: Union[IO[str], IO[bytes], bytearray]
+    flush_threshold: int
+    _write: Callable[[Any], Any]
+    _binary: bool
+    _chunks: list[str]
+    _size: int
+
+    def __init__(self, fp: Union[IO[str], IO[bytes], bytearray], flush_threshold: int = DEFAULT_FLUSH_THRESHOLD) -> None:
+        self.fp = fp
+        self.flush_threshold = flush_threshold
+        self._chunks = []
+        self._size = 0
+
+        if isinstance(fp, bytearray):
+            self._write  = fp.extend
+            self._binary = True
+        else:
+            self._write  = fp.write
+            self._binary = not isinstance(fp, TextIOBase) and 'b' in getattr(fp, 'mode', 'b')
+
+    def append(self, data: str) -> None:
+        self._chunks.append(data)
+        self._size += len(data)
+        if self._size >= self.flush_threshold:
+            self.flush()
+
+    def flush(self) -> None:
+        chunks = self._chunks
+        if chunks:
+            data = ''.join(chunks)
+            chunks.clear()
+            self._size = 0
+            self._write(data.encode() if self._binary else data)
+
+        flush = getattr(self.fp, 'flush', None)
+        if flush is not None:
+            flush()
+
+# Number of fragments a BytesSink gathers before they are encoded.
+BYTES_FLUSH_FRAGMENTS = 256
+
+# Collects the output UTF-8 encoded in a bytearray, which can be cleared and
+# used again for the next output. append() is the append() of a plain list
+# and the fragments are encoded a few hundred at a time whenever a draw
+# function yields (see _draw_to()), so the whole output never exists as one
+# str (4 bytes per character once it contains a glyph like 🭏) that is then
+# encoded in another pass. flush() has to be called once drawing is done.
+class BytesSink:
+    __slots__ = ('data', 'append', '_chunks')
+
+    data: bytearray
+    append: Callable[[str], None]
+    _chunks: list[str]
+
+    def __init__(self, data: Optional[bytearray] = None) -> None:
+        self.data = data if data is not None else bytearray()
+        self._chunks = []
+        self.append = self._chunks.append
+
+    # Encodes the pending fragments.
+    def flush(self) -> None:
+        chunks = self._chunks
+        if chunks:
+            self.data += ''.join(chunks).encode()
+            chunks.clear()
+
+    def clear(self) -> None:
+        self._chunks.clear()
+        del self.data[:]
+
+# Writes UTF-8 encoded output to a text stream, straight to its binary
+# buffer if it has one and uses UTF-8 anyway.
+def write_utf8(fp: IO[str], data: Union[bytes, bytearray]) -> None:
+    buffer = getattr(fp, 'buffer', None)
+    encoding = getattr(fp, 'encoding', None)
+    if buffer is not None and encoding and _is_utf8(encoding):
+        fp.flush()
+        buffer.write(data)
+        buffer.flush()
+    else:
+        fp.write(data.decode())
 
-                if length < 0:
-                    length_diff += length
-                    if segment_index > 0 and flag_line[segment_index - 1].cap == LineCap.HalfSquare:
-                        new_line.append(LineSegment(col, 0, cap))
+@lru_cache
+def _is_utf8(encoding: str) -> bool:
+    import codecs
+    try:
+        return codecs.lookup(encoding).name == 'utf-8'
+    except LookupError:
+        return False
+
+def as_sink(out: Output, flush_threshold: int = DEFAULT_FLUSH_THRESHOLD) -> Sink:
+    if isinstance(out, bytearray) or not hasattr(out, 'append'):
+        return StreamSink(out, flush_threshold)
+    return out
+
+def emit_runs(append: Callable[[str], Any], runs: Iterable[Run], bg_col: Optional[Color], fg_col: Optional[Color], sgr: SGRTable = TRUECOLOR_SGR) -> tuple[Optional[Color], Optional[Color]]:
+    sgr_bg = sgr.bg
+    sgr_fg = sgr.fg
+    for bg, fg, text in runs:
+        if bg is not AnyColor and bg != bg_col:
+            append(sgr_bg[bg])
+            bg_col = bg
+        if fg is not AnyColor and fg != fg_col:
+            append(sgr_fg[fg])
+            fg_col = fg
+        append(text)
+    return bg_col, fg_col
+
+# Glyphs that show the same picture when foreground and background are swapped.
+SWAPPED_GLYPHS = str.maketrans('▀▄▌▐▘▟▖▜▝▙▗▛', '▄▀▐▌▟▘▜▖▙▝▛▗')
+SWAPPABLE_GLYPHS = '▀▄▌▐▘▟▖▜▝▙▗▛'
+
+def emit_runs_optimized(append: Callable[[str], Any], runs: Iterable[Run], bg_col: Optional[Color], fg_col: Optional[Color], sgr: SGRTable = TRUECOLOR_SGR) -> tuple[Optional[Color], Optional[Color]]:
+    sgr_bg = sgr.bg
+    sgr_fg = sgr.fg
+    sgr_bg_fg = sgr.bg_fg
+    for bg, fg, text in runs:
+        if not text:
+            continue
+
+        if bg is AnyColor:
+            # full blocks: spaces work just as well if the background fits
+            if fg != fg_col:
+                if fg == bg_col and fg is not None:
+                    text = ' ' * len(text)
+                else:
+                    append(sgr_fg[fg])
+                    fg_col = fg
+
+        elif fg is AnyColor:
+            # spaces: full blocks work just as well if the foreground fits
+            if bg != bg_col:
+                if bg == fg_col and bg is not None:
+                    text = '█' * len(text)
                 else:
-                    new_line.append(LineSegment(col, length, cap))
+                    append(sgr_bg[bg])
+                    bg_col = bg
+
+        elif bg != bg_col:
+            if fg == fg_col:
+                append(sgr_bg[bg])
+                bg_col = bg
+            elif (bg == fg_col and fg == bg_col and bg is not None and fg is not None and
+                    not text.strip(SWAPPABLE_GLYPHS)):
+                text = text.translate(SWAPPED_GLYPHS)
+            else:
+                append(sgr_bg_fg[bg, fg])
+                bg_col = bg
+                fg_col = fg
+
+        elif fg != fg_col:
+            append(sgr_fg[fg])
+            fg_col = fg
+
+        append(text)
+    return bg_col, fg_col
+
+# Tracks the colors currently set in the terminal while drawing. An optimizing
+# emitter keeps that state across lines and flags instead of resetting it after
+# every flag, combines color changes into one SGR sequence and avoids color
+# changes that wouldn't be visible. It has to be finished once all drawing is
+# done. In the palette color modes colors are first mapped to the palette
+# colors, so colors that end up the same don't cause color changes. A None
+# color is the terminal default only until the first SGR sequence, after that
+# it is drawn as black, so dirty records whether a reset is needed.
+class Emitter:
+    __slots__ = ('bg', 'fg', 'dirty', 'optimize', 'color_mode', 'sgr')
+
+    bg: Optional[Color]
+    fg: Optional[Color]
+    dirty: bool
+    optimize: bool
+    color_mode: ColorMode
+    sgr: SGRTable
+
+    def __init__(self, optimize: bool = False, color_mode: ColorMode = ColorMode.TrueColor) -> None:
+        self.bg = None
+        self.fg = None
+        self.dirty = False
+        self.optimize = optimize
+        self.color_mode = color_mode
+        self.sgr = SGR_TABLES[color_mode]
+
+    def emit(self, append: Callable[[str], Any], runs: Iterable[Run]) -> None:
+        if self.color_mode != ColorMode.TrueColor:
+            quantized = self.sgr.quantized
+            runs = [Run(quantized[bg], quantized[fg], text) for bg, fg, text in runs]
+
+        if not self.dirty:
+            # from the reset state only colors other than None cause SGR sequences
+            if not isinstance(runs, (list, tuple)):
+                runs = list(runs)
+            optimize = self.optimize
+            self.dirty = any(
+                (text or not optimize) and (
+                    (bg is not None and bg is not AnyColor) or
+                    (fg is not None and fg is not AnyColor))
+                for bg, fg, text in runs)
+
+        if self.optimize:
+            self.bg, self.fg = emit_runs_optimized(append, runs, self.bg, self.fg, self.sgr)
+        else:
+            self.bg, self.fg = emit_runs(append, runs, self.bg, self.fg, self.sgr)
+
+    def set_bg(self, append: Callable[[str], Any], color: Optional[Color]) -> None:
+        if self.bg != color:
+            append(self.sgr.bg[color])
+            self.bg = color
+            self.dirty = True
+
+    def end_flag(self, append: Callable[[str], Any]) -> None:
+        if not self.optimize:
+            append('\x1B[0m')
+            self.bg = None
+            self.fg = None
+            self.dirty = False
+
+    def finish(self, append: Callable[[str], Any]) -> None:
+        if self.dirty:
+            append('\x1B[0m')
+            self.bg = None
+            self.fg = None
+            self.dirty = False
+
+# What was written for one flag (or in between flags) or compiled in a stage.
+# Cursor moves are CSI cursor sequences and newlines, glyphs are all other
+# characters that aren't part of an escape sequence.
+class ProfileCounters:
+    __slots__ = ('segments', 'sgr', 'cursor_moves', 'glyphs', 'bytes')
+
+    segments: int
+    sgr: int
+    cursor_moves: int
+    glyphs: int
+    bytes: int
+
+    def __init__(self) -> None:
+        self.segments     = 0
+        self.sgr          = 0
+        self.cursor_moves = 0
+        self.glyphs       = 0
+        self.bytes        = 0
+
+    def add(self, other: 'ProfileCounters') -> None:
+        self.segments     += other.segments
+        self.sgr          += other.sgr
+        self.cursor_moves += other.cursor_moves
+        self.glyphs       += other.glyphs
+        self.bytes        += other.bytes
+
+    def as_dict(self) -> dict[str, int]:
+        return {name: getattr(self, name) for name in ProfileCounters.__slots__}
+
+class StageProfile:
+    __slots__ = ('name', 'seconds', 'calls', 'segments')
+
+    name: str
+    seconds: float
+    calls: int
+    segments: int
+
+    def __init__(self, name: str) -> None:
+        self.name     = name
+        self.seconds  = 0.0
+        self.calls    = 0
+        self.segments = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {name: getattr(self, name) for name in StageProfile.__slots__}
+
+# Records the wall time of the stages of the pipeline and counts what is
+# compiled and written per flag while it is installed with set_profiler().
+# Stages run one after the other: entering a stage ends the current one, and
+# stages entered more than once add up. Flags are numbered in the order their
+# flag lists are drawn. on_stage(name, seconds) is called whenever a stage
+# ends. Without an installed profiler the draw functions only check for one
+# once per flag or line.
+class Profiler:
+    __slots__ = ('stages', 'flags', 'between_flags', 'on_stage', '_clock', '_escape', '_stage', '_stage_start', '_current', '_next_flag')
+
+    stages: dict[str, StageProfile]
+    flags: list[ProfileCounters]
+    between_flags: ProfileCounters
+    on_stage: Optional[Callable[[str, float], Any]]
+    _clock: Callable[[], float]
+    _escape: Any
+    _stage: Optional[StageProfile]
+    _stage_start: float
+    _current: ProfileCounters
+    _next_flag: int
+
+    def __init__(self, on_stage: Optional[Callable[[str, float], Any]] = None) -> None:
+        import re
+        from time import perf_counter
+
+        self.stages        = {}
+        self.flags         = []
+        self.between_flags = ProfileCounters()
+        self.on_stage      = on_stage
+        self._clock        = perf_counter
+        self._escape       = re.compile(r'\x1B\[[0-9;?]*([A-Za-z])')
+        self._stage        = None
+        self._stage_start  = 0.0
+        self._current      = self.between_flags
+        self._next_flag    = 0
+
+    def enter(self, name: str) -> None:
+        now = self._clock()
+        self._end_stage(now)
+
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = StageProfile(name)
+        stage.calls += 1
+        self._stage = stage
+        self._stage_start = now
+
+    def leave(self) -> None:
+        self._end_stage(self._clock())
+        self._stage = None
+
+    def _end_stage(self, now: float) -> None:
+        stage = self._stage
+        if stage is not None:
+            seconds = now - self._stage_start
+            stage.seconds += seconds
+            if self.on_stage is not None:
+                self.on_stage(stage.name, seconds)
+
+    # Reserves numbers for a list of count flags and returns the first one.
+    def begin_list(self, count: int) -> int:
+        first = self._next_flag
+        self._next_flag += count
+        flags = self.flags
+        while len(flags) < self._next_flag:
+            flags.append(ProfileCounters())
+        return first
+
+    # The flags numbered first + i were drawn as flag order[i] of their list,
+    # e.g. when the flags were put into rows in a different order.
+    def renumber(self, first: int, order: Sequence[int]) -> None:
+        flags = self.flags
+        drawn = flags[first:first + len(order)]
+        for counters, index in zip(drawn, order):
+            flags[first + index] = counters
+
+    # Counts everything written from now on for the given flag, or for
+    # nothing in particular with None.
+    def select(self, flag_index: Optional[int]) -> None:
+        self._current = self.between_flags if flag_index is None else self.flags[flag_index]
+
+    def count_segments(self, count: int) -> None:
+        self._current.segments += count
+        if self._stage is not None:
+            self._stage.segments += count
+
+    def count_output(self, data: str) -> None:
+        counters = self._current
+        escapes = 0
+        for match in self._escape.finditer(data):
+            command = match.group(1)
+            if command == 'm':
+                counters.sgr += 1
+            elif command in 'ABCDEFGH':
+                counters.cursor_moves += 1
+            escapes += match.end() - match.start()
+
+        newlines = data.count('\n')
+        counters.cursor_moves += newlines
+        counters.glyphs += len(data) - escapes - newlines
+        counters.bytes += len(data.encode())
+
+    def sink(self, out: Sink) -> Sink:
+        if isinstance(out, ProfilingSink):
+            return out
+        return ProfilingSink(out, self)
+
+    def total(self) -> ProfileCounters:
+        total = ProfileCounters()
+        total.add(self.between_flags)
+        for counters in self.flags:
+            total.add(counters)
+        return total
+
+    def as_dict(self, flag_names: Optional[Sequence[str]] = None) -> dict[str, Any]:
+        flags: list[dict[str, Any]] = []
+        for index, counters in enumerate(self.flags):
+            item: dict[str, Any] = {'index': index}
+            if flag_names is not None and index < len(flag_names):
+                item['name'] = flag_names[index]
+            item.update(counters.as_dict())
+            flags.append(item)
+
+        return {
+            'stages': [stage.as_dict() for stage in self.stages.values()],
+            'flags': flags,
+            'between_flags': self.between_flags.as_dict(),
+            'total': self.total().as_dict(),
+        }
+
+    def write_report(self, fp: IO[str], flag_names: Optional[Sequence[str]] = None) -> None:
+        fp.write(f'{"stage":<10} {"ms":>10} {"calls":>6} {"segments":>9}\n')
+        total_seconds = 0.0
+        for stage in self.stages.values():
+            total_seconds += stage.seconds
+            fp.write(f'{stage.name:<10} {stage.seconds * 1000:10.3f} {stage.calls:6} {stage.segments:9}\n')
+        fp.write(f'{"total":<10} {total_seconds * 1000:10.3f}\n\n')
+
+        fp.write(f'{"flag":<20} {"segments":>9} {"sgr":>7} {"moves":>7} {"glyphs":>8} {"bytes":>9}\n')
+        rows: list[tuple[str, ProfileCounters]] = []
+        for index, counters in enumerate(self.flags):
+            name = flag_names[index] if flag_names is not None and index < len(flag_names) else str(index)
+            rows.append((name, counters))
+        rows.append(('(between flags)', self.between_flags))
+        rows.append(('total', self.total()))
+
+        for name, counters in rows:
+            fp.write(f'{name:<20} {counters.segments:9} {counters.sgr:7} {counters.cursor_moves:7} {counters.glyphs:8} {counters.bytes:9}\n')
+
+class ProfilingSink:
+    __slots__ = ('out', 'profiler')
+
+    out: Sink
+    profiler: Profiler
+
+    def __init__(self, out: Sink, profiler: Profiler) -> None:
+        self.out = out
+        self.profiler = profiler
+
+    def append(self, data: str) -> None:
+        self.profiler.count_output(data)
+        self.out.append(data)
+
+_profiler: Optional[Profiler] = None
+
+# Installs a profiler for all rendering in this process, None uninstalls it.
+# Returns the previously installed profiler.
+def set_profiler(profiler: Optional[Profiler]) -> Optional[Profiler]:
+    global _profiler
+    previous = _profiler
+    _profiler = profiler
+    return previous
+
+def get_profiler() -> Optional[Profiler]:
+    return _profiler
+
+def _draw_to(out: Output, draw: Callable[..., Iterator[None]], *args: Any, emitter: Optional[Emitter] = None) -> None:
+    sink = as_sink(out)
+    draw_sink = sink if _profiler is None else _profiler.sink(sink)
+    if isinstance(sink, BytesSink):
+        pending = sink._chunks
+        for _ in draw(draw_sink, *args, emitter=emitter):
+            if len(pending) >= BYTES_FLUSH_FRAGMENTS:
+                sink.flush()
+    else:
+        for _ in draw(draw_sink, *args, emitter=emitter):
+            pass
 
-    return new_flag
+    if emitter is not None:
+        emitter.finish(draw_sink.append)
 
-def draw_flag(buf: list[str], flag: Flag) -> None:
-    bg_col: Optional[Color] = None
-    fg_col: Optional[Color] = None
+    if isinstance(sink, BytesSink) or (isinstance(sink, StreamSink) and sink is not out):
+        sink.flush()
 
-    def set_bg(new_bg: Optional[Color]) -> None:
-        nonlocal bg_col, buf
-        if bg_col != new_bg:
-            if new_bg is None:
-                buf.append(f'\x1B[49m')
-            else:
-                buf.append(f'\x1B[48;2;{new_bg[0]};{new_bg[1]};{new_bg[2]}m')
-            bg_col = new_bg
-
-    def set_fg(new_fg: Optional[Color]) -> None:
-        nonlocal buf, fg_col
-        if fg_col != new_fg:
-            if new_fg is None:
-                buf.append(f'\x1B[38;2;0;0;0m')
-            else:
-                buf.append(f'\x1B[38;2;{new_fg[0]};{new_fg[1]};{new_fg[2]}m')
-            fg_col = new_fg
+# The iter_draw_* functions yield after every line written to the sink, so a
+# caller can flush or otherwise interleave work in between rows. When an
+# emitter is passed to them the caller has to finish it afterwards.
 
-    def set_cols(new_bg: Optional[Color], new_fg: Optional[Color]) -> None:
-        set_bg(new_bg)
-        set_fg(new_fg)
+def iter_draw_compiled_lines(buf: Sink, lines: Iterable[CompiledLine], emitter: Optional[Emitter] = None) -> Iterator[None]:
+    if emitter is None:
+        emitter = Emitter()
+
+    append = buf.append
+    emit = emitter.emit
 
     x = 0
     max_x = 0
-    prev_carry_x = 0
-    is_first = True
-    for flag_line in flag:
+    for line in lines:
         if x > 0:
             move = (x + 1) // 2
             if move > 1:
-                buf.append(f'\x1B[{move}D')
+                append(f'\x1B[{move}D\x1B[B')
             else:
-                buf.append('\x1B[D')
-
-            if not is_first:
-                buf.append('\x1B[B')
+                append('\x1B[D\x1B[B')
 
             if max_x < x:
                 max_x = x
 
-            x = 0
-            prev_carry_x = 0
-        is_first = False
+        emit(append, line.runs)
 
-        for segment_index, segment in enumerate(flag_line):
-            col = segment.color
-            cap = segment.cap
-            length = segment.length
+        x = line.x
+        yield
 
-            if prev_carry_x:
-                length -= 1
+    diff = max_x - x
+    move = diff // 2
+    if move > 1:
+        append(f'\x1B[{move}C')
+    elif move > 0:
+        append('\x1B[C')
 
-            x += length
-            carry_x = x & 1
-            x += carry_x
+    emitter.end_flag(append)
 
-            next_index = segment_index + 1
-            next_col: Optional[Color]
-            if next_index < len(flag_line):
-                next_col = flag_line[next_index].color
-            else:
-                next_col = None
+def draw_compiled_lines(buf: Output, lines: Iterable[CompiledLine], emitter: Optional[Emitter] = None) -> None:
+    _draw_to(buf, iter_draw_compiled_lines, lines, emitter=emitter)
 
-            if cap == LineCap.Square:
-                if length > 0:
-                    if col is None:
-                        set_bg(None)
-                        buf.append(' ' * (length >> 1))
+def iter_draw_flag(buf: Sink, flag: Union[FlagView, CompiledFlag], emitter: Optional[Emitter] = None) -> Iterator[None]:
+    if isinstance(flag, CompiledFlag):
+        return iter_draw_compiled_lines(buf, flag.lines, emitter)
+    else:
+        return iter_draw_compiled_lines(buf, map(compile_line, flag), emitter)
 
-                        if carry_x:
-                            set_cols(next_col, col)
-                            buf.append(' ')
+def draw_flag(buf: Output, flag: Union[FlagView, CompiledFlag], emitter: Optional[Emitter] = None) -> None:
+    _draw_to(buf, iter_draw_flag, flag, emitter=emitter)
 
-                    else:
-                        set_fg(col)
-                        buf.append('█' * (length >> 1))
+def get_flag_width(flag: Union[FlagView, CompiledFlag]) -> int:
+    if isinstance(flag, (CompiledFlag, ScaledFlag, StretchedFlag, PackedFlag)):
+        return flag.width
 
-                        if carry_x:
-                            set_cols(next_col, col)
-                            buf.append('▌')
-
-            elif cap == LineCap.HalfSquare:
-                if length > 0:
-                    if col is None:
-                        set_cols(col, next_col)
-                        buf.append('▀' * (length >> 1))
+    return max(
+        (sum(segment.length for segment in flag_line)
+         for flag_line in flag),
+        default=0)
 
-                        if carry_x:
-                            buf.append('▘')
+# Size and contents of a flag as it is drawn. width is in half characters,
+# colors are the distinct colors it uses (None being transparent) and caps the
+# line caps of its segments. Compiled flags have no segments and caps.
+class FlagMetrics:
+    __slots__ = ('width', 'height', 'segments', 'colors', 'caps')
+
+    width: int
+    height: int
+    segments: int
+    colors: frozenset[Optional[Color]]
+    caps: frozenset[LineCap]
+
+    def __init__(self, width: int, height: int, segments: int, colors: frozenset[Optional[Color]], caps: frozenset[LineCap]) -> None:
+        self.width    = width
+        self.height   = height
+        self.segments = segments
+        self.colors   = colors
+        self.caps     = caps
+
+def measure_flag(flag: Union[FlagView, CompiledFlag]) -> FlagMetrics:
+    colors: set[Optional[Color]] = set()
+    if isinstance(flag, CompiledFlag):
+        for line in flag.lines:
+            for bg, fg, _ in line.runs:
+                colors.add(bg)
+                colors.add(fg)
+        colors.discard(AnyColor)
+        return FlagMetrics(flag.width, len(flag), 0, frozenset(colors), frozenset())
+
+    caps: set[LineCap] = set()
+    width = 0
+    height = 0
+    segments = 0
+    for flag_line in flag:
+        line_width = 0
+        for segment in flag_line:
+            line_width += segment.length
+            colors.add(segment.color)
+            caps.add(segment.cap)
+        if line_width > width:
+            width = line_width
+        segments += len(flag_line)
+        height += 1
+
+    return FlagMetrics(width, height, segments, frozenset(colors), frozenset(caps))
+
+# A raster is a grid of pixels, where a terminal cell is 2 pixels wide and 2
+# or 3 pixels high (cell_rows). None is a transparent pixel.
+Raster = list[list[Optional[Color]]]
+
+# Glyphs for every pixel mask of a cell. Bit 2 * row + column of the mask is
+# set if that pixel has the foreground color.
+QUADRANT_GLYPHS = ' ▘▝▀▖▌▞▛▗▚▐▜▄▙▟█'
+SEXTANT_GLYPHS = ''.join(
+    ' ' if mask == 0 else
+    '▌' if mask == 21 else
+    '▐' if mask == 42 else
+    '█' if mask == 63 else
+    # U+1FB00 to U+1FB3B leave out the masks that already have a block element
+    chr(0x1FB00 + mask - 1 - (mask > 21) - (mask > 42))
+    for mask in range(64))
+
+CELL_GLYPHS = {
+    2: QUADRANT_GLYPHS,
+    3: SEXTANT_GLYPHS,
+}
 
-                    else:
-                        set_cols(next_col, col)
-                        buf.append('▄' * (length >> 1))
+# distance of a transparent pixel to any color, more than any two colors have
+TRANSPARENT_DISTANCE = 2 * color_distance((0, 0, 0), (255, 255, 255))
+
+def pixel_distance(a: Optional[Color], b: Optional[Color]) -> float:
+    if a == b:
+        return 0.0
+    if a is None or b is None:
+        return TRANSPARENT_DISTANCE
+    return color_distance(a, b)
+
+# Samples the middle of every pixel of the flag scaled by scale * cell_rows, so
+# the triangle caps end up as diagonal edges in the raster.
+def rasterize_flag(flag: FlagView, scale: int = 1, cell_rows: int = 3) -> Raster:
+    if cell_rows not in CELL_GLYPHS:
+        raise ValueError(f'illegal cell_rows: {cell_rows}')
+
+    width = get_flag_width(flag) * scale
+    width += width & 1
+
+    raster: Raster = []
+    for flag_line in ScaledFlag(flag, scale * cell_rows):
+        row: list[Optional[Color]] = []
+        append = row.append
+        end = 0
+        for segment in flag_line:
+            end += segment.length
+            # pixel x covers [x * cell_rows, (x + 1) * cell_rows) of the scaled line
+            while len(row) < width and (2 * len(row) + 1) * cell_rows < 2 * end:
+                append(segment.color)
+
+        row.extend([None] * (width - len(row)))
+        raster.append(row)
+
+    return raster
+
+def scale_raster(raster: Raster, scale: int) -> Raster:
+    if scale < 1:
+        raise ValueError(f'illegal scale: {scale}')
 
-                        if carry_x:
-                            buf.append('▖')
+    if scale == 1:
+        return raster
+
+    scaled: Raster = []
+    for row in raster:
+        scaled_row = [pixel for pixel in row for _ in range(scale)]
+        scaled.extend(list(scaled_row) for _ in range(scale))
+    return scaled
+
+def pick_cell(pixels: tuple[Optional[Color], ...]) -> tuple[Optional[Color], Optional[Color], int]:
+    colors = list(dict.fromkeys(pixels))
+    if len(colors) == 1:
+        return colors[0], colors[0], 0
+
+    if len(colors) == 2:
+        bg, fg = colors
+        mask = 0
+        for index, pixel in enumerate(pixels):
+            if pixel == fg:
+                mask |= 1 << index
+        return bg, fg, mask
+
+    # more than two colors: use the pair that approximates the cell best
+    best_error = float('inf')
+    bg = fg = None
+    for index, first in enumerate(colors):
+        for second in colors[index + 1:]:
+            error = sum(min(pixel_distance(pixel, first), pixel_distance(pixel, second)) for pixel in pixels)
+            if error < best_error:
+                best_error = error
+                bg, fg = first, second
+
+    mask = 0
+    for index, pixel in enumerate(pixels):
+        if pixel_distance(pixel, fg) < pixel_distance(pixel, bg):
+            mask |= 1 << index
+    return bg, fg, mask
+
+def cell_run(bg: Optional[Color], fg: Optional[Color], mask: int, glyphs: str) -> tuple[Optional[Color], Optional[Color], str]:
+    full = len(glyphs) - 1
+    if mask == full:
+        bg, fg, mask = fg, bg, 0
+
+    if mask == 0 or fg == bg:
+        return bg, AnyColor, ' '
+
+    if fg is None:
+        # a glyph can only be transparent in its background
+        bg, fg, mask = fg, bg, mask ^ full
+
+    return bg, fg, glyphs[mask]
+
+# Turns every cell into one glyph with a background and foreground color. The
+# result for each distinct cell is computed only once.
+def compile_raster(raster: Raster, cell_rows: int = 3) -> CompiledFlag:
+    glyphs = CELL_GLYPHS.get(cell_rows)
+    if glyphs is None:
+        raise ValueError(f'illegal cell_rows: {cell_rows}')
+
+    width = max((len(row) for row in raster), default=0)
+    width += width & 1
+    padded: Raster = [row + [None] * (width - len(row)) for row in raster]
+    padded.extend([None] * width for _ in range(-len(padded) % cell_rows))
+
+    cells: dict[tuple[Optional[Color], ...], tuple[Optional[Color], Optional[Color], str]] = {}
+    lines: list[CompiledLine] = []
+    for top in range(0, len(padded), cell_rows):
+        rows = padded[top:top + cell_rows]
+        runs: list[Run] = []
+        run_bg: Optional[Color] = None
+        run_fg: Optional[Color] = None
+        text: list[str] = []
+
+        for x in range(0, width, 2):
+            pixels = tuple(pixel for row in rows for pixel in row[x:x + 2])
+            cell = cells.get(pixels)
+            if cell is None:
+                cell = cells[pixels] = cell_run(*pick_cell(pixels), glyphs)
+
+            bg, fg, glyph = cell
+            if text and (bg != run_bg or fg != run_fg):
+                runs.append(Run(run_bg, run_fg, ''.join(text)))
+                text.clear()
+            run_bg = bg
+            run_fg = fg
+            text.append(glyph)
+
+        if text:
+            runs.append(Run(run_bg, run_fg, ''.join(text)))
+
+        lines.append(CompiledLine(tuple(runs), width, width))
+
+    return CompiledFlag(tuple(lines))
+
+def parse_ppm(data: bytes) -> Raster:
+    import struct
+
+    fields: list[bytes] = []
+    pos = 0
+    size = len(data)
+    while len(fields) < 4:
+        while pos < size and data[pos] in b' \t\r\n#':
+            if data[pos] == ord('#'):
+                pos = data.find(b'\n', pos)
+                if pos < 0:
+                    pos = size
+                    break
+            pos += 1
+
+        start = pos
+        while pos < size and data[pos] not in b' \t\r\n#':
+            pos += 1
+
+        if start == pos:
+            raise ValueError('truncated PPM header')
+
+        fields.append(data[start:pos])
+
+    magic = fields[0]
+    if magic not in (b'P3', b'P6'):
+        raise ValueError(f'not a PPM file: {magic!r}')
 
-            else:
-                block_length = max(length - cap.length, 0)
-
-                if block_length > 0:
-                    set_fg(col)
-                    buf.append('█' * (block_length >> 1))
-
-                cap_length = length - block_length
-                if cap_length > 0:
-                    if cap == LineCap.TriDown3:
-                        if carry_x:
-                            set_cols(next_col, col)
-                            if cap_length > 1:
-                                buf.append('🭏')
-                            buf.append('🬼')
-                        else:
-                            set_cols(col, next_col)
-                            if cap_length > 2:
-                                buf.append('🭢')
-                            buf.append('🭕')
-
-                    elif cap == LineCap.TriUp3:
-                        if carry_x:
-                            set_cols(next_col, col)
-                            if cap_length > 1:
-                                buf.append('🭠')
-                            buf.append('🭗')
-                        else:
-                            set_cols(col, next_col)
-                            if cap_length > 2:
-                                buf.append('🭇')
-                            buf.append('🭄')
+    try:
+        width, height, maxval = map(int, fields[1:])
+    except ValueError as exc:
+        raise ValueError(f'illegal PPM header: {b" ".join(fields)!r}') from exc
+
+    if width < 0 or height < 0 or maxval < 1 or maxval > 65535:
+        raise ValueError(f'illegal PPM header: {b" ".join(fields)!r}')
+
+    count = width * height * 3
+    values: Sequence[int]
+    if magic == b'P6':
+        # exactly one whitespace character separates the header from the pixels
+        pos += 1
+        if maxval < 256:
+            values = data[pos:pos + count]
+        else:
+            values = struct.unpack_from(f'>{count}H', data, pos) if pos + 2 * count <= size else ()
+    else:
+        values = [int(value) for value in data[pos:].split()[:count]]
 
-                    elif cap == LineCap.TriDown6:
-                        if carry_x or cap_length & 1:
-                            raise ValueError("LineCap.TriDown6 doesn't support sub-character precision")
+    if len(values) < count:
+        raise ValueError(f'truncated PPM data: expected {count} values, got {len(values)}')
 
-                        if cap_length > 4:
-                            set_cols(next_col, col)
-                            buf.append('🭍')
+    if maxval != 255:
+        values = [value * 255 // maxval for value in values]
 
-                        if cap_length > 2:
-                            set_cols(col, next_col)
-                            buf.append('🭧')
+    raster: Raster = []
+    stride = width * 3
+    for y in range(height):
+        row = values[y * stride:(y + 1) * stride]
+        raster.append(list(zip(row[0::3], row[1::3], row[2::3])))
+    return raster
 
-                        set_cols(next_col, col)
-                        buf.append('🬽')
+def load_ppm(path: str) -> Raster:
+    with open(path, 'rb') as fp:
+        return parse_ppm(fp.read())
 
-                    elif cap == LineCap.TriUp6:
-                        if carry_x or cap_length & 1:
-                            raise ValueError("LineCap.TriUp6 doesn't support sub-character precision")
+class RenderedFlag:
+    __slots__ = ('text', 'width', 'height')
 
-                        if cap_length > 4:
-                            set_cols(next_col, col)
-                            buf.append('🭞')
+    text: str
+    width: int
+    height: int
 
-                        if cap_length > 2:
-                            set_cols(col, next_col)
-                            buf.append('🭆')
+    def __init__(self, text: str, width: int, height: int) -> None:
+        self.text   = text
+        self.width  = width
+        self.height = height
 
-                        set_cols(next_col, col)
-                        buf.append('🭘')
+# Renders a flag on its own, starting out from and returning to the default
+# colors, so the text can be put anywhere.
+def render_flag(flag: Union[FlagView, CompiledFlag], scale: int = 1, column: int = 0, color_mode: ColorMode = ColorMode.TrueColor) -> RenderedFlag:
+    if scale != 1:
+        if isinstance(flag, CompiledFlag):
+            raise ValueError(f'compiled flags can not be scaled: {scale}')
+        flag = ScaledFlag(flag, scale)
 
-                    elif cap == LineCap.TriDown1:
-                        set_cols(next_col, col)
-                        if carry_x:
-                            buf.append('🭀')
-                        else:
-                            buf.append('🭐')
+    buf: list[str] = []
+    if column > 1:
+        buf.append(f'\x1B[{column}C')
+    elif column == 1:
+        buf.append('\x1B[C')
 
-                    elif cap == LineCap.TriUp1:
-                        set_cols(next_col, col)
-                        if carry_x:
-                            buf.append('🭛')
-                        else:
-                            buf.append('🭡')
+    # not drawn with draw_flag(), a profiler would count it as output
+    emitter = Emitter(color_mode=color_mode)
+    for _ in iter_draw_flag(buf, flag, emitter):
+        pass
+    emitter.finish(buf.append)
+
+    return RenderedFlag(''.join(buf), get_flag_width(flag), len(flag))
+
+# Base of the caches: keeps up to maxsize entries and drops the least recently
+# used one when there are more. Lookups count hits and misses.
+class _LRU:
+    maxsize: int
+    hits: int
+    misses: int
+    _entries: OrderedDict[Any, Any]
+
+    def __init__(self, maxsize: int = 256) -> None:
+        if maxsize < 1:
+            raise ValueError(f'illegal maxsize: {maxsize}')
+
+        self.maxsize  = maxsize
+        self.hits     = 0
+        self.misses   = 0
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits   = 0
+        self.misses = 0
+
+    def _get(self, key: Any) -> Any:
+        entries = self._entries
+        value = entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            entries.move_to_end(key)
+            self.hits += 1
+        return value
+
+    def _put(self, key: Any, value: Any) -> None:
+        entries = self._entries
+        entries[key] = value
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+# Content key of a flag for the render and layout caches. Tuples don't keep
+# their hash, so it is computed once per key instead of on every lookup.
+class FlagKey:
+    __slots__ = ('lines', '_hash')
+
+    lines: tuple[tuple[LineSegment, ...], ...]
+    _hash: int
+
+    def __init__(self, lines: tuple[tuple[LineSegment, ...], ...]) -> None:
+        self.lines = lines
+        self._hash = hash(lines)
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other: object) -> bool:
+        return self is other or (isinstance(other, FlagKey) and self._hash == other._hash and self.lines == other.lines)
+
+# Keys of flags by identity, so looking up the same flag again neither builds
+# nor hashes its content. Like with FLAG_METRICS a flag must not be changed
+# after it was drawn through a cache.
+class FlagKeyCache(_LRU):
+    _entries: OrderedDict[int, tuple[FlagView, FlagKey]]
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        super().__init__(maxsize)
+
+    def get(self, flag: FlagView) -> FlagKey:
+        entry = self._get(id(flag))
+        if entry is not None:
+            return entry[1]
+
+        key = FlagKey(tuple(tuple(flag_line) for flag_line in flag))
+        self._put(id(flag), (flag, key))
+        return key
+
+FLAG_KEYS = FlagKeyCache()
+
+def flag_key(flag: FlagView) -> FlagKey:
+    return FLAG_KEYS.get(flag)
+
+# Compiled flags per (flag, horizontal scale, vertical scale), so drawing flags
+# again at a size that was already used, e.g. when a terminal is resized back
+# and forth, skips scaling and compiling.
+class LayoutCache(_LRU):
+    _entries: OrderedDict[tuple[Any, ...], CompiledFlag]
+
+    def compile(self, flag: FlagView, scale_x: float = 1, scale_y: float = 1) -> CompiledFlag:
+        key = (flag_key(flag), scale_x, scale_y)
+        compiled = self._get(key)
+        if compiled is None:
+            compiled = compile_flag(resize_flag(flag, scale_x, scale_y))
+            self._put(key, compiled)
+        return compiled
+
+class RenderCache(_LRU):
+    _entries: OrderedDict[tuple[Any, ...], RenderedFlag]
+
+    def render(self, flag: FlagView, scale: int = 1, column: int = 0, color_mode: ColorMode = ColorMode.TrueColor) -> RenderedFlag:
+        key = (flag_key(flag), scale, column, color_mode)
+        rendered = self._get(key)
+        if rendered is None:
+            rendered = render_flag(flag, scale, column, color_mode)
+            self._put(key, rendered)
+        return rendered
+
+    def draw(self, buf: Sink, flag: FlagView, scale: int = 1, column: int = 0, color_mode: ColorMode = ColorMode.TrueColor) -> None:
+        buf.append(self.render(flag, scale, column, color_mode).text)
+
+# Metrics per (flag, scale), so laying out the same flags again doesn't scale
+# them just to find out how wide they are. Flags are looked up by identity, so
+# a flag must not be changed after it was measured. The cache holds on to the
+# flags, which keeps their ids from being reused.
+class MetricsCache(_LRU):
+    _entries: OrderedDict[tuple[int, int], tuple[Union[FlagView, CompiledFlag], FlagMetrics]]
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        super().__init__(maxsize)
+
+    def get(self, flag: Union[FlagView, CompiledFlag], scale: int = 1) -> FlagMetrics:
+        key = (id(flag), scale)
+        entry = self._get(key)
+        if entry is not None:
+            return entry[1]
+
+        if scale == 1:
+            metrics = measure_flag(flag)
+        elif isinstance(flag, CompiledFlag):
+            raise ValueError(f'compiled flags can not be scaled: {scale}')
+        else:
+            metrics = measure_flag(ScaledFlag(flag, scale))
 
-                    else:
-                        raise ValueError(f'unhadled LineCap value: {cap}')
+        self._put(key, (flag, metrics))
+        return metrics
 
-            prev_carry_x = carry_x
+FLAG_METRICS = MetricsCache()
 
-    diff = max_x - x
-    move = diff // 2
-    if move > 1:
-        buf.append(f'\x1B[{move}C')
-    elif move > 0:
-        buf.append('\x1B[C')
+# Flags are only scaled and rendered in a process pool when the output has at
+# least that many characters, below that starting the pool takes longer than
+# the rendering itself.
+PARALLEL_THRESHOLD = 500_000
 
-    buf.append('\x1B[0m')
+def count_cells(flags: Sequence[Union[FlagView, CompiledFlag]], scale: int = 1) -> int:
+    total = 0
+    for flag in flags:
+        metrics = FLAG_METRICS.get(flag)
+        total += ((metrics.width + 1) >> 1) * metrics.height
+    return total * scale * scale
+
+def use_parallel_rendering(flags: Sequence[Union[FlagView, CompiledFlag]], scale: int, jobs: int) -> bool:
+    return jobs > 1 and len(flags) > 1 and count_cells(flags, scale) >= PARALLEL_THRESHOLD
+
+def _compile_flag_job(flag: Union[FlagView, CompiledFlag], scale: int) -> CompiledFlag:
+    if isinstance(flag, CompiledFlag):
+        return flag
+    return compile_flag(ScaledFlag(flag, scale) if scale != 1 else flag)
+
+def _map_flags(func: Callable[..., Any], flags: Sequence[Any], jobs: int, *args: Any) -> list[Any]:
+    from concurrent.futures import ProcessPoolExecutor
+    from itertools import repeat
+
+    jobs = min(jobs, len(flags))
+    chunksize = max(len(flags) // (jobs * 4), 1)
+    with ProcessPoolExecutor(jobs) as pool:
+        return list(pool.map(func, flags, *[repeat(arg) for arg in args], chunksize=chunksize))
+
+# Scales and renders (or compiles) the flags in a pool of jobs processes.
+# The results are in the order of the flags.
+def render_flags_parallel(flags: Sequence[Union[FlagView, CompiledFlag]], scale: int = 1, jobs: int = 2, color_mode: ColorMode = ColorMode.TrueColor) -> list[RenderedFlag]:
+    return _map_flags(render_flag, flags, jobs, scale, 0, color_mode)
+
+def compile_flags_parallel(flags: Sequence[Union[FlagView, CompiledFlag]], scale: int = 1, jobs: int = 2) -> list[CompiledFlag]:
+    check_compiled_scale(flags, scale)
+    return _map_flags(_compile_flag_job, flags, jobs, scale)
+
+# Compiled flags are already scaled, so they can only be drawn at scale 1.
+def check_compiled_scale(flags: Sequence[Union[FlagView, CompiledFlag]], scale: int) -> None:
+    if scale != 1 and any(isinstance(flag, CompiledFlag) for flag in flags):
+        raise ValueError(f'compiled flags can not be scaled: {scale}')
+
+def scale_flags(flags: Sequence[Union[FlagView, CompiledFlag]], scale: int) -> list[ScaledFlag]:
+    scaled: list[ScaledFlag] = []
+    for flag in flags:
+        if isinstance(flag, CompiledFlag):
+            raise ValueError(f'compiled flags can not be scaled: {scale}')
+        scaled.append(ScaledFlag(flag, scale))
+    return scaled
+
+# Compiled flags bypass the render cache, they would only be keyed by identity.
+def render_cached(cache: RenderCache, flag: Union[FlagView, CompiledFlag], scale: int = 1, color_mode: ColorMode = ColorMode.TrueColor) -> RenderedFlag:
+    if isinstance(flag, CompiledFlag):
+        return render_flag(flag, 1, 0, color_mode)
+    return cache.render(flag, scale, 0, color_mode)
+
+def iter_draw_flag_list(buf: Sink, flags: Sequence[Union[FlagView, CompiledFlag]], column: int = 0, scale: int = 1, cache: Optional[RenderCache] = None, emitter: Optional[Emitter] = None) -> Iterator[None]:
+    if not flags:
+        return
 
-def get_flag_width(flag: Flag) -> int:
-    return max(
-        (sum(segment.length for segment in flag_line)
-         for flag_line in flag),
-        default=0)
+    check_compiled_scale(flags, scale)
 
-def draw_flag_list(buf: list[str], flags: list[Flag], column: int = 0) -> None:
-    if not flags:
+    if cache is not None:
+        if emitter is not None and emitter.optimize:
+            raise ValueError('the render cache is not supported with an optimizing emitter')
+        color_mode = emitter.color_mode if emitter is not None else ColorMode.TrueColor
+        yield from iter_draw_rendered_flag_list(buf, [render_cached(cache, flag, scale, color_mode) for flag in flags], column, emitter)
         return
 
+    if emitter is None:
+        emitter = Emitter()
+
+    profiler = _profiler
+    first_flag = 0
+    if profiler is not None:
+        buf = profiler.sink(buf)
+        first_flag = profiler.begin_list(len(flags))
+
+    if scale != 1:
+        flags = scale_flags(flags, scale)
+
     max_size = max(len(flag) for flag in flags)
     newlines = max_size - 1
 
-    buf.append('\n' * newlines)
-    buf.append(f'\x1B[{newlines}A')
+    if newlines > 0:
+        # don't let the terminal fill scrolled in lines with the background
+        emitter.set_bg(buf.append, None)
+        buf.append('\n' * newlines)
+        buf.append(f'\x1B[{newlines}A')
 
     if column > 1:
         buf.append(f'\x1B[{column}C')
     elif column == 1:
         buf.append(f'\x1B[C')
 
-    for flag in flags[:-1]:
-        draw_flag(buf, flag)
-        buf.append(f'\x1B[{len(flag) - 1}A\x1B[2C')
+    for index, flag in enumerate(flags[:-1], first_flag):
+        if profiler is not None:
+            profiler.select(index)
+        yield from iter_draw_flag(buf, flag, emitter)
+        if profiler is not None:
+            profiler.select(None)
+
+        lines_up = len(flag) - 1
+        if lines_up > 0:
+            buf.append(f'\x1B[{lines_up}A\x1B[2C')
+        else:
+            buf.append('\x1B[2C')
 
     flag = flags[-1]
-    draw_flag(buf, flag)
+    if profiler is not None:
+        profiler.select(first_flag + len(flags) - 1)
+    yield from iter_draw_flag(buf, flag, emitter)
+    if profiler is not None:
+        profiler.select(None)
+
     diff_lines = max_size - len(flag)
     if diff_lines > 0:
         buf.append(f'\x1B[{diff_lines}B')
 
-def draw_wrapped_flag_list(buf: list[str], flags: list[Flag], scale: int = 1) -> None:
+def draw_flag_list(buf: Output, flags: Sequence[Union[FlagView, CompiledFlag]], column: int = 0, scale: int = 1, cache: Optional[RenderCache] = None, emitter: Optional[Emitter] = None) -> None:
+    _draw_to(buf, iter_draw_flag_list, flags, column, scale, cache, emitter=emitter)
+
+def iter_draw_rendered_flag_list(buf: Sink, rendered: list[RenderedFlag], column: int = 0, emitter: Optional[Emitter] = None) -> Iterator[None]:
+    if not rendered:
+        return
+
+    profiler = _profiler
+    first_flag = 0
+    if profiler is not None:
+        buf = profiler.sink(buf)
+        first_flag = profiler.begin_list(len(rendered))
+
+    # rendered flags start out from and return to the default colors
+    if emitter is not None:
+        emitter.finish(buf.append)
+
+    max_size = max(item.height for item in rendered)
+    newlines = max_size - 1
+
+    if newlines > 0:
+        buf.append('\n' * newlines)
+        buf.append(f'\x1B[{newlines}A')
+
+    if column > 1:
+        buf.append(f'\x1B[{column}C')
+    elif column == 1:
+        buf.append(f'\x1B[C')
+
+    for index, item in enumerate(rendered[:-1], first_flag):
+        if profiler is not None:
+            profiler.select(index)
+            buf.append(item.text)
+            profiler.select(None)
+        else:
+            buf.append(item.text)
+
+        lines_up = item.height - 1
+        if lines_up > 0:
+            buf.append(f'\x1B[{lines_up}A\x1B[2C')
+        else:
+            buf.append('\x1B[2C')
+        yield
+
+    item = rendered[-1]
+    if profiler is not None:
+        profiler.select(first_flag + len(rendered) - 1)
+        buf.append(item.text)
+        profiler.select(None)
+    else:
+        buf.append(item.text)
+    diff_lines = max_size - item.height
+    if diff_lines > 0:
+        buf.append(f'\x1B[{diff_lines}B')
+    yield
+
+def draw_rendered_flag_list(buf: Output, rendered: list[RenderedFlag], column: int = 0, emitter: Optional[Emitter] = None) -> None:
+    _draw_to(buf, iter_draw_rendered_flag_list, rendered, column, emitter=emitter)
+
+# Draws the flags row by row: terminal row 0 of every flag, then row 1 and so
+# on, using only plain newlines and no relative cursor movement.
+def iter_draw_flag_list_rows(buf: Sink, flags: Sequence[Union[FlagView, CompiledFlag]], column: int = 0, scale: int = 1, emitter: Optional[Emitter] = None) -> Iterator[None]:
     if not flags:
         return
 
-    try:
-        term_width = get_terminal_size().columns
-    except:
-        return draw_flag_list(buf, flags)
+    check_compiled_scale(flags, scale)
+
+    if emitter is None:
+        emitter = Emitter()
+
+    profiler = _profiler
+    first_flag = 0
+    if profiler is not None:
+        buf = profiler.sink(buf)
+        first_flag = profiler.begin_list(len(flags))
+
+    compiled: list[CompiledFlag] = []
+    for index, flag in enumerate(flags, first_flag):
+        if not isinstance(flag, CompiledFlag):
+            if scale != 1:
+                flag = ScaledFlag(flag, scale)
+            if profiler is not None:
+                profiler.select(index)
+                flag = compile_flag(flag)
+                profiler.select(None)
+            else:
+                flag = compile_flag(flag)
+        compiled.append(flag)
+
+    flag_cells = [max((line.x for line in flag.lines), default=0) >> 1 for flag in compiled]
+    max_size = max(len(flag) for flag in compiled)
+
+    append = buf.append
+    emit = emitter.emit
+    set_bg = emitter.set_bg
+
+    for row in range(max_size):
+        if row:
+            set_bg(append, None)
+            append('\n')
+
+        # Blank cells are only skipped once something visible follows them,
+        # either with CHA (absolute column) or with spaces, whichever is
+        # shorter.
+        x = 0
+        pending = column
+        for index, flag in enumerate(compiled):
+            if index:
+                pending += 2
+
+            cells = flag_cells[index]
+            if row < len(flag.lines):
+                line = flag.lines[row]
+                if line.runs:
+                    if pending:
+                        x += pending
+                        move = f'\x1B[{x + 1}G'
+                        if len(move) < pending + (5 if emitter.bg is not None else 0):
+                            append(move)
+                        else:
+                            set_bg(append, None)
+                            append(' ' * pending)
+                        pending = 0
+
+                    if profiler is not None:
+                        profiler.select(first_flag + index)
+                        emit(append, line.runs)
+                        profiler.select(None)
+                    else:
+                        emit(append, line.runs)
+                    line_cells = line.x >> 1
+                    x += line_cells
+                    cells -= line_cells
+            pending += cells
 
-    if scale != 1:
-        flags = [scale_flag(flag, scale) for flag in flags]
+        yield
+
+    emitter.end_flag(append)
 
-    bucket: list[Flag] = []
+def draw_flag_list_rows(buf: Output, flags: Sequence[Union[FlagView, CompiledFlag]], column: int = 0, scale: int = 1, emitter: Optional[Emitter] = None) -> None:
+    _draw_to(buf, iter_draw_flag_list_rows, flags, column, scale, emitter=emitter)
+
+# Splits flags of the given widths (in half characters) into rows that fit
+# into term_width characters, with two characters between flags. Yields the
+# start and end index of the flags of every row and the indent that centers
+# the row.
+def wrap_flag_widths(widths: Sequence[int], term_width: int) -> Iterator[tuple[int, int, int]]:
+    start = 0
     current_width = 0
-    for flag in flags:
-        width = get_flag_width(flag)
+    for index, width in enumerate(widths):
         width = (width + 1) // 2
         next_width = current_width + width
         if current_width:
             next_width += 2
 
-        if bucket and next_width > term_width:
-            indent = (term_width - current_width) // 2
-            draw_flag_list(buf, bucket, indent)
-            #buf.append(f'\x1B[{current_width}D\x1B[3B')
-            #buf.append(f'\x1B[3B')
-            buf.append(f'\n\n')
-
-            bucket.clear()
+        if index > start and next_width > term_width:
+            yield start, index, (term_width - current_width) // 2
+            start = index
             current_width = width
         else:
             current_width = next_width
-        bucket.append(flag)
 
-    if bucket:
-        indent = (term_width - current_width) // 2
-        draw_flag_list(buf, bucket, indent)
+    if start < len(widths):
+        yield start, len(widths), (term_width - current_width) // 2
+
+# How flags are split into rows:
+#
+#     greedy    fill every row from left to right in the given order
+#     balanced  keep the order, but break the rows so that they take up the
+#               fewest terminal lines
+#     packed    put the flags on shelves by height, tallest first, each flag
+#               on the first shelf it fits onto (first fit decreasing height),
+#               unless keeping the order takes up fewer lines
+#
+# Ties are broken by the number of rows, every row costing a few bytes of
+# newlines and cursor movement.
+class WrapMode(Enum):
+    Greedy   = 'greedy'
+    Balanced = 'balanced'
+    Packed   = 'packed'
+
+class FlagLayout:
+    __slots__ = ('order', 'rows', 'height')
+
+    order: list[int]                 # indices of the flags in the order they are drawn
+    rows: list[tuple[int, int, int]] # start and end into order and indent of every row
+    height: int                      # terminal lines, including the blank lines between rows
+
+    def __init__(self, order: list[int], rows: list[tuple[int, int, int]], height: int) -> None:
+        self.order  = order
+        self.rows   = rows
+        self.height = height
+
+def _row_width(widths: Sequence[int], indices: Iterable[int]) -> int:
+    row_width = -2
+    for index in indices:
+        row_width += ((widths[index] + 1) // 2) + 2
+    return max(row_width, 0)
+
+def _layout_height(heights: Sequence[int], order: Sequence[int], rows: Sequence[tuple[int, int, int]]) -> int:
+    height = 0
+    for start, end, _ in rows:
+        height += max(heights[index] for index in order[start:end])
+    return height + len(rows) - 1 if rows else 0
+
+def _balance_rows(widths: Sequence[int], heights: Sequence[int], term_width: int) -> list[tuple[int, int, int]]:
+    # best[end] is the cost (lines, rows) of laying out the first end flags,
+    # a row being as many flags as fit ending at end - 1
+    count = len(widths)
+    best: list[tuple[int, int]] = [(0, 0)]
+    starts: list[int] = [0]
+    for end in range(1, count + 1):
+        row_width = -2
+        row_height = 0
+        best_cost = (sys.maxsize, 0)
+        best_start = end - 1
+        for start in range(end - 1, -1, -1):
+            row_width += ((widths[start] + 1) // 2) + 2
+            if row_width > term_width and start < end - 1:
+                break
+
+            if heights[start] > row_height:
+                row_height = heights[start]
+
+            lines, row_count = best[start]
+            cost = (lines + row_height + 1, row_count + 1)
+            if cost < best_cost:
+                best_cost = cost
+                best_start = start
+
+        best.append(best_cost)
+        starts.append(best_start)
+
+    rows: list[tuple[int, int, int]] = []
+    end = count
+    while end > 0:
+        start = starts[end]
+        rows.append((start, end, (term_width - _row_width(widths, range(start, end))) // 2))
+        end = start
+    rows.reverse()
+    return rows
+
+def _pack_shelves(widths: Sequence[int], heights: Sequence[int], term_width: int) -> list[list[int]]:
+    shelves: list[list[int]] = []
+    shelf_widths: list[int] = []
+    for index in sorted(range(len(widths)), key=lambda index: -heights[index]):
+        width = (widths[index] + 1) // 2
+        for shelf_index, shelf_width in enumerate(shelf_widths):
+            if shelf_width + 2 + width <= term_width:
+                shelves[shelf_index].append(index)
+                shelf_widths[shelf_index] = shelf_width + 2 + width
+                break
+        else:
+            shelves.append([index])
+            shelf_widths.append(width)
+
+    # flags on the same shelf stay in their original order
+    for shelf in shelves:
+        shelf.sort()
+
+    return shelves
+
+# Lays out flags of the given widths (in half characters) and heights into
+# rows that fit into term_width characters, with two characters between flags
+# and a blank line between rows, like wrap_flag_widths() does for the greedy
+# mode.
+def layout_flags(widths: Sequence[int], heights: Sequence[int], term_width: int, wrap: WrapMode = WrapMode.Greedy) -> FlagLayout:
+    if len(widths) != len(heights):
+        raise ValueError(f'got {len(widths)} widths, but {len(heights)} heights')
+
+    order = list(range(len(widths)))
+    if wrap == WrapMode.Greedy:
+        rows = list(wrap_flag_widths(widths, term_width))
+        return FlagLayout(order, rows, _layout_height(heights, order, rows))
+
+    rows = _balance_rows(widths, heights, term_width)
+    layout = FlagLayout(order, rows, _layout_height(heights, order, rows))
+
+    if wrap == WrapMode.Packed:
+        packed_order: list[int] = []
+        packed_rows: list[tuple[int, int, int]] = []
+        for shelf in _pack_shelves(widths, heights, term_width):
+            start = len(packed_order)
+            packed_order.extend(shelf)
+            packed_rows.append((start, len(packed_order), (term_width - _row_width(widths, shelf)) // 2))
+
+        packed = FlagLayout(packed_order, packed_rows, _layout_height(heights, packed_order, packed_rows))
+        if (packed.height, len(packed.rows)) < (layout.height, len(layout.rows)):
+            layout = packed
+
+    elif wrap != WrapMode.Balanced:
+        raise ValueError(f'unhandled WrapMode value: {wrap}')
+
+    return layout
+
+# With jobs > 1 big flag lists are scaled and rendered in a process pool (see
+# PARALLEL_THRESHOLD) and only put together in this process. The output is
+# the same as without. wrap selects how the flags are split into rows (see
+# WrapMode), the packed mode may draw them in a different order.
+def iter_draw_wrapped_flag_list(buf: Sink, flags: Sequence[Union[FlagView, CompiledFlag]], scale: int = 1, cache: Optional[RenderCache] = None, row_major: bool = False, width: Optional[int] = None, emitter: Optional[Emitter] = None, jobs: int = 1, wrap: WrapMode = WrapMode.Greedy) -> Iterator[None]:
+    if not flags:
+        return
 
-def load_flag_from_path(path: str) -> Flag:
-    with open(path, 'r') as fp:
-        data = json.load(fp)
-    return load_flag_from_json(data)
+    if row_major and cache is not None:
+        raise ValueError('the render cache is not supported for the row-major layout')
+
+    check_compiled_scale(flags, scale)
+
+    if emitter is None:
+        emitter = Emitter()
+    elif emitter.optimize and cache is not None:
+        # rendered flags start out from the default colors, the optimizing
+        # emitter carries the colors over from one flag to the next
+        raise ValueError('the render cache is not supported with an optimizing emitter')
+
+    profiler = _profiler
+    if profiler is not None:
+        buf = profiler.sink(buf)
+        profiler.enter('layout')
+
+    rendered: Optional[list[RenderedFlag]] = None
+    if cache is None and use_parallel_rendering(flags, scale, jobs):
+        if row_major or emitter.optimize or any(isinstance(flag, CompiledFlag) for flag in flags):
+            # the optimizing emitter depends on the colors of the flag before
+            flags = compile_flags_parallel(flags, scale, jobs)
+            scale = 1
+        else:
+            rendered = render_flags_parallel(flags, scale, jobs, emitter.color_mode)
+
+    term_width: int
+    if width is not None:
+        term_width = width
+    else:
+        try:
+            term_width = get_terminal_size().columns
+        except:
+            if profiler is not None:
+                profiler.enter('draw')
+
+            if rendered is not None:
+                yield from iter_draw_rendered_flag_list(buf, rendered, 0, emitter)
+            elif row_major:
+                yield from iter_draw_flag_list_rows(buf, flags, 0, scale, emitter)
+            else:
+                yield from iter_draw_flag_list(buf, flags, 0, scale, cache, emitter)
+
+            if profiler is not None:
+                profiler.leave()
+            return
+
+    items: Any
+    widths: list[int]
+    heights: list[int]
+    iter_draw_list: Callable[..., Iterator[None]]
+    if rendered is not None:
+        items = rendered
+        widths = [item.width for item in rendered]
+        heights = [item.height for item in rendered]
+        iter_draw_list = iter_draw_rendered_flag_list
+    elif row_major:
+        items = [flag if isinstance(flag, CompiledFlag) else compile_flag(ScaledFlag(flag, scale) if scale != 1 else flag) for flag in flags]
+        widths = [flag.width for flag in items]
+        heights = [len(flag) for flag in items]
+        iter_draw_list = iter_draw_flag_list_rows
+    elif cache is not None:
+        items = [render_cached(cache, flag, scale, emitter.color_mode) for flag in flags]
+        widths = [item.width for item in items]
+        heights = [item.height for item in items]
+        iter_draw_list = iter_draw_rendered_flag_list
+    else:
+        # compiled flags know their size, keeping their metrics would only
+        # push other flags out of the cache
+        metrics = [flag if isinstance(flag, CompiledFlag) else FLAG_METRICS.get(flag, scale) for flag in flags]
+        if scale != 1:
+            flags = scale_flags(flags, scale)
+        items = flags
+        widths = [item.width for item in metrics]
+        heights = [item.height if isinstance(item, FlagMetrics) else len(item) for item in metrics]
+        iter_draw_list = iter_draw_flag_list
+
+    rows: Iterable[tuple[int, int, int]]
+    order: Optional[list[int]] = None
+    if wrap == WrapMode.Greedy:
+        rows = wrap_flag_widths(widths, term_width)
+        if profiler is not None:
+            # wrapping is part of the layout, not of drawing
+            rows = list(rows)
+    else:
+        layout = layout_flags(widths, heights, term_width, wrap)
+        rows = layout.rows
+        order = layout.order
+        items = [items[index] for index in order]
+
+    first_flag = 0
+    if profiler is not None:
+        first_flag = len(profiler.flags)
+        profiler.enter('draw')
+
+    for start, end, indent in rows:
+        if start:
+            emitter.set_bg(buf.append, None)
+            buf.append(f'\n\n')
+
+        yield from iter_draw_list(buf, items[start:end], indent, emitter=emitter)
+
+    if profiler is not None:
+        if order is not None:
+            profiler.renumber(first_flag, order)
+        profiler.leave()
+
+def draw_wrapped_flag_list(buf: Output, flags: Sequence[Union[FlagView, CompiledFlag]], scale: int = 1, cache: Optional[RenderCache] = None, row_major: bool = False, width: Optional[int] = None, emitter: Optional[Emitter] = None, jobs: int = 1, wrap: WrapMode = WrapMode.Greedy) -> None:
+    _draw_to(buf, partial(iter_draw_wrapped_flag_list, jobs=jobs, wrap=wrap), flags, scale, cache, row_major, width, emitter=emitter)
+
+class ChunkSink:
+    __slots__ = ('chunks', 'size')
+
+    chunks: list[str]
+    size: int
+
+    def __init__(self) -> None:
+        self.chunks = []
+        self.size = 0
+
+    def append(self, data: str) -> None:
+        self.chunks.append(data)
+        self.size += len(data)
+
+    def take(self) -> str:
+        data = ''.join(self.chunks)
+        self.chunks.clear()
+        self.size = 0
+        return data
+
+if TYPE_CHECKING:
+    class AsyncWriter(Protocol):
+        def write(self, data: bytes) -> None: ...
+        async def drain(self) -> None: ...
+
+ASYNC_CHUNK_SIZE = 16 * 1024
+
+# Async version of draw_wrapped_flag_list() for use in an asyncio event loop.
+# Flags are scaled (or compiled, or rendered into the cache) one at a time and
+# rows are collected into chunks of at least chunk_size characters. Control
+# is given back to the event loop after every flag and every chunk, so big
+# flags don't block it for long.
+async def iter_render_flags(flags: Sequence[Union[FlagView, CompiledFlag]], scale: int = 1, cache: Optional[RenderCache] = None, row_major: bool = False, width: Optional[int] = None, emitter: Optional[Emitter] = None, chunk_size: int = ASYNC_CHUNK_SIZE, wrap: WrapMode = WrapMode.Greedy) -> AsyncIterator[str]:
+    import asyncio
+
+    check_compiled_scale(flags, scale)
+
+    if emitter is None:
+        emitter = Emitter()
+
+    prepared: list[Union[FlagView, CompiledFlag]] = []
+    for flag in flags:
+        if cache is not None:
+            if not isinstance(flag, CompiledFlag):
+                cache.render(flag, scale, 0, emitter.color_mode)
+        elif isinstance(flag, CompiledFlag):
+            pass
+        elif row_major:
+            flag = compile_flag(ScaledFlag(flag, scale) if scale != 1 else flag)
+        else:
+            # measuring scales every line once, the layout then finds the
+            # metrics of the flag at this scale in the cache
+            FLAG_METRICS.get(flag, scale)
+        prepared.append(flag)
+        await asyncio.sleep(0)
+
+    if cache is None and row_major:
+        scale = 1
+
+    sink = ChunkSink()
+    for _ in iter_draw_wrapped_flag_list(sink, prepared, scale, cache, row_major, width, emitter, wrap=wrap):
+        if sink.size >= chunk_size:
+            yield sink.take()
+            await asyncio.sleep(0)
+
+    emitter.finish(sink.append)
+    if sink.size:
+        yield sink.take()
+
+# Writes the flags to an asyncio.StreamWriter (or anything with write() and
+# drain()), waiting for the writer to drain after every chunk.
+async def render_flags(writer: AsyncWriter, flags: Sequence[Union[FlagView, CompiledFlag]], scale: int = 1, cache: Optional[RenderCache] = None, row_major: bool = False, width: Optional[int] = None, emitter: Optional[Emitter] = None, chunk_size: int = ASYNC_CHUNK_SIZE, wrap: WrapMode = WrapMode.Greedy) -> None:
+    async for chunk in iter_render_flags(flags, scale, cache, row_major, width, emitter, chunk_size, wrap):
+        writer.write(chunk.encode())
+        await writer.drain()
+
+# A cell of the screen: glyph, foreground and background color. Full blocks
+# are stored as spaces with the block's color as background and spaces don't
+# care about the foreground, so cells that look the same compare equal.
+Cell = tuple[str, Optional[Color], Optional[Color]]
+
+BLANK_CELL: Cell = (' ', AnyColor, None)
+
+# Never equal to any cell, marks cells with unknown content on the screen.
+UNKNOWN_CELL: Cell = ('', None, None)
+
+def cursor_move(row: int, column: int, to_row: int, to_column: int) -> str:
+    # absolute position, row and column are -1 when the cursor position isn't known
+    if to_column:
+        move = f'\x1B[{to_row + 1};{to_column + 1}H'
+    elif to_row:
+        move = f'\x1B[{to_row + 1}H'
+    else:
+        move = '\x1B[H'
+
+    if row < 0 or column < 0:
+        return move
+
+    candidates = [move]
+    if row == to_row:
+        candidates.append(f'\x1B[{to_column + 1}G')
+        diff = to_column - column
+        if diff > 1:
+            candidates.append(f'\x1B[{diff}C')
+        elif diff == 1:
+            candidates.append('\x1B[C')
+    elif to_row > row:
+        diff = to_row - row
+        if to_column == column:
+            candidates.append(f'\x1B[{diff}B' if diff > 1 else '\x1B[B')
+        elif to_column == 0:
+            candidates.append('\r\n' * diff)
+
+    return min(candidates, key=len)
+
+def cell_runs(cells: Iterable[Cell]) -> list[Run]:
+    runs: list[Run] = []
+    glyphs: list[str] = []
+    run_fg: Optional[Color] = None
+    run_bg: Optional[Color] = None
+    for glyph, fg, bg in cells:
+        if glyphs and (fg != run_fg or bg != run_bg):
+            runs.append(Run(run_bg, run_fg, ''.join(glyphs)))
+            glyphs.clear()
+        run_fg = fg
+        run_bg = bg
+        glyphs.append(glyph)
+
+    if glyphs:
+        runs.append(Run(run_bg, run_fg, ''.join(glyphs)))
+
+    return runs
+
+# A frame of flags that is composed in a grid of cells starting at the top
+# left corner of the terminal. present() only writes the cells that differ
+# from what the previous call wrote, so redrawing a frame where just a few
+# flags changed is cheap. The terminal is assumed to be blank at first, after
+# anything else wrote to it invalidate() makes the next present() write every
+# cell again.
+class ScreenBuffer:
+    __slots__ = ('width', 'height', 'color_mode', 'layouts', 'cells', '_screen', '_quantized')
+
+    width: int
+    height: int
+    color_mode: ColorMode
+    layouts: Optional[LayoutCache]
+    cells: list[Cell]
+    _screen: list[Cell]
+    _quantized: dict[Optional[Color], Optional[Color]]
+
+    def __init__(self, width: int, height: int, color_mode: ColorMode = ColorMode.TrueColor, layouts: Optional[LayoutCache] = None) -> None:
+        self.color_mode = color_mode
+        self.layouts = layouts
+        self._quantized = SGR_TABLES[color_mode].quantized
+        self.resize(width, height)
+
+    # The caller has to clear the terminal as well.
+    def resize(self, width: int, height: int) -> None:
+        if width < 1 or height < 1:
+            raise ValueError(f'illegal screen size: {width}x{height}')
+
+        self.width   = width
+        self.height  = height
+        self.cells   = [BLANK_CELL] * (width * height)
+        self._screen = [BLANK_CELL] * (width * height)
+
+    def clear(self) -> None:
+        self.cells = [BLANK_CELL] * (self.width * self.height)
+
+    def invalidate(self) -> None:
+        self._screen = [UNKNOWN_CELL] * (self.width * self.height)
+
+    def compile(self, flag: Union[FlagView, CompiledFlag], scale: int = 1) -> CompiledFlag:
+        if isinstance(flag, CompiledFlag):
+            return flag
+
+        if self.layouts is not None:
+            return self.layouts.compile(flag, scale, scale)
+
+        return compile_flag(ScaledFlag(flag, scale) if scale != 1 else flag)
+
+    # Returns the width in characters and the height of the flag.
+    def put_flag(self, row: int, column: int, flag: Union[FlagView, CompiledFlag], scale: int = 1) -> tuple[int, int]:
+        compiled = self.compile(flag, scale)
+        width = self.width
+        cells = self.cells
+        quantized = self._quantized
+
+        for line_row, line in enumerate(compiled.lines, row):
+            if line_row < 0 or line_row >= self.height:
+                continue
+
+            offset = line_row * width
+            x = column
+            for bg, fg, text in line.runs:
+                if bg is not AnyColor:
+                    bg = quantized[bg]
+                if fg is not AnyColor:
+                    fg = quantized[fg]
+
+                for glyph in text:
+                    if 0 <= x < width:
+                        if glyph == '█':
+                            cells[offset + x] = (' ', AnyColor, fg)
+                        elif glyph == ' ':
+                            cells[offset + x] = (' ', AnyColor, bg)
+                        else:
+                            cells[offset + x] = (glyph, fg, bg)
+                    x += 1
+
+        return max((line.x for line in compiled.lines), default=0) >> 1, len(compiled)
+
+    # Same layout as draw_flag_list(). Returns the height of the row of flags.
+    def put_flag_list(self, row: int, column: int, flags: Sequence[Union[FlagView, CompiledFlag]], scale: int = 1) -> int:
+        height = 0
+        for flag in flags:
+            flag_width, flag_height = self.put_flag(row, column, flag, scale)
+            column += flag_width + 2
+            if flag_height > height:
+                height = flag_height
+        return height
+
+    # Same layout as draw_wrapped_flag_list() for the width of the buffer.
+    # Returns the number of rows used.
+    def put_wrapped_flag_list(self, flags: Sequence[Union[FlagView, CompiledFlag]], scale: int = 1, row: int = 0, wrap: WrapMode = WrapMode.Greedy) -> int:
+        compiled = [self.compile(flag, scale) for flag in flags]
+        layout = layout_flags([flag.width for flag in compiled], [len(flag) for flag in compiled], self.width, wrap)
+        compiled = [compiled[index] for index in layout.order]
+        top = row
+        for start, end, indent in layout.rows:
+            if start:
+                row += 1
+            row += self.put_flag_list(row, max(indent, 0), compiled[start:end])
+        return row - top
+
+    # Yields after every row of the screen that was written to.
+    def iter_present(self, buf: Sink, emitter: Optional[Emitter] = None) -> Iterator[None]:
+        own_emitter = emitter is None
+        if emitter is None:
+            emitter = Emitter(optimize=True, color_mode=self.color_mode)
+
+        append = buf.append
+        emit = emitter.emit
+        width = self.width
+        cells = self.cells
+        screen = self._screen
+
+        cursor_row = -1
+        cursor_column = -1
+        for row in range(self.height):
+            start = row * width
+            end = start + width
+            if cells[start:end] == screen[start:end]:
+                continue
+
+            span: list[Cell] = []
+            span_end = 0
+            for column in range(width):
+                index = start + column
+                cell = cells[index]
+                if cell == screen[index]:
+                    continue
+
+                if span and column > span_end:
+                    # Unchanged cells in between are written again when that
+                    # is shorter than moving over them and needs no color change.
+                    gap = cells[start + span_end:index]
+                    _, last_fg, last_bg = span[-1]
+                    if (sum(len(glyph.encode()) for glyph, _, _ in gap) <= len(cursor_move(row, span_end, row, column)) and
+                            all((fg is AnyColor or fg == last_fg) and (bg is AnyColor or bg == last_bg) for _, fg, bg in gap)):
+                        span.extend(gap)
+                    else:
+                        emit(append, cell_runs(span))
+                        cursor_row = row
+                        cursor_column = span_end
+                        span = []
+
+                if not span:
+                    if cursor_row != row or cursor_column != column:
+                        append(cursor_move(cursor_row, cursor_column, row, column))
+
+                span.append(cell)
+                span_end = column + 1
+
+            emit(append, cell_runs(span))
+            cursor_row = row
+            # the cursor stays in the last column after writing to it
+            cursor_column = min(span_end, width - 1)
+
+            screen[start:end] = cells[start:end]
+            yield
+
+        if own_emitter:
+            emitter.finish(append)
+
+    def present(self, out: Output, emitter: Optional[Emitter] = None) -> None:
+        _draw_to(out, self.iter_present, emitter=emitter)
+
+class Animation(Enum):
+    Wave   = 'wave'
+    Scroll = 'scroll'
+
+WAVE_AMPLITUDE  = 2  # characters
+WAVE_LENGTH     = 8  # rows
+WAVE_PERIOD     = 24 # frames
+MAX_FRAME_CACHE = 256
+
+# Frames of an animation as cell grids for a ScreenBuffer. The animations
+# repeat after period frames, so a frame is only made when it is first needed
+# and then kept in a ring of up to cache_size frames, indexed by the phase of
+# the frame. With a cache_size of 0 every frame is made when it is needed.
+class FrameRing:
+    __slots__ = ('width', 'height', 'period', 'make', 'hits', 'misses', '_frames')
+
+    width: int
+    height: int
+    period: int
+    make: Callable[[int], list[Cell]]
+    hits: int
+    misses: int
+    _frames: list[Optional[tuple[int, list[Cell]]]]
+
+    def __init__(self, width: int, height: int, period: int, make: Callable[[int], list[Cell]], cache_size: int = MAX_FRAME_CACHE) -> None:
+        if period < 1:
+            raise ValueError(f'illegal period: {period}')
+
+        if cache_size < 0:
+            raise ValueError(f'illegal cache_size: {cache_size}')
+
+        self.width   = width
+        self.height  = height
+        self.period  = period
+        self.make    = make
+        self.hits    = 0
+        self.misses  = 0
+        self._frames = [None] * min(period, cache_size)
+
+    def __len__(self) -> int:
+        return self.period
+
+    def __getitem__(self, index: int) -> list[Cell]:
+        phase = index % self.period
+        if not self._frames:
+            self.misses += 1
+            return self.make(phase)
+
+        slot = phase % len(self._frames)
+        entry = self._frames[slot]
+        if entry is not None and entry[0] == phase:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        frame = self.make(phase)
+        self._frames[slot] = (phase, frame)
+        return frame
+
+def animate_flags(flags: Sequence[Union[FlagView, CompiledFlag]], animation: Animation, width: int, scale: int = 1, color_mode: ColorMode = ColorMode.TrueColor, layouts: Optional[LayoutCache] = None, wrap: WrapMode = WrapMode.Greedy) -> FrameRing:
+    from math import sin, pi
+
+    canvas = ScreenBuffer(1, 1, color_mode, layouts)
+    compiled = [canvas.compile(flag, scale) for flag in flags]
+
+    if animation == Animation.Wave:
+        # The flags are laid out as usual and every row is shifted to the
+        # right by up to two times the amplitude, following a sine wave that
+        # travels down the rows.
+        amplitude = min(WAVE_AMPLITUDE, (width - 1) // 2)
+        canvas_width = width - 2 * amplitude
+        height = layout_flags([flag.width for flag in compiled], [len(flag) for flag in compiled], canvas_width, wrap).height
+
+        canvas.resize(canvas_width, max(height, 1))
+        canvas.put_wrapped_flag_list(compiled, wrap=wrap)
+        rows = [canvas.cells[index:index + canvas_width] for index in range(0, len(canvas.cells), canvas_width)]
+
+        def make_wave(phase: int) -> list[Cell]:
+            cells: list[Cell] = []
+            for row_index, row in enumerate(rows):
+                offset = round(amplitude + amplitude * sin(2 * pi * (row_index / WAVE_LENGTH - phase / WAVE_PERIOD)))
+                cells += [BLANK_CELL] * offset
+                cells += row
+                cells += [BLANK_CELL] * (2 * amplitude - offset)
+            return cells
+
+        return FrameRing(width, canvas.height, WAVE_PERIOD, make_wave)
+
+    elif animation == Animation.Scroll:
+        # All flags in one long row that scrolls to the left by one character
+        # per frame and wraps around.
+        strip_width = sum((max((line.x for line in flag.lines), default=0) >> 1) + 2 for flag in compiled)
+        strip_width = max(strip_width, width, 1)
+        height = max((len(flag) for flag in compiled), default=1)
+
+        canvas.resize(strip_width, max(height, 1))
+        canvas.put_flag_list(0, 0, compiled)
+        # every row twice, so a frame is one slice per row
+        rows = [canvas.cells[index:index + strip_width] * 2 for index in range(0, len(canvas.cells), strip_width)]
+
+        def make_scroll(phase: int) -> list[Cell]:
+            cells: list[Cell] = []
+            for row in rows:
+                cells += row[phase:phase + width]
+            return cells
+
+        # the period is the width of the strip, usually more frames than are
+        # worth keeping, and slicing the rows is about as fast as a copy of a
+        # kept frame anyway
+        return FrameRing(width, canvas.height, strip_width, make_scroll, 0)
+
+    else:
+        raise ValueError(f'unhandled Animation value: {animation}')
+
+# Shows the frames on the alternate screen at a steady rate until count frames
+# were shown or it is interrupted with Ctrl+C. Frames are scheduled on the
+# monotonic clock, when drawing falls behind the frames whose time has already
+# passed are dropped instead of slowing down the animation. Returns the number
+# of shown and dropped frames.
+def play(fp: IO[str], frames: FrameRing, fps: float = 30, height: Optional[int] = None, emitter: Optional[Emitter] = None, count: Optional[int] = None) -> tuple[int, int]:
+    from time import monotonic, sleep
+
+    if fps <= 0:
+        raise ValueError(f'illegal frame rate: {fps}')
+
+    if height is None or height > frames.height:
+        height = frames.height
+
+    color_mode = emitter.color_mode if emitter is not None else ColorMode.TrueColor
+    screen = ScreenBuffer(frames.width, height, color_mode)
+    size = frames.width * height
+    interval = 1 / fps
+    shown = 0
+    dropped = 0
+    frame = 0
+
+    # CSI ? 1049 h   Save cursor and switch to the alternate screen buffer
+    # CSI ? 25 l     Hide cursor
+    # CSI H, CSI 2 J Cursor to home position and erase display
+    fp.write('\x1B[?1049h\x1B[?25l\x1B[H\x1B[2J')
+    try:
+        start = monotonic()
+        while count is None or shown + dropped < count:
+            screen.cells[:] = frames[frame][:size]
+            buf: list[str] = []
+            screen.present(buf, emitter)
+            fp.write(''.join(buf))
+            fp.flush()
+            shown += 1
+            frame += 1
+
+            now = monotonic()
+            late = int((now - start) / interval) - frame
+            if late > 0:
+                if count is not None:
+                    late = min(late, count - shown - dropped)
+                dropped += late
+                frame += late
+
+            delay = start + frame * interval - now
+            if delay > 0:
+                sleep(delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fp.write('\x1B[0m\x1B[?25h\x1B[?1049l')
+        fp.flush()
+
+    return shown, dropped
+
+MAX_REPORTED_ERRORS = 20
+
+# Raised once per document with every problem that was found in it. The loader
+# used to raise a TypeError or a ValueError depending on the problem, so it is
+# both.
+class FlagLoadError(ValueError, TypeError):
+    errors: list[str]
+
+    def __init__(self, errors: list[str]) -> None:
+        message = '\n'.join(errors[:MAX_REPORTED_ERRORS])
+        if len(errors) > MAX_REPORTED_ERRORS:
+            message += f'\n... and {len(errors) - MAX_REPORTED_ERRORS} more errors'
+        super().__init__(message)
+        self.errors = errors
+
+# On-disk cache of already validated flags, see load_flag_from_path(). A cache
+# file consists of a header (FLAG_CACHE_HEADER) followed by the buffers of the
+# PackedFlag:
+#
+#     line_offsets  uint32[line_count + 1]
+#     lengths       uint32[segment_count]
+#     colors        uint16 or uint32[segment_count] (see color_size in the header)
+#     caps          uint8[segment_count]
+#     palette       uint8[palette_size * 3]
+#
+# Everything is in native byte order. Files written with a different byte
+# order, version or for a different source file are simply treated as stale.
+FLAG_CACHE_MAGIC     = b'TFLC'
+FLAG_CACHE_VERSION   = 2
+FLAG_CACHE_BYTEORDER = 1 if sys.byteorder == 'little' else 2
+FLAG_CACHE_HEADER    = '=4sBBBxqQ16sIII'
+
+COLOR_TYPECODES = {2: 'H', 4: 'I'}
+
+def flag_cache_path(cache_dir: str, path: str) -> str:
+    import hashlib
+    name = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:32]
+    return os.path.join(cache_dir, f'{name}.flag')
+
+# Writes the parts to a file under a temporary name first and then renames it,
+# so concurrent readers never see a partial file.
+def _atomic_write(path: str, parts: Iterable[Union[bytes, bytearray, memoryview, array]]) -> None:
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as fp:
+            for part in parts:
+                fp.write(part)
+        os.replace(tmp_path, path)
+    except:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def write_flag_cache(cache_path: str, flag: FlagView, mtime_ns: int, size: int, digest: bytes) -> None:
+    packed = PackedFlag.from_flag(flag)
+    colors = packed.colors
+
+    palette_data = bytearray()
+    for color in packed.palette:
+        if color is None:
+            # not possible in flags loaded from JSON files
+            raise ValueError('flags without color can not be cached')
+        palette_data += bytes(color)
+
+    import struct
+
+    header = struct.pack(FLAG_CACHE_HEADER,
+        FLAG_CACHE_MAGIC, FLAG_CACHE_VERSION, FLAG_CACHE_BYTEORDER, colors.itemsize,
+        mtime_ns, size, digest, len(packed.palette), len(packed), len(packed.lengths))
+
+    _atomic_write(cache_path, [header, packed.line_offsets, packed.lengths, colors, packed.caps, palette_data])
+
+def read_flag_cache(cache_path: str, mtime_ns: int, size: int, digest: bytes) -> Optional[PackedFlag]:
+    import mmap
+    import struct
+
+    try:
+        with open(cache_path, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _decode_flag_cache(data, mtime_ns, size, digest)
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+
+def _decode_flag_cache(data: mmap.mmap, mtime_ns: int, size: int, digest: bytes) -> Optional[PackedFlag]:
+    from array import array
+    import struct
+
+    (magic, version, byteorder, color_size, cached_mtime_ns, cached_size, cached_digest,
+     palette_size, line_count, segment_count) = struct.unpack_from(FLAG_CACHE_HEADER, data)
+    header_size = struct.calcsize(FLAG_CACHE_HEADER)
+
+    if magic != FLAG_CACHE_MAGIC or version != FLAG_CACHE_VERSION or byteorder != FLAG_CACHE_BYTEORDER:
+        return None
+
+    if cached_mtime_ns != mtime_ns or cached_size != size or cached_digest != digest:
+        return None
+
+    lengths_offset = header_size + 4 * (line_count + 1)
+    colors_offset  = lengths_offset + 4 * segment_count
+    caps_offset    = colors_offset  + color_size * segment_count
+    palette_offset = caps_offset    + segment_count
+    if len(data) != palette_offset + 3 * palette_size:
+        return None
+
+    line_offsets = array('I')
+    lengths = array('I')
+    colors  = array(COLOR_TYPECODES[color_size])
+    caps    = array('B')
+
+    with memoryview(data) as view:
+        line_offsets.frombytes(view[header_size:lengths_offset])
+        lengths.frombytes(view[lengths_offset:colors_offset])
+        colors.frombytes(view[colors_offset:caps_offset])
+        caps.frombytes(view[caps_offset:palette_offset])
+        palette_data = bytes(view[palette_offset:])
+
+    if line_offsets[0] != 0 or list(line_offsets) != sorted(line_offsets):
+        return None
+
+    if max(colors, default=0) >= palette_size or not all(cap in LineCapValues for cap in set(caps)):
+        return None
+
+    palette: list[Optional[Color]] = list(zip(palette_data[0::3], palette_data[1::3], palette_data[2::3]))
+
+    return PackedFlag(line_offsets, lengths, caps, colors, palette)
+
+# When a cache directory is given a pre-validated binary copy of the flag is
+# kept there, keyed by the path, modification time, size and content hash of
+# the JSON file, so later loads skip parsing and validation.
+def load_flag_from_path(path: str, cache_dir: Optional[str] = None) -> Flag:
+    import json
+    import hashlib
+
+    if cache_dir is None:
+        with open(path, 'r') as fp:
+            data = json.load(fp)
+        return load_flag_from_json(data)
+
+    with open(path, 'rb') as fp:
+        stat = os.fstat(fp.fileno())
+        content = fp.read()
+
+    digest = hashlib.blake2b(content, digest_size=16).digest()
+    cache_path = flag_cache_path(cache_dir, path)
+
+    packed = read_flag_cache(cache_path, stat.st_mtime_ns, stat.st_size, digest)
+    if packed is not None:
+        return packed.to_flag()
+
+    flag = load_flag_from_json(json.loads(content))
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        write_flag_cache(cache_path, flag, stat.st_mtime_ns, stat.st_size, digest)
+    except (OSError, OverflowError):
+        # the cache is only an optimization, the flag itself loaded fine
+        pass
+
+    return flag
+
+def _load_int(value: Any) -> Optional[int]:
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    elif isinstance(value, int):
+        return value
+    return None
+
+def _load_color(errors: list[str], color_data: Any, line_index: int, segment_index: int) -> Optional[Color]:
+    if not isinstance(color_data, (tuple, list)):
+        errors.append(f'expected sequence at .flag[{line_index}][{segment_index}][0]: {type(color_data).__name__}')
+        return None
+
+    if len(color_data) != 3:
+        errors.append(f'expected sequence of length 3 at .flag[{line_index}][{segment_index}][0]: {len(color_data)}')
+        return None
+
+    color: list[int] = []
+    for color_index, val in enumerate(color_data):
+        ival = _load_int(val)
+        if ival is None:
+            errors.append(f'expected integer at .flag[{line_index}][{segment_index}][0][{color_index}]: {val!r}')
+        elif ival < 0 or ival > 255:
+            errors.append(f'value out of range at .flag[{line_index}][{segment_index}][0][{color_index}]: {val!r}')
+        else:
+            color.append(ival)
+
+    if len(color) != 3:
+        return None
+
+    r, g, b = color
+    return (r, g, b)
+
+def _load_length(errors: list[str], length: Any, line_index: int, segment_index: int) -> Optional[int]:
+    ilength = _load_int(length)
+    if ilength is None:
+        errors.append(f'expected integer at .flag[{line_index}][{segment_index}][1]: {length!r}')
+        return None
+
+    if ilength < 0:
+        errors.append(f'value out of range at .flag[{line_index}][{segment_index}][1]: {length!r}')
+        return None
+
+    return ilength
+
+def _load_cap(errors: list[str], cap_data: Any, line_index: int, segment_index: int) -> Optional[LineCap]:
+    if isinstance(cap_data, str):
+        cap = LineCapMap.get(cap_data.lower())
+        if cap is None:
+            errors.append(f'illegal value at .flag[{line_index}][{segment_index}][2]: {cap_data!r}')
+        return cap
+
+    icap = _load_int(cap_data)
+    if icap is None:
+        errors.append(f'expected integer or string at .flag[{line_index}][{segment_index}][2]: {cap_data!r}')
+        return None
+
+    cap = LineCapValues.get(icap)
+    if cap is None:
+        errors.append(f'value out of range at .flag[{line_index}][{segment_index}][2]: {cap_data!r}')
+    return cap
 
 def load_flag_from_json(data: Any) -> Flag:
     if not isinstance(data, dict):
-        raise TypeError(f'expected mapping at root: {type(data).__name__}')
+        raise FlagLoadError([f'expected mapping at root: {type(data).__name__}'])
 
     flag_data = data.get('flag')
     if not isinstance(flag_data, list):
-        raise TypeError(f'expected sequence at .flag: {type(flag_data).__name__}')
+        raise FlagLoadError([f'expected sequence at .flag: {type(flag_data).__name__}'])
+
+    # The common case (a list of a list of three ints, an int and a cap name or
+    # value) is checked with dict lookups and exact type tests only. Everything
+    # else falls through to the _load_* helpers, which also do the error
+    # reporting. Every distinct color is only validated once.
+    errors: list[str] = []
+    colors: dict[tuple[int, int, int], Color] = {}
+    caps = LineCapValues
 
     flag: Flag = []
     for line_index, line_data in enumerate(flag_data):
         if not isinstance(line_data, list):
-            raise TypeError(f'expected sequence at .flag[{line_index}]: {type(line_data).__name__}')
-        
+            errors.append(f'expected sequence at .flag[{line_index}]: {type(line_data).__name__}')
+            continue
+
         line: list[LineSegment] = []
+        append = line.append
         for segment_index, segment_data in enumerate(line_data):
-            if isinstance(segment_data, (tuple, list)):
-                if len(segment_data) != 3:
-                    raise ValueError(f'expected sequence of length 3 at .flag[{line_index}][{segment_index}]: {len(segment_data)}')
-
-                color_data, length, cap_data = segment_data
-
-                if not isinstance(color_data, (tuple, list)):
-                    raise TypeError(f'expected sequence at .flag[{line_index}][{segment_index}]: {type(color_data).__name__}')
-
-                if len(color_data) != 3:
-                    raise ValueError(f'expected sequence of length 3 at .flag[{line_index}][{segment_index}][0]: {len(color_data)}')
-
-                for color_index, val in enumerate(color_data):
-                    if isinstance(val, float):
-                        if float(int(val)) != val:
-                            raise TypeError(f'expected integer at .flag[{line_index}][{segment_index}][0][{color_index}]: {val}')
-                    elif not isinstance(val, int):
-                        raise TypeError(f'expected integer at .flag[{line_index}][{segment_index}][0][{color_index}]: {val}')
-
-                    if val < 0 or val > 255:
-                        raise TypeError(f'value out of range at .flag[{line_index}][{segment_index}][0][{color_index}]: {val}')
-
-                color = tuple(map(int, color_data))
-
-                if isinstance(length, float):
-                    ilength = int(length)
-                    if float(ilength) != length:
-                        raise TypeError(f'expected integer at .flag[{line_index}][{segment_index}][1]: {length}')
-                    length = ilength
-                elif not isinstance(length, int):
-                    raise TypeError(f'expected integer at .flag[{line_index}][{segment_index}][1]: {length}')
-
-                if length < 0:
-                    raise TypeError(f'value out of range at .flag[{line_index}][{segment_index}][1]: {length}')
-
-                if isinstance(cap_data, float):
-                    icap = int(cap_data)
-                    if float(icap) != cap_data:
-                        raise TypeError(f'expected integer at .flag[{line_index}][{segment_index}][2]: {cap_data}')
-                    try:
-                        cap = LineCap(icap)
-                    except ValueError as exc:
-                        raise ValueError(f'value out of range at .flag[{line_index}][{segment_index}][2]: {cap_data}') from exc
-                elif isinstance(cap_data, int):
-                    try:
-                        cap = LineCap(cap_data)
-                    except ValueError as exc:
-                        raise ValueError(f'value out of range at .flag[{line_index}][{segment_index}][2]: {cap_data}') from exc
-                elif isinstance(cap_data, str):
-                    lower_cap = cap_data.lower()
-                    try:
-                        cap = LineCapMap[lower_cap]
-                    except KeyError as exc:
-                        raise ValueError(f'illegal value of range at .flag[{line_index}][{segment_index}][2]: {cap_data}') from exc
-                else:
-                    raise TypeError(f'expected integer or string at .flag[{line_index}][{segment_index}][2]: {cap_data}')
+            if isinstance(segment_data, LineSegment):
+                append(segment_data)
+                continue
 
-                line.append(LineSegment(color, length, cap))
-            elif isinstance(segment_data, LineSegment):
-                line.append(segment_data)
-            else:
-                raise TypeError(f'expected sequence or LineSegment at .flag[{line_index}][{segment_index}]: {type(segment_data).__name__}')
+            if not isinstance(segment_data, (tuple, list)):
+                errors.append(f'expected sequence or LineSegment at .flag[{line_index}][{segment_index}]: {type(segment_data).__name__}')
+                continue
+
+            if len(segment_data) != 3:
+                errors.append(f'expected sequence of length 3 at .flag[{line_index}][{segment_index}]: {len(segment_data)}')
+                continue
+
+            color_data, length, cap_data = segment_data
+
+            color: Optional[Color] = None
+            if type(color_data) is list:
+                try:
+                    color = colors.get(tuple(color_data))
+                except TypeError:
+                    pass
+
+            if color is None:
+                color = _load_color(errors, color_data, line_index, segment_index)
+                if color is not None:
+                    colors[color] = color
+
+            if type(length) is not int or length < 0:
+                length = _load_length(errors, length, line_index, segment_index)
+
+            try:
+                cap = caps.get(cap_data)
+            except TypeError:
+                cap = None
+
+            if cap is None:
+                cap = _load_cap(errors, cap_data, line_index, segment_index)
+
+            if color is not None and length is not None and cap is not None:
+                append(LineSegment(color, length, cap))
+
+        flag.append(line)
+
+    if errors:
+        raise FlagLoadError(errors)
 
     return flag
 
-def parse_scale(value: str) -> int:
+def get_flag(flag_name: str) -> Flag:
+    norm_flag_name = flag_name.lower().replace('_', '-')
     try:
-        scale = int(value, 10)
+        return FLAGS.get(norm_flag_name) or FLAG_ALIASES[norm_flag_name]
+    except KeyError as exc:
+        raise ValueError(f'unknown flag name: {flag_name}') from exc
+
+def resolve_flags(flag_names: Iterable[str], cache_dir: Optional[str] = None) -> list[Flag]:
+    flags: list[Flag] = []
+    for flag_name in flag_names:
+        if flag_name == 'all':
+            flags.extend(FLAGS.values())
+        elif '/' in flag_name or '\\' in flag_name or '.' in flag_name:
+            flags.append(load_flag_from_path(flag_name, cache_dir))
+        else:
+            flags.append(get_flag(flag_name))
+    return flags
+
+# Watch mode: the flags are drawn on the alternate screen and drawn again,
+# with a single write, every time the terminal is resized. render(columns)
+# returns the whole output for a terminal width. SIGWINCH, SIGINT and SIGTERM
+# are blocked and waited for with sigwait(), so no resize is lost between two
+# draws.
+def can_watch() -> bool:
+    import signal
+    return hasattr(signal, 'SIGWINCH') and hasattr(signal, 'sigwait')
+
+def watch(fp: IO[str], render: Callable[[int], str]) -> None:
+    import signal
+
+    signals = {signal.SIGWINCH, signal.SIGINT, signal.SIGTERM}
+    old_mask = signal.pthread_sigmask(signal.SIG_BLOCK, signals)
+
+    # CSI ? 1049 h   Save cursor and switch to the alternate screen buffer
+    # CSI ? 25 l     Hide cursor
+    fp.write('\x1B[?1049h\x1B[?25l')
+    try:
+        while True:
+            try:
+                # pseudo terminals that never got a size report 0 columns
+                columns = get_terminal_size(fp.fileno()).columns or 80
+            except (OSError, ValueError):
+                columns = 80
+
+            # CSI H  Cursor to home position, CSI 2 J  Erase display
+            fp.write('\x1B[H\x1B[2J' + render(columns))
+            fp.flush()
+
+            if signal.sigwait(signals) != signal.SIGWINCH:
+                break
+    finally:
+        fp.write('\x1B[0m\x1B[?25h\x1B[?1049l')
+        fp.flush()
+        signal.pthread_sigmask(signal.SIG_SETMASK, old_mask)
+
+def is_ppm_path(flag_name: str) -> bool:
+    return flag_name.lower().endswith(('.ppm', '.pnm'))
+
+# Resolves flag names like resolve_flags(), but also accepts PPM images and
+# returns everything compiled at the given scale. With raster=True flags are
+# drawn from a raster with sextant characters instead of their line caps.
+def resolve_compiled_flags(flag_names: Iterable[str], scale: int = 1, raster: bool = False, cache_dir: Optional[str] = None) -> list[CompiledFlag]:
+    compiled: list[CompiledFlag] = []
+    for flag_name in flag_names:
+        if is_ppm_path(flag_name):
+            compiled.append(compile_raster(scale_raster(load_ppm(flag_name), scale)))
+            continue
+
+        for flag in resolve_flags([flag_name], cache_dir):
+            if raster:
+                compiled.append(compile_raster(rasterize_flag(flag, scale)))
+            else:
+                compiled.append(compile_flag(ScaledFlag(flag, scale) if scale != 1 else flag))
+    return compiled
+
+def parse_scale_list(value: str) -> list[int]:
+    from argparse import ArgumentTypeError
+
+    scales: list[int] = []
+    for item in value.split(','):
+        try:
+            scale = int(item, 10)
+        except ValueError as exc:
+            raise ArgumentTypeError(f"expected comma separated integers: {value!r}") from exc
+        if scale < 1 or scale > 0xFFFF:
+            raise ArgumentTypeError(f"must be between 1 and 65535: {item!r}")
+        scales.append(scale)
+    return scales
+
+def parse_color_mode_list(value: str) -> list[ColorMode]:
+    from argparse import ArgumentTypeError
+
+    try:
+        return [ColorMode(item) for item in value.split(',')]
     except ValueError as exc:
-        raise ArgumentTypeError(f"expected integer: {value!r}") from exc
+        raise ArgumentTypeError(f"expected comma separated color modes (truecolor, 256, 16): {value!r}") from exc
 
-    if scale < 1:
-        raise ArgumentTypeError(f"must be >= 1: {scale}")
+# Returns an int for uniform integer scales, which are drawn exactly like
+# before, and a FlagScale for fractional ("2.5") or non-uniform ("3x2") ones.
+def parse_scale(value: str) -> Union[int, FlagScale]:
+    from argparse import ArgumentTypeError
+
+    parts = value.lower().split('x')
+    if len(parts) > 2:
+        raise ArgumentTypeError(f"expected number or WIDTHxHEIGHT: {value!r}")
+
+    try:
+        scales = [float(part) for part in parts]
+    except ValueError as exc:
+        raise ArgumentTypeError(f"expected number or WIDTHxHEIGHT: {value!r}") from exc
+
+    for scale in scales:
+        if not scale > 0 or scale == float('inf'):
+            raise ArgumentTypeError(f"must be > 0: {value!r}")
+
+    scale_x = scales[0]
+    scale_y = scales[-1]
+    if scale_x == scale_y and scale_x.is_integer():
+        return int(scale_x)
+
+    return FlagScale(scale_x, scale_y)
+
+# Asset pack of pre-rendered flags, so they can be shown without running any
+# Python code. A pack file consists of a header (PACK_HEADER), an index of
+# entries and the rendered flags:
+#
+#     entry    PACK_ENTRY, followed by the color mode and the flag name in UTF-8
+#
+# Every entry points to the byte range of a flag rendered at one scale in one
+# color mode, which is exactly what the command line tool writes for that
+# flag when its output isn't a terminal. Entries of aliases point to the same
+# bytes. Everything is little-endian, so packs can be built on one machine and
+# used on others.
+PACK_MAGIC   = b'TFPK'
+PACK_VERSION = 1
+PACK_HEADER  = '<4sBxxxII' # magic, version, entry count, index size
+PACK_ENTRY   = '<QQHBB'    # offset, size, scale, color mode size, name size
+
+class PackEntry:
+    __slots__ = ('name', 'scale', 'color_mode', 'offset', 'size')
+
+    name: str
+    scale: int
+    color_mode: ColorMode
+    offset: int
+    size: int
+
+    def __init__(self, name: str, scale: int, color_mode: ColorMode, offset: int, size: int) -> None:
+        self.name       = name
+        self.scale      = scale
+        self.color_mode = color_mode
+        self.offset     = offset
+        self.size       = size
+
+def render_pack_entry(flag: FlagView, scale: int = 1, color_mode: ColorMode = ColorMode.TrueColor, optimize: bool = False) -> bytes:
+    sink = BytesSink()
+    # CSI ?  7 l     No Auto-Wrap Mode (DECAWM), VT100.
+    sink.append("\x1B[?25l")
+    draw_flag_list(sink, [flag], 0, scale, None, Emitter(optimize=optimize, color_mode=color_mode))
+    # CSI ?  7 h     Auto-Wrap Mode (DECAWM), VT100
+    sink.append("\x1B[?25h\n\n")
+    sink.flush()
+    return bytes(sink.data)
+
+def write_flag_pack(path: str, flags: Iterable[tuple[str, FlagView]], scales: Iterable[int] = (1,), color_modes: Iterable[ColorMode] = (ColorMode.TrueColor,), optimize: bool = False) -> list[PackEntry]:
+    import struct
+
+    scales = list(scales)
+    color_modes = list(color_modes)
+
+    for scale in scales:
+        if scale < 1 or scale > 0xFFFF:
+            raise ValueError(f'illegal scale: {scale}')
+
+    index: list[tuple[str, int, ColorMode, int]] = []
+    chunks: list[bytes] = []
+    chunk_indices: dict[tuple[int, int, ColorMode], int] = {}
+    for name, flag in flags:
+        for scale in scales:
+            for color_mode in color_modes:
+                # aliases are the same flag objects and share their data
+                key = (id(flag), scale, color_mode)
+                chunk_index = chunk_indices.get(key)
+                if chunk_index is None:
+                    chunk_index = chunk_indices[key] = len(chunks)
+                    chunks.append(render_pack_entry(flag, scale, color_mode, optimize))
+                index.append((name, scale, color_mode, chunk_index))
+
+    entry_size = struct.calcsize(PACK_ENTRY)
+    index_size = sum(entry_size + len(color_mode.value.encode()) + len(name.encode()) for name, _, color_mode, _ in index)
+
+    chunk_offsets: list[int] = []
+    offset = struct.calcsize(PACK_HEADER) + index_size
+    for chunk in chunks:
+        chunk_offsets.append(offset)
+        offset += len(chunk)
+
+    entries = [
+        PackEntry(name, scale, color_mode, chunk_offsets[chunk_index], len(chunks[chunk_index]))
+        for name, scale, color_mode, chunk_index in index
+    ]
+
+    parts: list[bytes] = [struct.pack(PACK_HEADER, PACK_MAGIC, PACK_VERSION, len(entries), index_size)]
+    for entry in entries:
+        mode_data = entry.color_mode.value.encode()
+        name_data = entry.name.encode()
+        parts.append(struct.pack(PACK_ENTRY, entry.offset, entry.size, entry.scale, len(mode_data), len(name_data)))
+        parts.append(mode_data)
+        parts.append(name_data)
+    parts.extend(chunks)
+    _atomic_write(path, parts)
+
+    return entries
+
+# Reads a pack written by write_flag_pack() through mmap, only the index is
+# parsed when opening it.
+class FlagPack:
+    __slots__ = ('entries', '_index', '_file', '_data')
+
+    entries: list[PackEntry]
+    _index: dict[tuple[str, int, ColorMode], PackEntry]
+    _file: IO[bytes]
+    _data: mmap.mmap
+
+    def __init__(self, path: str) -> None:
+        import mmap
+        import struct
+
+        self._file = open(path, 'rb')
+        try:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self.entries = _decode_pack_index(self._data)
+            except (ValueError, UnicodeDecodeError, struct.error) as exc:
+                self._data.close()
+                raise ValueError(f'not a valid flag pack: {path}') from exc
+        except:
+            self._file.close()
+            raise
+
+        self._index = {(entry.name, entry.scale, entry.color_mode): entry for entry in self.entries}
+
+    def __enter__(self) -> 'FlagPack':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._data.close()
+        self._file.close()
+
+    def get(self, name: str, scale: int = 1, color_mode: ColorMode = ColorMode.TrueColor) -> bytes:
+        entry = self._index.get((name.lower().replace('_', '-'), scale, color_mode))
+        if entry is None:
+            raise ValueError(f'flag not in pack: {name} at scale {scale} in {color_mode.value} colors')
+        return self._data[entry.offset:entry.offset + entry.size]
+
+def _decode_pack_index(data: mmap.mmap) -> list[PackEntry]:
+    import struct
+
+    magic, version, entry_count, index_size = struct.unpack_from(PACK_HEADER, data)
+    if magic != PACK_MAGIC or version != PACK_VERSION:
+        raise ValueError(f'unsupported magic or version: {magic!r} {version}')
+
+    data_size = len(data)
+    header_size = struct.calcsize(PACK_HEADER)
+    entry_size = struct.calcsize(PACK_ENTRY)
+    index_end = header_size + index_size
+    if index_end > data_size:
+        raise ValueError(f'index size out of range: {index_size}')
+
+    entries: list[PackEntry] = []
+    pos = header_size
+    for _ in range(entry_count):
+        offset, size, scale, mode_size, name_size = struct.unpack_from(PACK_ENTRY, data, pos)
+        pos += entry_size
+        mode_end = pos + mode_size
+        name_end = mode_end + name_size
+        if name_end > index_end or offset < index_end or offset + size > data_size:
+            raise ValueError(f'entry out of range at offset {pos - entry_size}')
+
+        color_mode = ColorMode(data[pos:mode_end].decode())
+        name = data[mode_end:name_end].decode()
+        entries.append(PackEntry(name, scale, color_mode, offset, size))
+        pos = name_end
+
+    return entries
+
+# Names and flags of everything that goes into a pack: all built-in flags and
+# aliases and the given flag files, named after the file without extension.
+def iter_pack_flags(flag_paths: Iterable[str] = (), cache_dir: Optional[str] = None) -> Iterator[tuple[str, Flag]]:
+    for registry in FLAGS, FLAG_ALIASES:
+        for name in registry:
+            yield name, registry[name]
+
+    for path in flag_paths:
+        name = os.path.splitext(os.path.basename(path))[0].lower().replace('_', '-')
+        yield name, load_flag_from_path(path, cache_dir)
+
+# Render server: a resident process that answers requests on a Unix socket
+# from warm caches, so clients don't pay for startup and rendering every time.
+# A request is one line of JSON:
+#
+#     {"flags": ["ally", {"flag": [...]}], "scale": 2, "width": 80,
+#      "color_mode": "truecolor", "optimize": false, "row_major": false,
+#      "fit_width": false, "wrap": "greedy"}
+#
+# Flags are built-in flag names or flag documents as in JSON files, all other
+# fields are optional. Scales (also those picked by fit_width) are limited to
+# MAX_REQUEST_SCALE, widths to MAX_REQUEST_WIDTH and the character cells of all
+# scaled flags together to MAX_REQUEST_CELLS, so a single request can't make
+# the server render arbitrarily big answers. The answer is a line "OK"
+# followed by the same output as the command line tool would write, or a line
+# "ERROR" followed by the error message.
+MAX_REQUEST_SIZE  = 16 * 1024 * 1024
+MAX_REQUEST_SCALE = 32
+MAX_REQUEST_WIDTH = 512
+MAX_REQUEST_CELLS = 2 * 1024 * 1024 # all built-in flags at MAX_REQUEST_SCALE
+
+class RenderRequest:
+    __slots__ = ('flags', 'scale', 'width', 'color_mode', 'optimize', 'row_major', 'fit_width', 'wrap')
+
+    flags: list[Flag]
+    scale: Union[int, FlagScale]
+    width: int
+    color_mode: ColorMode
+    optimize: bool
+    row_major: bool
+    fit_width: bool
+    wrap: WrapMode
+
+    def __init__(self, flags: list[Flag], scale: Union[int, FlagScale], width: int, color_mode: ColorMode, optimize: bool, row_major: bool, fit_width: bool, wrap: WrapMode) -> None:
+        self.flags      = flags
+        self.scale      = scale
+        self.width      = width
+        self.color_mode = color_mode
+        self.optimize   = optimize
+        self.row_major  = row_major
+        self.fit_width  = fit_width
+        self.wrap       = wrap
+
+def parse_render_request(data: Any) -> RenderRequest:
+    from argparse import ArgumentTypeError
+
+    if not isinstance(data, dict):
+        raise TypeError(f'expected mapping at root: {type(data).__name__}')
+
+    flags_data = data.get('flags')
+    if not isinstance(flags_data, list) or not flags_data:
+        raise TypeError('expected non-empty sequence at .flags')
+
+    flags: list[Flag] = []
+    for index, flag_data in enumerate(flags_data):
+        if flag_data == 'all':
+            flags.extend(FLAGS.values())
+        elif isinstance(flag_data, str):
+            flags.append(get_flag(flag_data))
+        elif isinstance(flag_data, dict):
+            flags.append(load_flag_from_json(flag_data))
+        else:
+            raise TypeError(f'expected flag name or flag at .flags[{index}]: {type(flag_data).__name__}')
+
+    try:
+        scale = parse_scale(str(data.get('scale', 1)))
+    except ArgumentTypeError as exc:
+        raise ValueError(f'illegal scale: {exc}') from exc
+
+    if max(scale if isinstance(scale, FlagScale) else (scale,)) > MAX_REQUEST_SCALE:
+        raise ValueError(f'illegal scale: must be <= {MAX_REQUEST_SCALE}: {data.get("scale")!r}')
+
+    width = data.get('width', 80)
+    if not isinstance(width, int) or isinstance(width, bool) or width < 1 or width > MAX_REQUEST_WIDTH:
+        raise ValueError(f'illegal width: must be between 1 and {MAX_REQUEST_WIDTH}: {width!r}')
+
+    fit_width = bool(data.get('fit_width', False))
+    cells = count_request_cells(flags, scale, width, fit_width)
+    if cells > MAX_REQUEST_CELLS:
+        raise ValueError(f'flags too big: {cells} character cells, must be <= {MAX_REQUEST_CELLS}')
+
+    return RenderRequest(
+        flags      = flags,
+        scale      = scale,
+        width      = width,
+        color_mode = ColorMode(data.get('color_mode', ColorMode.TrueColor.value)),
+        optimize   = bool(data.get('optimize', False)),
+        row_major  = bool(data.get('row_major', False)),
+        fit_width  = fit_width,
+        wrap       = WrapMode(data.get('wrap', WrapMode.Greedy.value)),
+    )
+
+# fit_scale() shrunk to MAX_REQUEST_SCALE (keeping the aspect ratio), so very
+# narrow flags aren't blown up to any size.
+def fit_request_scale(flag: FlagView, width: int, scale: Union[int, FlagScale] = 1) -> FlagScale:
+    scale_x, scale_y = fit_scale(flag, width, scale)
+    biggest = max(scale_x, scale_y)
+    if biggest > MAX_REQUEST_SCALE:
+        return FlagScale(scale_x * MAX_REQUEST_SCALE / biggest, scale_y * MAX_REQUEST_SCALE / biggest)
+    return FlagScale(scale_x, scale_y)
+
+# Character cells the flags of a request take up once they are scaled, counted
+# generously (partial cells are rounded up).
+def count_request_cells(flags: Sequence[FlagView], scale: Union[int, FlagScale], width: int, fit_width: bool) -> int:
+    total = 0
+    for flag in flags:
+        if fit_width:
+            scale_x, scale_y = fit_request_scale(flag, width, scale)
+        elif isinstance(scale, FlagScale):
+            scale_x, scale_y = scale
+        else:
+            scale_x = scale_y = scale
+        metrics = FLAG_METRICS.get(flag)
+        total += int(metrics.width * scale_x / 2 + 1) * int(metrics.height * scale_y + 1)
+    return total
+
+# Answers are kept in an LRU cache of up to maxsize entries and maxbytes
+# bytes. Answers bigger than an eighth of maxbytes are sent, but not kept.
+class FlagServer(_LRU):
+    maxbytes: int
+    renders: RenderCache
+    layouts: LayoutCache
+    _entries: OrderedDict[bytes, bytes]
+    _response_bytes: int
+
+    def __init__(self, maxsize: int = 256, maxbytes: int = 64 * 1024 * 1024) -> None:
+        super().__init__(maxsize)
+
+        if maxbytes < 1:
+            raise ValueError(f'illegal maxbytes: {maxbytes}')
+
+        self.maxbytes = maxbytes
+        self.renders  = RenderCache()
+        self.layouts  = LayoutCache()
+        self._response_bytes = 0
+
+    def clear(self) -> None:
+        super().clear()
+        self._response_bytes = 0
+
+    # Renders the built-in flags ahead of the first request.
+    def warm(self, scale: int = 1, color_mode: ColorMode = ColorMode.TrueColor) -> None:
+        for flag in FLAGS.values():
+            self.renders.render(flag, scale, 0, color_mode)
+            self.layouts.compile(flag, scale, scale)
+
+    async def iter_render(self, request: RenderRequest) -> AsyncIterator[str]:
+        import asyncio
+
+        scale = request.scale
+        flags: Sequence[Union[FlagView, CompiledFlag]] = request.flags
+        cache: Optional[RenderCache] = None
+        if request.fit_width or isinstance(scale, FlagScale) or request.row_major or request.optimize:
+            # compiled one at a time, giving other clients a turn in between
+            compiled: list[CompiledFlag] = []
+            for flag in request.flags:
+                if request.fit_width:
+                    scale_x, scale_y = fit_request_scale(flag, request.width, scale)
+                elif isinstance(scale, FlagScale):
+                    scale_x, scale_y = scale
+                else:
+                    scale_x = scale_y = scale
+                compiled.append(self.layouts.compile(flag, scale_x, scale_y))
+                await asyncio.sleep(0)
+            flags = compiled
+            scale = 1
+        else:
+            cache = self.renders
+
+        emitter = Emitter(optimize=request.optimize, color_mode=request.color_mode)
+
+        # The flags are all compiled or rendered before iter_render_flags()
+        # yields its first chunk (iter_render_flags() renders them one at a
+        # time too), so sending the escape sequence along with it means
+        # errors happen before anything is yielded.
+        # CSI ? 25 l     Hide cursor
+        head = "\x1B[?25l"
+        async for chunk in iter_render_flags(flags, scale, cache, request.row_major, request.width, emitter, wrap=request.wrap):
+            yield head + chunk
+            head = ''
+        # CSI ? 25 h     Show cursor
+        yield head + "\x1B[?25h\n\n"
+
+    def _put(self, line: bytes, response: bytes) -> None:
+        responses = self._entries
+        old = responses.pop(line, None)
+        if old is not None:
+            self._response_bytes -= len(old)
+
+        responses[line] = response
+        self._response_bytes += len(response)
+        while len(responses) > self.maxsize or self._response_bytes > self.maxbytes:
+            _, old = responses.popitem(last=False)
+            self._response_bytes -= len(old)
+
+    async def handle(self, reader: Any, writer: Any) -> None:
+        import asyncio
+        import json
+
+        try:
+            try:
+                line = (await reader.readuntil(b'\n')).strip()
+            except asyncio.LimitOverrunError:
+                writer.write(f'ERROR\nrequest longer than {MAX_REQUEST_SIZE} bytes'.encode())
+                return
+
+            response = self._get(line)
+            if response is not None:
+                writer.write(b'OK\n' + response)
+                return
+
+            # the first chunk is only yielded once all flags could be compiled
+            try:
+                chunks = self.iter_render(parse_render_request(json.loads(line)))
+                first = await chunks.__anext__()
+            except (ValueError, TypeError) as exc:
+                writer.write(f'ERROR\n{exc}'.encode())
+                return
+
+            # answers too big to be kept aren't collected
+            max_response = self.maxbytes >> 3
+            data = first.encode()
+            size = len(data)
+            parts: Optional[list[bytes]] = [data] if size <= max_response else None
+            writer.write(b'OK\n' + data)
+            async for chunk in chunks:
+                data = chunk.encode()
+                size += len(data)
+                if parts is not None:
+                    if size <= max_response:
+                        parts.append(data)
+                    else:
+                        parts = None
+                writer.write(data)
+                await writer.drain()
+
+            if parts is not None:
+                self._put(line, b''.join(parts))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # the client went away
+            pass
+        finally:
+            try:
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+# Runs until interrupted with Ctrl+C or SIGTERM.
+def serve(path: str, server: Optional[FlagServer] = None) -> None:
+    import asyncio
+    import signal
+    import stat
+
+    if server is None:
+        server = FlagServer()
+
+    # a socket left behind by a server that wasn't shut down cleanly
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+    async def run() -> None:
+        stop = asyncio.Event()
+        if hasattr(signal, 'SIGTERM'):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+
+        unix_server = await asyncio.start_unix_server(server.handle, path, limit=MAX_REQUEST_SIZE)
+        async with unix_server:
+            await stop.wait()
 
-    return scale
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+# Sends a render request to a server started with serve() and writes the
+# answer to out.
+def request_render(path: str, request: dict[str, Any], out: Union[IO[bytes], bytearray]) -> None:
+    import json
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode() + b'\n')
+
+        with sock.makefile('rb') as fp:
+            status = fp.readline()
+            if status == b'ERROR\n':
+                raise ValueError(fp.read().decode())
+            elif status != b'OK\n':
+                raise ValueError(f'unexpected answer from {path}: {status!r}')
+
+            write = out.extend if isinstance(out, bytearray) else out.write
+            while data := fp.read1(64 * 1024):
+                write(data)
+
+def connect(path: str, args: Any) -> None:
+    import json
+
+    flags_data: list[Any] = []
+    for flag_name in args.flags:
+        if is_ppm_path(flag_name):
+            raise ValueError(f'PPM images are not supported by the server: {flag_name}')
+        elif '/' in flag_name or '\\' in flag_name or '.' in flag_name:
+            with open(flag_name, 'rb') as fp:
+                flags_data.append(json.load(fp))
+        else:
+            flags_data.append(flag_name)
+
+    scale = args.scale
+    try:
+        columns = get_terminal_size().columns
+    except OSError:
+        columns = 80
+
+    request = {
+        'flags':      flags_data,
+        'scale':      f'{scale.x}x{scale.y}' if isinstance(scale, FlagScale) else scale,
+        'width':      columns or 80,
+        'color_mode': args.color_mode.value,
+        'optimize':   args.optimize,
+        'row_major':  args.row_major,
+        'fit_width':  args.fit_width,
+        'wrap':       args.wrap.value,
+    }
+
+    sys.stdout.flush()
+    request_render(path, request, sys.stdout.buffer)
+    sys.stdout.buffer.flush()
 
 def main() -> None:
+    from argparse import ArgumentParser
+
     ap = ArgumentParser()
-    ap.add_argument('-s', '--scale', type=parse_scale, default=1)
+    ap.add_argument('-s', '--scale', type=parse_scale, default=1, help="Integer, fractional (e.g. 2.5) or WIDTHxHEIGHT (e.g. 3x2) scale. Default: 1")
+    ap.add_argument('--fit-width', action='store_true', default=False, help="Scale every flag to the width of the terminal, keeping the aspect ratio of --scale.")
     ap.add_argument('-l', '--list', action='store_true', default=False, help="List built-in flags.")
+    ap.add_argument('--row-major', action='store_true', default=False, help="Draw flags next to each other row by row with plain newlines instead of moving the cursor around.")
+    ap.add_argument('--wrap', type=WrapMode, default=WrapMode.Greedy, choices=list(WrapMode), metavar='{greedy,balanced,packed}', help="How flags are split into rows: fill rows in order (greedy), keep the order but use the fewest lines (balanced) or also reorder flags by height to use even fewer lines (packed). Default: greedy")
+    ap.add_argument('-O', '--optimize', action='store_true', default=False, help="Keep track of the terminal colors across lines and flags to emit fewer and shorter color escape sequences.")
+    ap.add_argument('-c', '--color-mode', type=ColorMode, default=ColorMode.TrueColor, choices=list(ColorMode), metavar='{truecolor,256,16}', help="Colors to use. Default: truecolor")
+    ap.add_argument('--stream', action='store_true', default=False, help="Write the output row by row instead of all at once at the end.")
+    ap.add_argument('--raster', action='store_true', default=False, help="Draw flags from a pixel raster with sextant characters instead of from their line caps. Flags given as PPM images are always drawn this way.")
+    ap.add_argument('--watch', action='store_true', default=False, help="Keep the flags on screen and draw them again whenever the terminal is resized. Quit with Ctrl+C.")
+    ap.add_argument('--animate', type=Animation, default=None, choices=list(Animation), metavar='{wave,scroll}', help="Animate the flags until Ctrl+C is pressed.")
+    ap.add_argument('--fps', type=float, default=30, help="Frame rate of --animate. Default: 30")
+    ap.add_argument('-j', '--jobs', type=int, default=1, help="Scale and render big flag lists in this many processes, 0 for one per CPU. Default: 1")
+    ap.add_argument('--serve', metavar='SOCKET', default=None, help="Keep running and render flags for clients connecting to this Unix socket.")
+    ap.add_argument('--connect', metavar='SOCKET', default=None, help="Let the server listening on this Unix socket render the flags.")
+    ap.add_argument('--export-pack', metavar='PATH', default=None, help="Render all built-in flags and the given flag files into an asset pack at every --pack-scales and --pack-color-modes.")
+    ap.add_argument('--pack-scales', type=parse_scale_list, default=None, metavar='SCALES', help="Comma separated integer scales for --export-pack. Default: --scale")
+    ap.add_argument('--pack-color-modes', type=parse_color_mode_list, default=None, metavar='MODES', help="Comma separated color modes for --export-pack. Default: --color-mode")
+    ap.add_argument('--pack', metavar='PATH', default=None, help="Write the given flags as they are pre-rendered in this asset pack. With --list list the pack's entries.")
+    ap.add_argument('--profile', action='store_true', default=False, help="Print the time spent in every stage and what was compiled and written per flag to stderr.")
+    ap.add_argument('--profile-json', action='store_true', default=False, help="Like --profile, but print it as JSON.")
+    ap.add_argument('--cache-dir', default=os.environ.get('TERM_FLAGS_CACHE_DIR') or None, help="Keep validated binary copies of flags loaded from JSON files in this directory. Default: $TERM_FLAGS_CACHE_DIR")
     ap.add_argument('flags', nargs='*')
 
     args = ap.parse_args()
 
+    if args.pack is not None:
+        if not isinstance(args.scale, int):
+            ap.error('--pack only supports integer scales')
+
+        try:
+            with FlagPack(args.pack) as pack:
+                if args.list:
+                    for entry in pack.entries:
+                        print(f'{entry.name} {entry.scale} {entry.color_mode.value} {entry.offset} {entry.size}')
+                    return
+
+                data = [pack.get(flag_name, args.scale, args.color_mode) for flag_name in args.flags]
+        except (OSError, ValueError) as exc:
+            ap.error(str(exc))
+
+        for item in data:
+            sys.stdout.buffer.write(item)
+        sys.stdout.buffer.flush()
+        return
+
     if args.list:
         print('all')
         for flag_name in sorted(FLAGS):
             print(flag_name)
         return
 
-    scale: int = args.scale
+    if args.export_pack is not None:
+        if not isinstance(args.scale, int):
+            ap.error('--export-pack only supports integer scales')
+
+        if any(is_ppm_path(flag_name) for flag_name in args.flags):
+            ap.error('PPM images can not be put into an asset pack')
+
+        # built-in flags are always included, only flag files are added
+        flag_paths: list[str] = []
+        try:
+            for flag_name in args.flags:
+                if '/' in flag_name or '\\' in flag_name or '.' in flag_name:
+                    flag_paths.append(flag_name)
+                elif flag_name != 'all':
+                    get_flag(flag_name)
+
+            entries = write_flag_pack(
+                args.export_pack,
+                iter_pack_flags(flag_paths, args.cache_dir),
+                args.pack_scales or [args.scale],
+                args.pack_color_modes or [args.color_mode],
+                args.optimize)
+        except (OSError, ValueError) as exc:
+            ap.error(str(exc))
+
+        print(f'{len(entries)} entries written to {args.export_pack}', file=sys.stderr)
+        return
+
+    if args.serve is not None:
+        server = FlagServer()
+        if isinstance(args.scale, int):
+            server.warm(args.scale, args.color_mode)
+        serve(args.serve, server)
+        return
+
+    if args.connect is not None:
+        connect(args.connect, args)
+        return
+
+    flag_scale: Union[int, FlagScale] = args.scale
     flag_names: list[str] = args.flags
+    raster = args.raster or any(is_ppm_path(flag_name) for flag_name in flag_names)
+    stretch = args.fit_width or isinstance(flag_scale, FlagScale)
+
+    if raster and stretch:
+        ap.error('--raster and PPM images only support integer scales')
+
+    if args.watch and not can_watch():
+        ap.error('--watch is not supported on this platform')
+
+    if args.watch and args.animate is not None:
+        ap.error('--watch and --animate can not be combined')
+
+    if args.fps <= 0:
+        ap.error(f'illegal frame rate: {args.fps}')
+
+    if args.jobs < 0:
+        ap.error(f'illegal number of jobs: {args.jobs}')
+
+    if (args.profile or args.profile_json) and (args.watch or args.animate is not None):
+        ap.error('--profile can not be combined with --watch or --animate')
+
+    jobs: int = args.jobs or os.cpu_count() or 1
+
+    profiler: Optional[Profiler] = None
+    if args.profile or args.profile_json:
+        profiler = Profiler()
+        set_profiler(profiler)
+        profiler.enter('load')
+
+    scale = 1
+    cache: Optional[RenderCache] = None
+    layouts = LayoutCache()
+    flags: Sequence[Union[FlagView, CompiledFlag]] = []
+    source_flags: list[Flag] = []
+
+    # raster flags with other scales were rejected above
+    if raster and isinstance(flag_scale, int):
+        flags = resolve_compiled_flags(flag_names, flag_scale, args.raster, args.cache_dir)
+    elif args.fit_width:
+        source_flags = resolve_flags(flag_names, args.cache_dir)
+    elif isinstance(flag_scale, FlagScale):
+        source_flags = resolve_flags(flag_names, args.cache_dir)
+        if profiler is not None:
+            profiler.enter('scale')
+        flags = [layouts.compile(flag, flag_scale.x, flag_scale.y) for flag in source_flags]
+    else:
+        scale = flag_scale
+        flags = resolve_flags(flag_names, args.cache_dir)
+
+        # compile or render everything once, only the layout changes on resize
+        if args.watch:
+            if args.row_major or args.optimize:
+                flags = [compile_flag(ScaledFlag(flag, scale) if scale != 1 else flag) for flag in flags]
+                scale = 1
+            else:
+                cache = RenderCache()
 
-    flags: list[Flag] = []
-    for flag_name in flag_names:
-        if flag_name == 'all':
-            flags.extend(FLAGS.values())
-        elif '/' in flag_name or '\\' in flag_name or '.' in flag_name:
-            flags.append(load_flag_from_path(flag_name))
-        else:
-            norm_flag_name = flag_name.lower().replace('_', '-')
-            try:
-                flags.append(FLAGS.get(norm_flag_name) or FLAG_ALIASES[norm_flag_name])
-            except KeyError as exc:
-                raise ValueError(f'unknown flag name: {flag_name}') from exc
+    def get_flags(columns: int) -> Sequence[Union[FlagView, CompiledFlag]]:
+        if args.fit_width:
+            return [layouts.compile(flag, *fit_scale(flag, columns, flag_scale)) for flag in source_flags]
+        return flags
 
-    buf: list[str] = []
+    if args.watch:
+        def render(columns: int) -> str:
+            buf: list[str] = []
+            emitter = Emitter(optimize=args.optimize, color_mode=args.color_mode)
+            draw_wrapped_flag_list(buf, get_flags(columns), scale, cache, args.row_major, columns, emitter, wrap=args.wrap)
+            return ''.join(buf)
 
-    # CSI ?  7 l     No Auto-Wrap Mode (DECAWM), VT100.
-    buf.append("\x1B[?25l")
+        watch(sys.stdout, render)
+        return
 
-    draw_wrapped_flag_list(buf, flags, scale)
+    try:
+        columns, lines = get_terminal_size()
+    except OSError:
+        columns, lines = 80, 24
 
-    # CSI ?  7 h     Auto-Wrap Mode (DECAWM), VT100
-    buf.append("\x1B[?25h\n")
+    if profiler is not None and args.fit_width:
+        profiler.enter('scale')
+
+    flags = get_flags(columns)
+
+    if args.animate is not None:
+        frames = animate_flags(flags, args.animate, columns or 80, scale, args.color_mode, layouts, args.wrap)
+        emitter = Emitter(optimize=args.optimize, color_mode=args.color_mode)
+        shown, dropped = play(sys.stdout, frames, args.fps, lines or None, emitter)
+        print(f'{shown} frames shown, {dropped} dropped', file=sys.stderr)
+        return
+    emitter = Emitter(optimize=args.optimize, color_mode=args.color_mode)
 
-    print(''.join(buf))
+    if args.stream:
+        sink = StreamSink(sys.stdout)
+        out: Sink = sink if profiler is None else profiler.sink(sink)
+
+        # CSI ?  7 l     No Auto-Wrap Mode (DECAWM), VT100.
+        out.append("\x1B[?25l")
+
+        try:
+            for _ in iter_draw_wrapped_flag_list(out, flags, scale, row_major=args.row_major, emitter=emitter, jobs=jobs, wrap=args.wrap):
+                sink.flush()
+        finally:
+            emitter.finish(out.append)
+
+            # CSI ?  7 h     Auto-Wrap Mode (DECAWM), VT100
+            out.append("\x1B[?25h\n\n")
+            sink.flush()
+    else:
+        out_data = BytesSink()
+        out = out_data if profiler is None else profiler.sink(out_data)
+
+        # CSI ?  7 l     No Auto-Wrap Mode (DECAWM), VT100.
+        out.append("\x1B[?25l")
+
+        draw_wrapped_flag_list(out, flags, scale, row_major=args.row_major, emitter=emitter, jobs=jobs, wrap=args.wrap)
+
+        # CSI ?  7 h     Auto-Wrap Mode (DECAWM), VT100
+        out.append("\x1B[?25h\n\n")
+        out_data.flush()
+
+        if profiler is not None:
+            profiler.enter('write')
+
+        write_utf8(sys.stdout, out_data.data)
+
+    if profiler is not None:
+        sys.stdout.flush()
+        profiler.leave()
+        set_profiler(None)
+
+        flag_labels = [name for flag_name in flag_names for name in (FLAGS if flag_name == 'all' else [flag_name])]
+        if args.profile_json:
+            import json
+            json.dump(profiler.as_dict(flag_labels), sys.stderr, indent=2)
+            sys.stderr.write('\n')
+        else:
+            profiler.write_report(sys.stderr, flag_labels)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,36 @@
+import pytest
+
+import term_flags
+from term_flags import ScaleBackend, PackedFlag
+
+pytest.importorskip('numpy')
+
+MAX_SCALE = 64
+
+def builtin_flags() -> list[tuple[str, term_flags.Flag]]:
+    flags: list[tuple[str, term_flags.Flag]] = []
+    seen: set[int] = set()
+    for flags_dict in (term_flags.FLAGS, term_flags.FLAG_ALIASES):
+        for name, flag in flags_dict.items():
+            # aliases of the same flag are only checked once
+            if id(flag) not in seen:
+                seen.add(id(flag))
+                flags.append((name, flag))
+    return flags
+
+@pytest.mark.parametrize('name,flag', builtin_flags(), ids=lambda value: value if isinstance(value, str) else '')
+def test_numpy_scaling_matches_python(name: str, flag: term_flags.Flag) -> None:
+    packed = PackedFlag.from_flag(flag)
+    for scale in range(1, MAX_SCALE + 1):
+        expected = term_flags.scale_flag(flag, scale, ScaleBackend.Python)
+        assert term_flags.scale_flag(flag, scale, ScaleBackend.NumPy) == expected, f'{name} at scale {scale}'
+        assert term_flags.scale_flag(packed, scale, ScaleBackend.NumPy).to_flag() == expected, f'{name} (packed) at scale {scale}'
+
+def test_numpy_scaling_of_empty_lines() -> None:
+    flag: term_flags.Flag = [[], [term_flags.LineSegment((1, 2, 3), 5, term_flags.LineCap.Square)], []]
+    for scale in range(1, 5):
+        assert term_flags.scale_flag(flag, scale, ScaleBackend.NumPy) == term_flags.scale_flag(flag, scale, ScaleBackend.Python)
+
+def test_illegal_scale() -> None:
+    with pytest.raises(ValueError):
+        term_flags.scale_flag(term_flags.FLAGS['ally'], 0, ScaleBackend.NumPy)